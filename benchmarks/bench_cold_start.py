@@ -0,0 +1,73 @@
+"""
+Benchmark of cli cold start: time of "--help" and of arguments parsing without network requests,
+which every short CI invocation pays before any work is done. Fails if median time exceeds the budget
+or if http stack is imported before scan is started.
+
+    python benchmarks/bench_cold_start.py --runs 20 --budget 150
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+HEAVY_MODULES = ('requests', 'urllib3', 'stingray_cli_core')
+
+COMMANDS = {
+    'help': ['--help'],
+    'file help': ['--distribution_system', 'file', '--help'],
+    'appcenter help': ['--distribution_system', 'appcenter', '--help'],
+    'invalid arguments': ['--distribution_system', 'hockeyapp', '--stingray_url', 'http://localhost', '--company_id', '1',
+                          '--architecture_id', '1', '--token', 'token', '--profile_id', '1'],
+}
+
+
+def run(python_arguments):
+    env = {**os.environ, 'PYTHONPATH': ROOT}
+    started_at = time.perf_counter()
+    process = subprocess.run([sys.executable, *python_arguments],
+                             env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    return time.perf_counter() - started_at, process.stderr
+
+
+def run_cli(arguments, python_options=()):
+    return run([*python_options, '-m', 'stingray_cli.run_stingray_scan', *arguments])
+
+
+def imported_modules(arguments):
+    """
+    Top level packages imported by cli, found with "python -X importtime"
+    """
+    _, stderr = run_cli(arguments, ('-X', 'importtime'))
+    modules = set()
+    for line in stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            modules.add(line.rsplit('|', 1)[1].strip().split('.')[0])
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of cli cold start')
+    parser.add_argument('--runs', type=int, help='Count of runs of every command', default=20)
+    parser.add_argument('--budget', type=float, help='Maximum median time of command in milliseconds', default=150)
+    arguments = parser.parse_args()
+
+    baseline = statistics.median(run(['-c', 'pass'])[0] for _ in range(arguments.runs)) * 1000
+    print(f'python interpreter start: {baseline:.1f} ms')
+
+    failed = False
+    print(f'{"command":>20} {"median ms":>10} {"max ms":>8} {"heavy imports":>14}')
+    for name, command in COMMANDS.items():
+        times = [run_cli(command)[0] * 1000 for _ in range(arguments.runs)]
+        heavy = sorted(set(HEAVY_MODULES) & imported_modules(command))
+        median = statistics.median(times)
+        failed |= median > arguments.budget or bool(heavy)
+        print(f'{name:>20} {median:>10.1f} {max(times):>8.1f} {", ".join(heavy) or "none":>14}')
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
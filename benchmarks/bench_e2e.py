@@ -0,0 +1,189 @@
+"""
+End-to-end benchmark of cli against local stand-ins of Stingray, AppCenter and HockeyApp (see mock_servers.py).
+Every scenario is run in a separate process with empty cache, wall time and peak RSS of the process are measured,
+count of requests and bytes transferred are taken from the stand-ins.
+Results can be saved and compared with the previous ones to catch regressions before release.
+
+    python benchmarks/bench_e2e.py --apk_size 32 --latency 0.02 --save results.json
+    python benchmarks/bench_e2e.py --apk_size 32 --latency 0.02 --baseline results.json --tolerance 20
+    python benchmarks/bench_e2e.py --state_timings 10 10 30 --events
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_servers import start_servers  # noqa: E402
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+SCENARIOS = ('file', 'appcenter', 'hockeyapp', 'batch')
+COMPARED = ('wall', 'rss', 'requests', 'bytes_sent', 'bytes_received')
+
+
+def scan_arguments(stingray):
+    arguments = {'stingray_url': stingray.url, 'company_id': 1, 'architecture_id': 1, 'token': 'token',
+                 'profile_id': 1, 'testcase_id': 1}
+    if stingray.webhook:
+        arguments['event_listen'] = stingray.webhook.split('/')[2]
+    return arguments
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def job(scenario, number, appcenter, hockeyapp, apk_path, download_segments):
+    """
+    Arguments of scan getting application from distribution system of the scenario
+    """
+    if scenario == 'file':
+        return {'distribution_system': 'file', 'file_path': apk_path}
+    if scenario == 'appcenter':
+        return {'distribution_system': 'appcenter', 'appcenter_url': appcenter.api_url, 'appcenter_token': 'token',
+                'appcenter_owner_name': 'owner', 'appcenter_app_name': f'app{number}',
+                'appcenter_app_version': str(number), 'download_segments': download_segments}
+    return {'distribution_system': 'hockeyapp', 'hockey_url': hockeyapp.api_url, 'hockey_token': 'token',
+            'hockey_bundle_id': f'com.example.app{number}', 'hockey_version': str(number),
+            'download_segments': download_segments}
+
+
+def to_argv(arguments):
+    argv = []
+    for key, value in arguments.items():
+        argv += [f'--{key}', str(value)]
+    return argv
+
+
+def command(scenario, servers, directory, arguments):
+    stingray, appcenter, hockeyapp = servers
+    apk_path = os.path.join(directory, 'app.apk')
+    if not os.path.exists(apk_path):
+        with open(apk_path, 'wb') as fp:
+            fp.write(appcenter.apk)
+
+    cli = [sys.executable, '-m', 'stingray_cli.run_stingray_scan']
+    if scenario != 'batch':
+        return cli + to_argv({**job(scenario, 1, appcenter, hockeyapp, apk_path, arguments.download_segments),
+                              **scan_arguments(stingray)})
+
+    distribution_systems = SCENARIOS[:3]
+    manifest = {'defaults': scan_arguments(stingray),
+                'jobs': [{'name': f'job{number}',
+                          **job(distribution_systems[number % 3], number + 1, appcenter, hockeyapp, apk_path,
+                                arguments.download_segments)}
+                         for number in range(arguments.batch_jobs)]}
+    manifest_path = os.path.join(directory, 'manifest.json')
+    with open(manifest_path, 'w') as fp:
+        json.dump(manifest, fp)
+    return cli + ['batch', '--manifest', manifest_path, '--workers', str(arguments.batch_workers)]
+
+
+def run(scenario, servers, arguments):
+    """
+    Run scenario in new process with empty cache
+    :return: dict with measurements
+    """
+    for server in servers:
+        server.reset_stats()
+    # every run listens for scan state events on new port, so events of previous run are not received
+    servers[0].webhook = f'http://127.0.0.1:{free_port()}/events' if arguments.events else None
+
+    with tempfile.TemporaryDirectory() as directory:
+        env = {**os.environ, 'PYTHONPATH': ROOT, 'XDG_CACHE_HOME': os.path.join(directory, 'cache')}
+        output = None if arguments.verbose else subprocess.DEVNULL
+        started_at = time.monotonic()
+        process = subprocess.Popen(command(scenario, servers, directory, arguments), cwd=directory, env=env,
+                                   stdout=output, stderr=output)
+        _, status, usage = os.wait4(process.pid, 0)
+        wall = time.monotonic() - started_at
+        process.returncode = os.waitstatus_to_exitcode(status)
+
+    return {'exit_code': process.returncode,
+            'wall': round(wall, 3),
+            # ru_maxrss is in kilobytes on Linux
+            'rss': usage.ru_maxrss * 1024,
+            'requests': sum(server.stats['requests'] for server in servers),
+            'bytes_sent': sum(server.stats['bytes_sent'] for server in servers),
+            'bytes_received': sum(server.stats['bytes_received'] for server in servers),
+            'endpoints': {f'{server.__class__.__name__} {endpoint}': count
+                          for server in servers for endpoint, count in server.stats['endpoints'].items()}}
+
+
+def median_result(results):
+    result = dict(results[-1])
+    for key in COMPARED:
+        result[key] = statistics.median(result[key] for result in results)
+    result['exit_code'] = max(result['exit_code'] for result in results)
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """
+    :return: list of regressions, measurements exceeding baseline more than tolerance percents
+    """
+    regressions = []
+    for scenario, result in results.items():
+        for key in COMPARED:
+            previous = baseline.get(scenario, {}).get(key)
+            if previous and result[key] > previous * (1 + tolerance / 100):
+                regressions.append(f'{scenario} {key}: {result[key]} > {previous} (+{tolerance}%)')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end benchmark of cli against local stand-ins')
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, help='Scenarios to run', default=list(SCENARIOS))
+    parser.add_argument('--runs', type=int, help='Count of runs of every scenario, median is reported', default=3)
+    parser.add_argument('--apk_size', type=int, help='Size of application file in megabytes', default=32)
+    parser.add_argument('--report_size', type=int, help='Size of PDF report in kilobytes', default=1024)
+    parser.add_argument('--latency', type=float, help='Seconds added to every response of stand-ins', default=0.0)
+    parser.add_argument('--state_timings', type=float, nargs=3, help='Seconds of STARTING, STARTED and ANALYZING states', default=[0.5, 0.5, 0.5])
+    parser.add_argument('--download_segments', type=int, help='Count of parallel connections to download application', default=1)
+    parser.add_argument('--batch_jobs', type=int, help='Count of jobs in batch scenario', default=12)
+    parser.add_argument('--batch_workers', type=int, help='Count of workers in batch scenario', default=8)
+    parser.add_argument('--events', action='store_true', help='Wait for scans end by events posted by Stingray stand-in instead of polling')
+    parser.add_argument('--server_rate_limit', type=int, help='Requests per second accepted by Stingray stand-in, 0 to disable limit', default=0)
+    parser.add_argument('--save', type=str, help='Save results to json file')
+    parser.add_argument('--baseline', type=str, help='Compare results with json file saved by previous run')
+    parser.add_argument('--tolerance', type=float, help='Allowed regression against baseline in percents', default=20)
+    parser.add_argument('--verbose', action='store_true', help='Show output of cli')
+    arguments = parser.parse_args()
+
+    servers = start_servers(arguments.latency, arguments.state_timings, arguments.apk_size * 1024 * 1024,
+                            arguments.report_size * 1024, arguments.server_rate_limit)
+
+    results = {}
+    for scenario in arguments.scenarios:
+        results[scenario] = median_result([run(scenario, servers, arguments) for _ in range(arguments.runs)])
+
+    print(f'{"scenario":>10} {"exit":>5} {"wall s":>8} {"rss MB":>8} {"requests":>9} {"sent MB":>8} {"recv MB":>8}')
+    for scenario, result in results.items():
+        print(f'{scenario:>10} {result["exit_code"]:>5} {result["wall"]:>8.2f} {result["rss"] / 2 ** 20:>8.1f} '
+              f'{result["requests"]:>9} {result["bytes_sent"] / 2 ** 20:>8.1f} {result["bytes_received"] / 2 ** 20:>8.1f}')
+
+    if arguments.save:
+        with open(arguments.save, 'w') as fp:
+            json.dump(results, fp, indent=4)
+
+    failed = any(result['exit_code'] for result in results.values())
+    if arguments.baseline:
+        with open(arguments.baseline) as fp:
+            regressions = compare(results, json.load(fp), arguments.tolerance)
+        for regression in regressions:
+            print(f'Regression: {regression}')
+        failed |= bool(regressions)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Benchmark of single stream and segmented download against local HTTP server
+limiting throughput of every connection, like CDN behind AppCenter download url.
+
+    python benchmarks/bench_segmented_download.py --size 64 --rate 16 --segments 1 2 4 8
+"""
+import os
+import re
+import sys
+import time
+import hashlib
+import argparse
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from stingray_cli.helpers.download import download_file, download_file_segmented  # noqa: E402
+
+
+def make_handler(data, rate, ranges):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            start, end = 0, len(data) - 1
+            match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+            if ranges and match:
+                start = int(match.group(1))
+                end = int(match.group(2)) if match.group(2) else end
+                self.send_response(206)
+                self.send_header('Content-Range', f'bytes {start}-{end}/{len(data)}')
+            else:
+                self.send_response(200)
+            if ranges:
+                self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('Content-Length', str(end - start + 1))
+            self.end_headers()
+
+            block = max(rate // 20, 1)
+            position = start
+            try:
+                while position <= end:
+                    self.wfile.write(data[position:min(position + block, end + 1)])
+                    position += block
+                    time.sleep(block / rate)
+            except (BrokenPipeError, ConnectionResetError):
+                # client closed probe request without reading the body
+                pass
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def run(url, segments, directory):
+    path = os.path.join(directory, f'app-{segments}.apk')
+    started_at = time.monotonic()
+    if segments > 1:
+        _, sha256 = download_file_segmented(url, path, segments)
+    else:
+        _, sha256 = download_file(url, path)
+    elapsed = time.monotonic() - started_at
+    os.remove(path)
+    return elapsed, sha256
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of segmented download')
+    parser.add_argument('--size', type=int, help='Size of file in megabytes', default=64)
+    parser.add_argument('--rate', type=int, help='Throughput limit of one connection in megabytes per second', default=16)
+    parser.add_argument('--segments', type=int, nargs='+', help='Count of segments to benchmark', default=[1, 2, 4, 8])
+    parser.add_argument('--no_ranges', action='store_true', help='Server ignores Range header')
+    arguments = parser.parse_args()
+
+    data = os.urandom(arguments.size * 1024 * 1024)
+    expected_sha256 = hashlib.sha256(data).hexdigest()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(data, arguments.rate * 1024 * 1024, not arguments.no_ranges))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_port}/app.apk'
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for segments in arguments.segments:
+            elapsed, sha256 = run(url, segments, directory)
+            results.append((segments, elapsed, sha256 == expected_sha256))
+    server.shutdown()
+
+    print(f'{"segments":>8} {"seconds":>8} {"MB/s":>8} {"sha256":>8}')
+    for segments, elapsed, valid in results:
+        print(f'{segments:>8} {elapsed:>8.2f} {arguments.size / elapsed:>8.1f} {"ok" if valid else "FAILED":>8}')
+
+    sys.exit(0 if all(valid for _, _, valid in results) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,394 @@
+"""
+Local stand-ins for Stingray REST API and AppCenter and HockeyApp APIs used by benchmarks.
+Every server adds configurable latency to each response and counts requests and transferred bytes.
+Scan state changes by timer after scan is started, applications are served with Range support.
+Stingray can answer requests exceeding rate limit with 429 and Retry-After like loaded server does
+and post scan state events to webhook.
+
+    python benchmarks/mock_servers.py --apk_size 32 --latency 0.05 --state_timings 2 2 5
+"""
+import io
+import re
+import sys
+import json
+import time
+import random
+import struct
+import zipfile
+import argparse
+import threading
+import urllib.request
+from urllib.parse import urlsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CREATED, STARTING, STARTED, ANALYZING, SUCCESS = range(5)
+
+
+def make_manifest(package, version_code, version_name):
+    """
+    Minimal binary AndroidManifest.xml with package, versionCode and versionName attributes of manifest element
+    """
+    strings = ['versionCode', 'versionName', 'package', 'manifest', version_name, package]
+    offsets, data = [], b''
+    for string in strings:
+        offsets.append(len(data))
+        data += struct.pack('<H', len(string)) + string.encode('utf-16-le') + b'\0\0'
+    data += b'\0' * (-len(data) % 4)
+    strings_start = 28 + 4 * len(strings)
+    string_pool = struct.pack('<HHIIIIII', 0x0001, 28, strings_start + len(data), len(strings), 0, 0, strings_start, 0) + \
+        struct.pack(f'<{len(strings)}I', *offsets) + data
+    resource_map = struct.pack('<HHIII', 0x0180, 8, 16, 0x0101021b, 0x0101021c)
+    attributes = struct.pack('<IIIHBBI', 0xFFFFFFFF, 0, 0xFFFFFFFF, 8, 0, 0x10, version_code) + \
+        struct.pack('<IIIHBBI', 0xFFFFFFFF, 1, 4, 8, 0, 0x03, 4) + \
+        struct.pack('<IIIHBBI', 0xFFFFFFFF, 2, 5, 8, 0, 0x03, 5)
+    element = struct.pack('<IIHHHHHH', 0xFFFFFFFF, 3, 20, 20, 3, 0, 0, 0) + attributes
+    element = struct.pack('<HHIII', 0x0102, 16, 16 + len(element), 1, 0xFFFFFFFF) + element
+    body = string_pool + resource_map + element
+    return struct.pack('<HHI', 0x0003, 8, 8 + len(body)) + body
+
+
+def make_apk(size, package='com.example.app', version_code=1, version_name='1.0'):
+    """
+    Valid apk of about size bytes: binary manifest and uncompressed classes.dex of random bytes
+    """
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('AndroidManifest.xml', make_manifest(package, version_code, version_name), zipfile.ZIP_DEFLATED)
+        archive.writestr('classes.dex', random.randbytes(max(size - 1024, 0)))
+    return buffer.getvalue()
+
+
+class MockServer(ThreadingHTTPServer):
+    """
+    Threading http server with statistics of requests. Routes are (method, regex, handler name) tuples
+    """
+    daemon_threads = True
+    routes = []
+
+    def __init__(self, port=0, latency=0.0, rate_limit=0):
+        super().__init__(('127.0.0.1', port), MockHandler)
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.window = (0, 0)
+        self.lock = threading.Lock()
+        self.reset_stats()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_port}'
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats = {'requests': 0, 'bytes_received': 0, 'bytes_sent': 0, 'endpoints': {}, 'events': 0}
+
+    def throttled(self):
+        """
+        Count request in current second
+        :return: True if request exceeds rate limit and should be answered with 429
+        """
+        if not self.rate_limit:
+            return False
+        with self.lock:
+            second, count = self.window
+            now = int(time.time())
+            self.window = (now, count + 1 if now == second else 1)
+            return self.window[1] > self.rate_limit
+
+    def count(self, endpoint, received=0, sent=0):
+        with self.lock:
+            self.stats['requests'] += int(endpoint is not None)
+            self.stats['bytes_received'] += received
+            self.stats['bytes_sent'] += sent
+            if endpoint is not None:
+                self.stats['endpoints'][endpoint] = self.stats['endpoints'].get(endpoint, 0) + 1
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.route('GET')
+
+    def do_POST(self):
+        self.route('POST')
+
+    def route(self, method):
+        path = urlsplit(self.path).path
+        for route_method, pattern, name in self.server.routes:
+            match = re.fullmatch(pattern, path)
+            if route_method == method and match:
+                body = self.read_body()
+                if self.server.throttled():
+                    self.server.count(f'{method} throttled', received=len(body))
+                    return self.send_json(429, {'detail': 'Too many requests'}, headers={'Retry-After': '1'})
+                self.server.count(f'{method} {name}', received=len(body))
+                time.sleep(self.server.latency)
+                return getattr(self.server, name)(self, body, *match.groups())
+
+        self.read_body()
+        self.server.count(f'{method} unknown')
+        self.send_json(404, {'detail': 'Not found'})
+
+    def read_body(self):
+        if self.headers.get('Transfer-Encoding') == 'chunked':
+            body = b''
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                if not size:
+                    self.rfile.readline()
+                    return body
+                body += self.rfile.read(size)
+                self.rfile.readline()
+        return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+    def send_json(self, status, data, headers=None):
+        self.send_body(status, json.dumps(data).encode(), 'application/json', headers)
+
+    def send_body(self, status, body, content_type='application/octet-stream', headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.write(body)
+
+    def send_file(self, data):
+        """
+        Send file supporting single byte range requests and If-Range like CDN does
+        """
+        etag = f'"{id(data):x}-{len(data):x}"'
+        match = re.fullmatch(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if not match or self.headers.get('If-Range', etag) != etag:
+            return self.send_body(200, data, headers={'Accept-Ranges': 'bytes', 'ETag': etag})
+
+        start = int(match.group(1))
+        end = min(int(match.group(2)) if match.group(2) else len(data) - 1, len(data) - 1)
+        if start >= len(data):
+            return self.send_body(416, b'', headers={'Content-Range': f'bytes */{len(data)}'})
+        self.send_body(206, data[start:end + 1],
+                       headers={'Accept-Ranges': 'bytes', 'ETag': etag,
+                                'Content-Range': f'bytes {start}-{end}/{len(data)}'})
+
+    def write(self, body):
+        view = memoryview(body)
+        try:
+            for position in range(0, len(body), 1024 * 1024):
+                chunk = view[position:position + 1024 * 1024]
+                self.wfile.write(chunk)
+                self.server.count(None, sent=len(chunk))
+        except (BrokenPipeError, ConnectionResetError):
+            # client closed connection, e.g. probe of range support
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+class StingrayServer(MockServer):
+    """
+    Stingray REST API endpoints used by cli. After start scan goes through STARTING, STARTED and ANALYZING
+    states with given durations and ends with SUCCESS
+    """
+    routes = [
+        ('GET', r'/rest/architectures/', 'architectures'),
+        ('GET', r'/rest/applications/(\d+)/', 'application'),
+        ('POST', r'/rest/organizations/\d+/applications/', 'upload'),
+        ('POST', r'/rest/organizations/\d+/dasts/', 'create_dast'),
+        ('POST', r'/rest/dasts/(\d+)/start/', 'start_dast'),
+        ('GET', r'/rest/dasts/(\d+)/', 'dast'),
+        ('GET', r'/rest/dasts/(\d+)/report/', 'report'),
+    ]
+
+    def __init__(self, port=0, latency=0.0, state_timings=(1, 1, 1), report_size=1024 * 1024, rate_limit=0,
+                 webhook=None):
+        super().__init__(port, latency, rate_limit)
+        # url receiving scan state events like {"scan_id": 1, "state": 4} after every change of state
+        self.webhook = webhook
+        self.state_timings = state_timings
+        self.report_data = b'%PDF-' + random.randbytes(report_size)
+        self.applications = set()
+        self.dasts = {}
+
+    def architectures(self, handler, body):
+        handler.send_json(200, [{'id': 1, 'name': 'Android 8', 'type': 0}, {'id': 2, 'name': 'iOS 14', 'type': 1}])
+
+    def application(self, handler, body, app_id):
+        found = int(app_id) in self.applications
+        handler.send_json(200 if found else 404, {'id': int(app_id)} if found else {'detail': 'Not found'})
+
+    def upload(self, handler, body):
+        with self.lock:
+            app_id = len(self.applications) + 1
+            self.applications.add(app_id)
+        handler.send_json(201, {'id': app_id, 'size': len(body)})
+
+    def create_dast(self, handler, body):
+        with self.lock:
+            dast_id = len(self.dasts) + 1
+            self.dasts[dast_id] = None
+        handler.send_json(201, {'id': dast_id, 'state': CREATED, **json.loads(body or b'{}')})
+
+    def start_dast(self, handler, body, dast_id):
+        if int(dast_id) not in self.dasts:
+            return handler.send_json(404, {'detail': 'Not found'})
+        self.dasts[int(dast_id)] = time.monotonic()
+        handler.send_json(200, {})
+        if self.webhook:
+            threading.Thread(target=self.emit_events, args=(int(dast_id), self.webhook), daemon=True).start()
+
+    def emit_events(self, dast_id, webhook):
+        for state, duration in zip((STARTING, STARTED, ANALYZING, SUCCESS), (0,) + tuple(self.state_timings)):
+            time.sleep(duration)
+            request = urllib.request.Request(webhook, json.dumps({'scan_id': dast_id, 'state': state}).encode(),
+                                             {'Content-Type': 'application/json'})
+            try:
+                urllib.request.urlopen(request, timeout=5).close()
+            except OSError:
+                # listener is not started yet or already stopped
+                continue
+            with self.lock:
+                self.stats['events'] += 1
+
+    def dast(self, handler, body, dast_id):
+        if int(dast_id) not in self.dasts:
+            return handler.send_json(404, {'detail': 'Not found'})
+        handler.send_json(200, {'id': int(dast_id), 'state': self.state(int(dast_id))})
+
+    def report(self, handler, body, dast_id):
+        handler.send_body(200, self.report_data, 'application/pdf')
+
+    def state(self, dast_id):
+        started = self.dasts[dast_id]
+        if started is None:
+            return CREATED
+        elapsed = time.monotonic() - started
+        for state, duration in zip((STARTING, STARTED, ANALYZING), self.state_timings):
+            if elapsed < duration:
+                return state
+            elapsed -= duration
+        return SUCCESS
+
+
+class AppCenterServer(MockServer):
+    """
+    AppCenter releases API of application "owner/app" with given count of releases.
+    Release id N has version "N", list of releases supports ETag revalidation
+    """
+    routes = [
+        ('GET', r'/v0.1/apps/[^/]+/[^/]+/releases', 'releases'),
+        ('GET', r'/v0.1/apps/[^/]+/[^/]+/releases/([^/]+)', 'release'),
+        ('GET', r'/files/(\d+)\.apk', 'file'),
+    ]
+
+    def __init__(self, port=0, latency=0.0, apk_size=8 * 1024 * 1024, releases=20):
+        super().__init__(port, latency)
+        self.apk = make_apk(apk_size)
+        self.release_count = releases
+
+    @property
+    def api_url(self):
+        return f'{self.url}/v0.1'
+
+    def releases(self, handler, body):
+        etag = f'"{self.release_count}"'
+        if handler.headers.get('If-None-Match') == etag:
+            handler.send_response(304)
+            handler.send_header('ETag', etag)
+            handler.send_header('Content-Length', '0')
+            handler.end_headers()
+            return
+        handler.send_json(200, [{'id': release, 'version': str(release), 'short_version': f'1.{release}'}
+                                for release in range(self.release_count, 0, -1)], {'ETag': etag})
+
+    def release(self, handler, body, release_id):
+        release_id = self.release_count if release_id == 'latest' else int(release_id)
+        if not 0 < release_id <= self.release_count:
+            return handler.send_json(404, {'code': 'not_found'})
+        handler.send_json(200, {'id': release_id, 'version': str(release_id),
+                                'download_url': f'{self.url}/files/{release_id}.apk'})
+
+    def file(self, handler, body, release_id):
+        handler.send_file(self.apk)
+
+
+class HockeyAppServer(MockServer):
+    """
+    HockeyApp API with given count of applications, application "com.example.app<N>"
+    has public identifier "app<N>" and versions from 1 to "versions"
+    """
+    routes = [
+        ('GET', r'/api/2/apps', 'apps'),
+        ('GET', r'/api/2/apps/([^/]+)/app_versions', 'versions'),
+        ('GET', r'/api/2/apps/([^/]+)/app_versions/(\d+)', 'file'),
+    ]
+
+    def __init__(self, port=0, latency=0.0, apk_size=8 * 1024 * 1024, apps=50, versions=20):
+        super().__init__(port, latency)
+        self.apk = make_apk(apk_size)
+        self.app_count = apps
+        self.version_count = versions
+
+    @property
+    def api_url(self):
+        return f'{self.url}/api/2'
+
+    def apps(self, handler, body):
+        handler.send_json(200, {'apps': [{'bundle_identifier': f'com.example.app{number}',
+                                          'public_identifier': f'app{number}'}
+                                         for number in range(1, self.app_count + 1)]})
+
+    def versions(self, handler, body, public_identifier):
+        handler.send_json(200, {'app_versions': [
+            {'version': str(version), 'download_url': f'{self.url}/apps/{public_identifier}/app_versions/{version}'}
+            for version in range(self.version_count, 0, -1)]})
+
+    def file(self, handler, body, public_identifier, version):
+        handler.send_file(self.apk)
+
+
+def start_servers(latency=0.0, state_timings=(1, 1, 1), apk_size=8 * 1024 * 1024, report_size=1024 * 1024,
+                  rate_limit=0):
+    """
+    Start all stand-ins on free ports
+    :param rate_limit: requests per second accepted by Stingray, others are answered with 429, 0 to disable limit
+    :return: tuple (Stingray, AppCenter, HockeyApp) servers
+    """
+    return (StingrayServer(latency=latency, state_timings=state_timings, report_size=report_size,
+                           rate_limit=rate_limit).start(),
+            AppCenterServer(latency=latency, apk_size=apk_size).start(),
+            HockeyAppServer(latency=latency, apk_size=apk_size).start())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run local stand-ins for Stingray, AppCenter and HockeyApp')
+    parser.add_argument('--latency', type=float, help='Seconds added to every response', default=0.0)
+    parser.add_argument('--state_timings', type=float, nargs=3, help='Seconds of STARTING, STARTED and ANALYZING states', default=[1, 1, 1])
+    parser.add_argument('--apk_size', type=int, help='Size of application file in megabytes', default=8)
+    parser.add_argument('--report_size', type=int, help='Size of PDF report in kilobytes', default=1024)
+    parser.add_argument('--rate_limit', type=int, help='Requests per second accepted by Stingray, others are answered with 429', default=0)
+    parser.add_argument('--webhook', type=str, help='Url receiving scan state events, e.g. http://127.0.0.1:8643/')
+    arguments = parser.parse_args()
+
+    stingray, appcenter, hockeyapp = start_servers(arguments.latency, arguments.state_timings,
+                                                   arguments.apk_size * 1024 * 1024, arguments.report_size * 1024,
+                                                   arguments.rate_limit)
+    stingray.webhook = arguments.webhook
+    print(f'Stingray: --stingray_url {stingray.url}')
+    print(f'AppCenter: --appcenter_url {appcenter.api_url} --appcenter_owner_name owner --appcenter_app_name app')
+    print(f'HockeyApp: --hockey_url {hockeyapp.api_url} --hockey_bundle_id com.example.app1')
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        for server in (stingray, appcenter, hockeyapp):
+            print(server.__class__.__name__, json.dumps(server.stats))
+        sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
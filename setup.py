@@ -11,13 +11,17 @@ setup(
     long_description=long_description,
     long_description_content_type="text/markdown",
     url="https://github.com/Swordfish-Security/stingray_cli",
-    packages=find_packages(),
+    packages=find_packages(exclude=['tests', 'tests.*']),
     author_email='stingray@appsec.global',
     include_package_data=True,
     install_requires=[
          'requests > 2.20',
+         'urllib3 >= 1.26',
          'stingray_cli_core == 2.1.4'
     ],
+    extras_require={
+        'yaml': ['PyYAML']
+    },
     entry_points ={
             'console_scripts': [
                 'stingray_cli=stingray_cli.run_stingray_scan:main'
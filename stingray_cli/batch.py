@@ -0,0 +1,160 @@
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from .helpers.const import BATCH_WORKERS
+    from .helpers.logging import Log
+    from .helpers.metrics import metrics
+    from .run_stingray_scan import parse_args as parse_scan_args, run_scan
+except ImportError:
+    from stingray_cli.helpers.const import BATCH_WORKERS
+    from stingray_cli.helpers.logging import Log
+    from stingray_cli.helpers.metrics import metrics
+    from stingray_cli.run_stingray_scan import parse_args as parse_scan_args, run_scan
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='stingray_cli batch',
+                                     description='Start many scans described in manifest file and wait for their results concurrently')
+    parser.add_argument('--manifest', type=str, help='Path to YAML or JSON manifest with scan jobs', required=True)
+    parser.add_argument('--workers', type=int, help='Count of jobs processed at the same time', default=BATCH_WORKERS)
+    parser.add_argument('--token', type=str, help='CI/CD Token used for jobs without "token" in manifest', default=os.environ.get('STINGRAY_TOKEN'))
+    parser.add_argument('--summary_file', type=str, help='Name for the json file with results of all jobs')
+    parser.add_argument('--trace_file', type=str, help='Name for the json file with duration of every phase of all jobs, transferred bytes and http requests')
+    parser.add_argument('--metrics_file', type=str, help='Name for the Prometheus textfile with metrics of all jobs labeled by job name')
+
+    return parser.parse_args(argv)
+
+
+def load_manifest(path):
+    """
+    Load jobs from manifest. Manifest is a list of jobs or a dict with "jobs" list and "defaults" for all of them.
+    Every job is a dict with the same keys as command line arguments of single scan, e.g.
+    {"distribution_system": "file", "file_path": "app.apk", "profile_id": 1, "testcase_id": 2, "architecture_id": 1}
+    :return: list of tuples (job name, job arguments)
+    """
+    with open(path) as fp:
+        if path.endswith(('.yml', '.yaml')):
+            try:
+                import yaml
+            except ImportError:
+                Log.error('PyYAML package is required to read YAML manifest, install it with '
+                          '"pip install stingray_cli[yaml]" or use JSON manifest')
+                sys.exit(1)
+            manifest = yaml.safe_load(fp)
+        else:
+            manifest = json.load(fp)
+
+    if isinstance(manifest, list):
+        manifest = {'jobs': manifest}
+
+    defaults = manifest.get('defaults', {})
+    jobs = []
+    for number, job in enumerate(manifest.get('jobs', []), start=1):
+        job = {**defaults, **job}
+        name = str(job.pop('name', number))
+        jobs.append((name, job))
+    return jobs
+
+
+def job_argv(job):
+    """
+    Convert job from manifest to command line arguments of single scan
+    """
+    argv = []
+    for key, value in job.items():
+        if value is None or value is False:
+            continue
+        if value is True:
+            argv.append(f'--{key}')
+        elif isinstance(value, (list, tuple)):
+            argv += [f'--{key}', *(str(item) for item in value)]
+        else:
+            argv += [f'--{key}', str(value)]
+    return argv
+
+
+def call_job(name, function, *args):
+    """
+    Call stage of the job logging with job name. Exit of the stage is turned into exit code instead of stopping
+    the whole process
+    :return: tuple (value returned by function or None, exit code)
+    """
+    Log.set_context(name)
+    try:
+        return function(*args), 0
+    except SystemExit as e:
+        return None, e.code if isinstance(e.code, int) else int(e.code is not None)
+    except Exception as e:
+        Log.error(f'Unexpected error: {e!r}')
+        return None, 1
+    finally:
+        Log.set_context(None)
+
+
+def run_job(name, job):
+    """
+    Run single scan job. Exit of the scan is turned into the job result instead of stopping the whole batch
+    :return: dict with job name, exit code, duration and scan results
+    """
+    started_at = time.monotonic()
+    result = {}
+    _, exit_code = call_job(name, lambda: run_scan(parse_scan_args(job_argv(job)), result))
+
+    return {'name': name,
+            'exit_code': exit_code,
+            'duration': round(time.monotonic() - started_at, 1),
+            **result}
+
+
+def main(argv=None):
+    import urllib3
+    urllib3.disable_warnings()
+    arguments = parse_args(argv)
+
+    jobs = load_manifest(arguments.manifest)
+    if not jobs:
+        Log.error(f'No jobs found in manifest {arguments.manifest}')
+        sys.exit(1)
+
+    for _, job in jobs:
+        if arguments.token and 'token' not in job:
+            job['token'] = arguments.token
+
+    Log.info(f'Start {len(jobs)} jobs with {arguments.workers} workers')
+    with ThreadPoolExecutor(max_workers=arguments.workers) as executor:
+        results = list(executor.map(lambda job: run_job(*job), jobs))
+
+    Log.info('Batch summary:')
+    for result in results:
+        status = 'OK' if result['exit_code'] == 0 else f"FAILED ({result['exit_code']})"
+        if 'cells' in result:
+            # matrix of scans, every scan is reported in log of the job
+            Log.info(f"{result['name']}: {status}, scan ids: {', '.join(str(cell.get('scan_id')) for cell in result['cells'])}, "
+                     f"duration: {result['duration']}s")
+            continue
+        Log.info(f"{result['name']}: {status}, scan id: {result.get('scan_id')}, "
+                 f"state: {result.get('state')}, duration: {result['duration']}s")
+
+    failed = [result for result in results if result['exit_code'] != 0]
+    Log.info(f'Jobs completed: {len(results) - len(failed)}, failed: {len(failed)}')
+
+    if arguments.summary_file:
+        with open(arguments.summary_file, 'w') as fp:
+            json.dump(results, fp, indent=4)
+        Log.info(f'Batch summary saved to {arguments.summary_file}')
+
+    if arguments.trace_file:
+        metrics.write_trace(arguments.trace_file)
+    if arguments.metrics_file:
+        metrics.write_prometheus(arguments.metrics_file)
+
+    sys.exit(max(result['exit_code'] for result in results))
+
+
+if __name__ == '__main__':
+    main()
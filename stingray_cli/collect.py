@@ -0,0 +1,135 @@
+import os
+import sys
+import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+try:
+    from .helpers.const import SCAN_TIMEOUT, BATCH_WORKERS
+    from .helpers.logging import Log
+    from .helpers.helpers import get_cache_dir
+    from .helpers.journal import ScanJournal
+    from .poller import scan_poller, ScanPollError
+    from .batch import call_job
+    from .run_stingray_scan import finish_scan
+except ImportError:
+    from stingray_cli.helpers.const import SCAN_TIMEOUT, BATCH_WORKERS
+    from stingray_cli.helpers.logging import Log
+    from stingray_cli.helpers.helpers import get_cache_dir
+    from stingray_cli.helpers.journal import ScanJournal
+    from stingray_cli.poller import scan_poller, ScanPollError
+    from stingray_cli.batch import call_job
+    from stingray_cli.run_stingray_scan import finish_scan
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='stingray_cli collect',
+                                     description='Wait for scans started earlier (e.g. with --nowait) and save their reports')
+    parser.add_argument('--token', type=str, help='CI/CD Token for getting results', default=os.environ.get('STINGRAY_TOKEN'))
+    parser.add_argument('--journal_dir', type=str, help='Directory of journal of started scans', default=get_cache_dir('journal'))
+    parser.add_argument('--stingray_url', type=str, help='Collect only scans started on this Stingray')
+    parser.add_argument('--scan_id', type=int, nargs='+', help='Collect only scans with these ids')
+    parser.add_argument('--scan_timeout', type=int, help='Seconds to wait for scans end', default=SCAN_TIMEOUT)
+    parser.add_argument('--workers', type=int, help='Count of reports saved at the same time', default=BATCH_WORKERS)
+    parser.add_argument('--results_db', type=str, help='Path to SQLite database to append summaries of collected scans to', default=os.environ.get('STINGRAY_CLI_RESULTS_DB'))
+    parser.add_argument('--summary_file', type=str, help='Name for the json file with results of all collected scans')
+    parser.add_argument('--list', action='store_true', help='Only print scans which results are not collected yet')
+
+    arguments = parser.parse_args(argv)
+    if not arguments.list and not arguments.token:
+        parser.error('"--token" argument or STINGRAY_TOKEN environment variable is required to collect results')
+    return arguments
+
+
+def select_entries(journal, arguments):
+    stingray_url = arguments.stingray_url and arguments.stingray_url.rstrip('/')
+    if stingray_url and not stingray_url.endswith('/rest'):
+        stingray_url = f'{stingray_url}/rest'
+
+    return [entry for entry in journal.entries()
+            if (not stingray_url or entry['stingray_url'] == stingray_url) and
+            (not arguments.scan_id or entry['scan_id'] in arguments.scan_id)]
+
+
+def collect(entry, stingray, watch, arguments):
+    """
+    Check state of the finished scan and save its reports with the output paths of the run which started it.
+    Scan which state can not be received is reported as failed, so other scans are still collected
+    :return: dict with scan results
+    """
+    result = {'scan_id': entry['scan_id'], 'application_id': entry.get('application_id'),
+              'sha256': entry.get('sha256'), **entry.get('application_info', {})}
+    scan_arguments = argparse.Namespace(summary_report_json_file_name=entry.get('summary_report_json_file_name'),
+                                        report_dir=entry.get('report_dir', '.'),
+                                        scan_timeout=arguments.scan_timeout,
+                                        journal_dir=arguments.journal_dir,
+                                        results_db=arguments.results_db,
+                                        distribution_system=entry.get('distribution_system'),
+                                        profile_id=entry.get('profile_id'),
+                                        testcase_id=entry.get('testcase_id'),
+                                        architecture_id=entry.get('architecture_id'))
+    try:
+        dast = watch.result()
+    except ScanPollError as e:
+        Log.error(str(e))
+        if e.status_code == 404:
+            Log.info(f"Scan with id {entry['scan_id']} is not found on server, remove it from journal")
+            ScanJournal(arguments.journal_dir).remove(entry['stingray_url'], entry['scan_id'])
+        return {**result, 'exit_code': 1}
+
+    return finish_scan(scan_arguments, stingray, dast, result)
+
+
+def main(argv=None):
+    import urllib3
+    from stingray_cli.stingray_client import Stingray
+    urllib3.disable_warnings()
+    arguments = parse_args(argv)
+
+    journal = ScanJournal(arguments.journal_dir)
+    entries = select_entries(journal, arguments)
+    if arguments.list:
+        print(json.dumps(entries, indent=4))
+        sys.exit(0)
+    if not entries:
+        Log.info('No scans to collect')
+        sys.exit(0)
+
+    Log.info(f'Collect results of {len(entries)} scans')
+    watches = {}
+    for entry in entries:
+        stingray = Stingray(entry['stingray_url'], arguments.token, entry['company_id'])
+        Log.set_context(f"scan {entry['scan_id']}")
+        watches[scan_poller.watch(stingray, entry['scan_id'], arguments.scan_timeout)] = (entry, stingray)
+    Log.set_context(None)
+
+    # reports of every scan are saved as soon as it is finished, all scans are waited by the single poller
+    with ThreadPoolExecutor(max_workers=arguments.workers) as executor:
+        tasks = []
+        for watch in as_completed(watches):
+            entry, stingray = watches[watch]
+            tasks.append((entry, executor.submit(call_job, f"scan {entry['scan_id']}", collect, entry, stingray,
+                                                 watch, arguments)))
+
+        results = []
+        for entry, task in tasks:
+            result, exit_code = task.result()
+            # exit code of scan which state is not received is set by collect
+            results.append({'scan_id': entry['scan_id'],
+                            'application': entry.get('application'),
+                            'exit_code': exit_code,
+                            **(result or {})})
+
+    failed = [result for result in results if result['exit_code'] != 0]
+    Log.info(f'Scans collected: {len(results) - len(failed)}, failed: {len(failed)}')
+
+    if arguments.summary_file:
+        with open(arguments.summary_file, 'w') as fp:
+            json.dump(results, fp, indent=4)
+        Log.info(f'Collect summary saved to {arguments.summary_file}')
+
+    sys.exit(max(result['exit_code'] for result in results))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Registry of distribution systems. Every distribution system is a subclass of
+distribution_systems.base.DistributionSystem and its module is imported only when it is selected.
+Third-party packages can add distribution systems through "stingray_cli.distribution_systems"
+entry points group, e.g. "firebase = my_package.firebase:Firebase"
+"""
+import inspect
+import importlib
+import functools
+
+__all__ = ['DISTRIBUTION_SYSTEMS', 'ENTRY_POINTS_GROUP', 'available_distribution_systems', 'get_distribution_system']
+
+DISTRIBUTION_SYSTEMS = {
+    'file': 'stingray_cli.distribution_systems.local_file:LocalFile',
+    'hockeyapp': 'stingray_cli.distribution_systems.hockey_app:HockeyApp',
+    'appcenter': 'stingray_cli.distribution_systems.app_center:AppCenter',
+}
+ENTRY_POINTS_GROUP = 'stingray_cli.distribution_systems'
+
+
+@functools.lru_cache(maxsize=None)
+def _plugins():
+    from importlib.metadata import entry_points
+    try:
+        plugins = entry_points(group=ENTRY_POINTS_GROUP)
+    except TypeError:
+        # python < 3.10
+        plugins = entry_points().get(ENTRY_POINTS_GROUP, [])
+    return {plugin.name: plugin.value for plugin in plugins}
+
+
+def available_distribution_systems():
+    """
+    Names of built-in and installed distribution systems. Installed packages are scanned, so it is slower
+    than get_distribution_system for built-in one
+    :return: dict {name: "module:class"}
+    """
+    return {**_plugins(), **DISTRIBUTION_SYSTEMS}
+
+
+def get_distribution_system(name):
+    """
+    Import distribution system class by its name
+    :return: class or None if distribution system is not known
+    :raise ImportError: if module or class of distribution system can not be imported
+    :raise TypeError: if registered class is not complete distribution system
+    """
+    from stingray_cli.distribution_systems.base import DistributionSystem
+
+    path = DISTRIBUTION_SYSTEMS.get(name) or _plugins().get(name)
+    if path is None:
+        return None
+
+    module_name, class_name = path.split(':')
+    system = getattr(importlib.import_module(module_name), class_name, None)
+    if system is None:
+        raise ImportError(f'Distribution system "{name}" ({path}) is not found in module {module_name}')
+    if not (inspect.isclass(system) and issubclass(system, DistributionSystem)):
+        raise TypeError(f'Distribution system "{name}" ({path}) is not a subclass of DistributionSystem')
+    if inspect.isabstract(system):
+        raise TypeError(f'Distribution system "{name}" ({path}) does not implement: '
+                        f'{", ".join(sorted(system.__abstractmethods__))}')
+    return system
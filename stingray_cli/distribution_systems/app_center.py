@@ -1,32 +1,72 @@
-import requests
 import sys
-import os
 
 try:
+    from ..helpers.const import DOWNLOAD_SEGMENTS
     from ..helpers.logging import Log
+    from ..helpers.metrics import metrics
     from .base import DistributionSystem
 except ImportError:
+    from stingray_cli.helpers.const import DOWNLOAD_SEGMENTS
     from stingray_cli.helpers.logging import Log
+    from stingray_cli.helpers.metrics import metrics
     from stingray_cli.distribution_systems.base import DistributionSystem
 
 class AppCenter(DistributionSystem):
     """
     Downloading application from HockeyApp distribution system
     """
+    name = 'appcenter'
     url = 'https://api.appcenter.ms/v0.1'
     download_path = 'downloaded_apps'
 
-    def __init__(self, token, app_name, owner_name, version, id):
-        super().__init__(app_name, version)
+    def __init__(self, token, app_name, owner_name, version, id, cache=None, download_segments=DOWNLOAD_SEGMENTS,
+                 metadata_cache=None, url=None):
+        super().__init__(app_name, version, cache, download_segments, metadata_cache)
 
         self.id = id
         self.owner_name = owner_name
         self.auth_header = {'X-API-Token': token}
+        if url:
+            self.url = url.rstrip('/')
+
+    @classmethod
+    def add_arguments(cls, parser):
+        parser.add_argument('--appcenter_url', type=str, help='AppCenter API url, e.g. url of proxy or local stand-in', default=cls.url)
+        parser.add_argument('--appcenter_token', type=str, help='Auth token for AppCenter. This argument required if distribution system set to "appcenter"')
+        parser.add_argument('--appcenter_owner_name', type=str, help='Application owner name in AppCenter. This argument required if distribution system set to "appcenter"')
+        parser.add_argument('--appcenter_app_name', type=str, help='Application name in AppCenter. This argument required if distribution system set to "appcenter"')
+        parser.add_argument('--appcenter_release_id', type=str, help='Release id in AppCenter. If not set - the latest release will be downloaded. This argument or "--ac_app_version" required if distribution system set to "appcenter"')
+        parser.add_argument('--appcenter_app_version', type=str,help='Application version in AppCenter. This argument  or "--appcenter_release_id" required if distribution system set to "appcenter"')
+
+    @classmethod
+    def validate_arguments(cls, arguments):
+        if arguments.appcenter_token is None or arguments.appcenter_owner_name is None or \
+                arguments.appcenter_app_name is None or \
+                (arguments.appcenter_release_id is None and arguments.appcenter_app_version is None):
+            return '"--distribution_system appcenter" requires "--appcenter_token", "--appcenter_owner_name",  ' \
+                   '"--appcenter_app_name" and "--appcenter_release_id" or "--appcenter_app_version" arguments to be set'
+        return None
+
+    @classmethod
+    def from_arguments(cls, arguments, cache=None, metadata_cache=None):
+        return cls(arguments.appcenter_token,
+                   arguments.appcenter_app_name,
+                   arguments.appcenter_owner_name,
+                   arguments.appcenter_app_version,
+                   arguments.appcenter_release_id,
+                   cache,
+                   arguments.download_segments,
+                   metadata_cache,
+                   arguments.appcenter_url)
+
+    @metrics.timed('appcenter_release')
+    def _get_release(self, release_id):
+        url = '{0}/apps/{1}/{2}/releases/{3}'.format(self.url, self.owner_name, self.app_identifier, release_id)
+        return self.session.get(url, headers=self.auth_header)
 
     def get_version_info_by_id(self):
         Log.info('AppCenter - Get information about application')
-        url = '{0}/apps/{1}/{2}/releases/{3}'.format(self.url, self.owner_name, self.app_identifier, self.id)
-        response = requests.get(url, headers=self.auth_header)
+        response = self._get_release(self.id)
         if response.status_code != 200:
             Log.error(
                 'AppCenter - Failed to get information about application release. Request return status code: {0}'.format(
@@ -36,28 +76,86 @@ class AppCenter(DistributionSystem):
         version_info = response.json()
         return version_info
 
-    def get_version_info_by_version(self):
+    @property
+    def cache_identifier(self):
+        return '{0}/{1}'.format(self.owner_name, self.app_identifier)
+
+    @property
+    def _releases_cache_key(self):
+        return 'appcenter/{0}/{1}/releases'.format(self.metadata_scope, self.cache_identifier)
+
+    def invalidate_metadata(self):
+        if self.metadata_cache:
+            self.metadata_cache.invalidate(self._releases_cache_key)
+
+    def get_cached_release_id(self):
+        """
+        Find release id of application version in cached index without any network requests
+        :return: release id or None
+        """
+        if not self.metadata_cache:
+            return None
+
+        entry = self.metadata_cache.get(self._releases_cache_key)
+        return entry['value'].get(self.app_version) if entry else None
+
+    @metrics.timed('appcenter_releases_index')
+    def get_releases_index(self):
+        """
+        Get index of application versions. List of releases is revalidated with conditional request,
+        so unchanged list is not downloaded again
+        :return: dict {version: release id}, the latest release for every version
+        """
+        entry = self.metadata_cache.get(self._releases_cache_key) if self.metadata_cache else None
+        headers = {**self.auth_header, **self.metadata_cache.conditional_headers(entry)} if entry else self.auth_header
+
         url = '{0}/apps/{1}/{2}/releases?scope=tester'.format(self.url, self.owner_name, self.app_identifier)
+        response = self.session.get(url, headers=headers)
+        if response.status_code == 304 and entry:
+            Log.info('AppCenter - List of application releases is not changed')
+            return entry['value']
 
-        response = requests.get(url, headers=self.auth_header)
         if response.status_code != 200:
             Log.error(
                 'AppCenter - Failed to get information about application releases. Request return status code: {0}'.format(
                     response.status_code))
             sys.exit(4)
 
-        versions_info = response.json()
-        for version in versions_info:
-            if version['version'] != self.app_version:
-                continue
+        releases_index = {}
+        for version in response.json():
+            releases_index.setdefault(version['version'], version['id'])
 
-            self.id = version['id']
-            version_info = self.get_version_info_by_id()
-            return version_info
+        if self.metadata_cache:
+            self.metadata_cache.put(self._releases_cache_key, releases_index, response)
+        return releases_index
 
-        return None
+    def get_version_info_by_version(self):
+        release_id = self.get_cached_release_id()
+        if release_id is not None:
+            Log.info('AppCenter - Release {0} of version {1} found in cache'.format(release_id, self.app_version))
+            response = self._get_release(release_id)
+            if response.status_code == 200 and response.json().get('version') == self.app_version:
+                self.id = release_id
+                return response.json()
+            self.metadata_cache.invalidate(self._releases_cache_key)
+
+        release_id = self.get_releases_index().get(self.app_version)
+        if release_id is None:
+            return None
+
+        self.id = release_id
+        return self.get_version_info_by_id()
 
     def download_app(self):
+        release_id = self.id if self.id != 'latest' else None
+        if not self.id:
+            release_id = self.get_cached_release_id()
+
+        if release_id:
+            cached_app = self.get_cached_app(release_id)
+            if cached_app:
+                return cached_app
+
         if self.id:
             version_info = self.get_version_info_by_id()
         else:
@@ -65,26 +163,14 @@ class AppCenter(DistributionSystem):
 
         if not version_info:
             Log.error('AppCenter - Failed to get app version information. Verify that you set up arguments correctly and try again')
+            sys.exit(4)
+        self.downloaded_version = version_info['version']
 
         Log.info('AppCenter - Start download application')
         download_url = version_info.get('download_url')
 
-        response = requests.get(download_url, headers=self.auth_header, allow_redirects=True)
-        if response.status_code != 200:
-            Log.error('AppCenter - Failed to download application. Request return status code: {0}'.format(
-                response.status_code))
-            sys.exit(4)
-
         file_name = '{0}-{1}.apk'.format(self.app_identifier, version_info['version'])
-        path_to_save = os.path.join(self.download_path, file_name)
-
-        if not os.path.exists(self.download_path):
-            os.mkdir(self.download_path)
-
-        with open(path_to_save, 'wb') as file:
-            file.write(response.content)
-
-        Log.info('AppCenter - Download application successfully completed to {0}'.format(path_to_save))
+        path_to_save = self.save_app(download_url, file_name, version_info['id'])
 
         return path_to_save
 
@@ -1,13 +1,203 @@
-class DistributionSystem:
+import sys
+import os
+import hashlib
+from abc import ABC, abstractmethod
+
+try:
+    from ..helpers.logging import Log
+    from ..helpers.const import DOWNLOAD_SEGMENTS
+    from ..helpers.metrics import metrics
+except ImportError:
+    from stingray_cli.helpers.logging import Log
+    from stingray_cli.helpers.const import DOWNLOAD_SEGMENTS
+    from stingray_cli.helpers.metrics import metrics
+
+
+class DistributionSystem(ABC):
     """
-    Base class for various distribution systems such HckeyApp, Firebase, AppsFlayer, etc
+    Base class for various distribution systems such HckeyApp, Firebase, AppsFlayer, etc.
+    Distribution system describes its own command line arguments and is created from them,
+    so it can be registered in distribution_systems registry without changes in cli.
+    Subclass must implement from_arguments and download_app, otherwise it is rejected by registry.
+    Http client is imported only when distribution system makes requests
     """
+    name = ''
+    remote = True
     url = ''
     download_path = ''
+    auth_header = {}
 
-    def __init__(self, app_identifier, app_version):
+    def __init__(self, app_identifier, app_version, cache=None, download_segments=DOWNLOAD_SEGMENTS, metadata_cache=None):
         self.app_identifier = app_identifier
         self.app_version = app_version
+        self.cache = cache
+        self.download_segments = download_segments
+        self.metadata_cache = metadata_cache
+        self.sha256 = None
+        self.downloaded_version = None
+        self.apk_info = None
+        # called before application is downloaded, e.g. to fail early if Stingray is not available
+        self.before_download = None
+
+    @classmethod
+    def add_arguments(cls, parser):
+        """
+        Add arguments of distribution system to command line parser
+        :param parser: argparse parser or arguments group
+        """
+        pass
+
+    @classmethod
+    def validate_arguments(cls, arguments):
+        """
+        Check that all required arguments are set
+        :return: error message or None if arguments are valid
+        """
+        return None
+
+    @classmethod
+    @abstractmethod
+    def from_arguments(cls, arguments, cache=None, metadata_cache=None):
+        """
+        Create distribution system from parsed command line arguments
+        """
+
+    @property
+    def session(self):
+        """
+        Shared http session with connection pool and retries
+        """
+        from stingray_cli.helpers.http import get_session
+        return get_session()
+
+    @property
+    def cache_identifier(self):
+        """
+        Identifier of application unique inside distribution system, used as a part of cache key
+        """
+        return self.app_identifier
+
+    @property
+    def metadata_scope(self):
+        """
+        Hash of API url and credentials, part of metadata cache keys, so servers and accounts sharing the cache
+        do not read metadata of each other
+        """
+        scope = '|'.join([self.url.rstrip('/'), *(str(self.auth_header[key]) for key in sorted(self.auth_header))])
+        return hashlib.sha256(scope.encode()).hexdigest()[:16]
+
+    @property
+    def application_name(self):
+        """
+        Name of application used to index results of scans
+        """
+        return self.cache_identifier
+
+    @property
+    def application_version(self):
+        """
+        Version of downloaded application or requested one if application was taken from cache
+        """
+        return self.downloaded_version or self.app_version
+
+    def _cache_key(self, version):
+        return self.cache.make_key(self.name, self.cache_identifier, version)
+
+    def get_cached_app(self, version):
+        """
+        Take application from local cache without any network requests
+        :param version: version or release id of application
+        :return: path to application or None if it is not cached
+        """
+        if not self.cache:
+            return None
+
+        cached = self.cache.fetch(self._cache_key(version), self.download_path)
+        if not cached:
+            return None
 
+        path, self.sha256 = cached
+        return path
+
+    @abstractmethod
     def download_app(self):
+        """
+        Get application file, see save_app
+        :return: path to application file
+        """
+
+    def inspect_app(self, path):
+        """
+        Check that file is valid application and read its package, version and fingerprint.
+        Only zip central directory and manifest are read, so it is done before file is cached or uploaded
+        :return: dict with application info, see inspect_apk
+        """
+        from stingray_cli.helpers.apk import inspect_apk, ApkError
+
+        with metrics.span('inspect', distribution_system=self.name):
+            try:
+                self.apk_info = inspect_apk(path)
+            except ApkError as e:
+                Log.error('{0} - File {1} is not valid application: {2}'.format(self.__class__.__name__, path, e))
+                if self.remote and os.path.exists(path):
+                    os.remove(path)
+                sys.exit(4)
+        return self.apk_info
+
+    def invalidate_metadata(self):
+        """
+        Remove cached metadata of application, so it is requested again
+        """
         pass
+
+    def save_app(self, download_url, file_name, version=None):
+        """
+        Stream application from download url to the download path or take it from cache.
+        Only one process on the host downloads the same application version at a time
+        :param download_url: url of application file
+        :param file_name: name of the file inside download path
+        :param version: version or release id of application, used as a part of cache key
+        :return: path to downloaded application
+        """
+        if not self.cache or version is None:
+            return self._download(download_url, file_name)
+
+        cache_key = self._cache_key(version)
+        with self.cache.lock(cache_key):
+            path_to_save = self.get_cached_app(version)
+            if path_to_save:
+                return path_to_save
+
+            path_to_save = self._download(download_url, file_name)
+            self.cache.put(cache_key, path_to_save, self.sha256)
+
+        return path_to_save
+
+    def _download(self, download_url, file_name):
+        from stingray_cli.helpers.download import download_file, download_file_segmented, DownloadError
+
+        if self.before_download is not None:
+            self.before_download()
+
+        path_to_save = os.path.join(self.download_path, file_name)
+        os.makedirs(self.download_path, exist_ok=True)
+
+        with metrics.span('download', distribution_system=self.name, segments=self.download_segments) as span:
+            try:
+                if self.download_segments > 1:
+                    path_to_save, self.sha256 = download_file_segmented(download_url, path_to_save,
+                                                                        self.download_segments,
+                                                                        headers=self.auth_header, session=self.session)
+                else:
+                    path_to_save, self.sha256 = download_file(download_url, path_to_save, headers=self.auth_header,
+                                                               session=self.session)
+            except DownloadError as e:
+                Log.error('{0} - Failed to download application. {1}'.format(self.__class__.__name__, e))
+                sys.exit(4)
+            span['size'] = os.path.getsize(path_to_save)
+        self.inspect_app(path_to_save)
+
+        Log.info('{0} - Download application successfully completed to {1}, sha256: {2}'.format(
+            self.__class__.__name__, path_to_save, self.sha256))
+
+        return path_to_save
@@ -1,34 +1,88 @@
-import requests
 import sys
-import os
 
 try:
+    from ..helpers.const import DOWNLOAD_SEGMENTS
     from ..helpers.logging import Log
+    from ..helpers.metrics import metrics
     from .base import DistributionSystem
 except ImportError:
+    from stingray_cli.helpers.const import DOWNLOAD_SEGMENTS
     from stingray_cli.helpers.logging import Log
+    from stingray_cli.helpers.metrics import metrics
     from stingray_cli.distribution_systems.base import DistributionSystem
 
 class HockeyApp(DistributionSystem):
     """
     Downloading application from HockeyApp distribution system
     """
+    name = 'hockeyapp'
     url = 'https://rink.hockeyapp.net/api/2'
     download_path = 'downloaded_apps'
 
-    def __init__(self, token, app_bundle, app_identifier, version):
-        super().__init__(app_bundle, version)
+    def __init__(self, token, app_bundle, app_identifier, version, cache=None, download_segments=DOWNLOAD_SEGMENTS,
+                 metadata_cache=None, url=None):
+        super().__init__(app_bundle, version, cache, download_segments, metadata_cache)
 
+        self.app_bundle = app_bundle
         self.app_identifier = app_identifier
         self.auth_header = {'X-HockeyAppToken': token}
-
+        if url:
+            self.url = url.rstrip('/')
+
+    @classmethod
+    def add_arguments(cls, parser):
+        parser.add_argument('--hockey_url', type=str, help='HockeyApp API url, e.g. url of proxy or local stand-in', default=cls.url)
+        parser.add_argument('--hockey_token', type=str, help='Auth token for HockeyApp. This argument required if distribution system set to "hockeyapp"')
+        parser.add_argument('--hockey_bundle_id', type=str, help='Application bundle in HockeyApp. This argument or "--hockey_public_id" required if distribution system set to "hockeyapp"')
+        parser.add_argument('--hockey_public_id', type=str, help='Application identifier in HockeyApp. This argument or "--hockey_bundle_id" required if distribution system set to "hockeyapp"')
+        parser.add_argument('--hockey_version', type=str, help='Application version in HockeyApp. If not set - the latest version will be downloaded. This argument required if distribution system set to "hockeyapp"', default='latest')
+
+    @classmethod
+    def validate_arguments(cls, arguments):
+        if arguments.hockey_token is None or (arguments.hockey_bundle_id is None and arguments.hockey_public_id is None):
+            return '"--distribution_system hockeyapp" requires "--hockey_token" and "--hockey_bundle_id" or ' \
+                   '"--hockey_public_id" arguments to be set'
+        return None
+
+    @classmethod
+    def from_arguments(cls, arguments, cache=None, metadata_cache=None):
+        return cls(arguments.hockey_token,
+                   arguments.hockey_bundle_id,
+                   arguments.hockey_public_id,
+                   arguments.hockey_version,
+                   cache,
+                   arguments.download_segments,
+                   metadata_cache,
+                   arguments.hockey_url)
+
+    @property
+    def application_name(self):
+        return self.app_bundle or self.app_identifier
+
+    @property
+    def apps_cache_key(self):
+        return 'hockeyapp/{0}/apps'.format(self.metadata_scope)
+
+    def _versions_cache_key(self, public_identifier):
+        return 'hockeyapp/{0}/{1}/app_versions'.format(self.metadata_scope, public_identifier)
+
+    def invalidate_metadata(self):
+        if not self.metadata_cache:
+            return
+
+        public_identifier = self.app_identifier or self.get_cached_public_identifier()
+        if public_identifier:
+            self.metadata_cache.invalidate(self._versions_cache_key(public_identifier))
+        self.metadata_cache.invalidate(self.apps_cache_key)
+
+    @metrics.timed('hockeyapp_apps')
     def get_apps(self):
         """
         Get list of available applications
         :return: list of all applications (dict)
         """
         Log.info('HockeyApp - Get list of available applications')
-        response = requests.get('{0}/{1}'.format(self.url, 'apps'), headers=self.auth_header)
+        response = self.session.get('{0}/{1}'.format(self.url, 'apps'), headers=self.auth_header)
         if response.status_code != 200:
             Log.error('HockeyApp - Error while getting application list, status code: {0}'.format(response.status_code))
             sys.exit(4)
@@ -36,25 +90,64 @@ class HockeyApp(DistributionSystem):
         app_list = response.json()
         return app_list.get('apps', [])
 
-    def get_versions_info(self):
+    def get_cached_public_identifier(self):
+        """
+        Find public identifier of application by its bundle identifier in cache without any network requests
+        :return: public identifier or None
+        """
+        if not self.metadata_cache:
+            return None
+
+        entry = self.metadata_cache.get(self.apps_cache_key, self.metadata_cache.ttl)
+        return entry['value'].get(self.app_bundle) if entry else None
+
+    def resolve_public_identifier(self):
+        """
+        Find public identifier of application by its bundle identifier
+        :return: public identifier or None if application not found
+        """
+        if self.app_identifier:
+            return self.app_identifier
+
+        self.app_identifier = self.get_cached_public_identifier()
+        if self.app_identifier:
+            return self.app_identifier
+
+        apps_index = {application['bundle_identifier']: application['public_identifier']
+                      for application in self.get_apps()}
+        if self.metadata_cache:
+            self.metadata_cache.put(self.apps_cache_key, apps_index)
+
+        self.app_identifier = apps_index.get(self.app_bundle)
+        return self.app_identifier
+
+    @metrics.timed('hockeyapp_versions')
+    def get_versions_info(self, use_cache=True):
         """
         Get all available versions of current application
+        :param use_cache: take list of versions from cache if it is not expired
         :return: list of versions (dict)
         """
-        Log.info('HockeyApp - Get all available versions of current application')
-        if not self.app_identifier:
-            for application in self.get_apps():
-                if application['bundle_identifier'] != self.app_identifier:
-                    continue
-                self.app_identifier = application['public_identifier']
+        if not self.resolve_public_identifier():
+            Log.error('HockeyApp - Application with bundle identifier {0} not found'.format(self.app_bundle))
+            sys.exit(4)
+
+        if use_cache and self.metadata_cache:
+            entry = self.metadata_cache.get(self._versions_cache_key(self.app_identifier), self.metadata_cache.ttl)
+            if entry:
+                return entry['value']
 
+        Log.info('HockeyApp - Get all available versions of current application')
         versions_info_url = '{0}/{1}/{2}/{3}'.format(self.url, 'apps', self.app_identifier, 'app_versions')
-        response = requests.get(versions_info_url, headers=self.auth_header)
+        response = self.session.get(versions_info_url, headers=self.auth_header)
         if response.status_code != 200:
             Log.error('HockeyApp - Error while getting application versions info, status code: {0}'.format(response.status_code))
             sys.exit(4)
 
-        return response.json().get('app_versions', [None])
+        versions_info = response.json().get('app_versions', [None])
+        if self.metadata_cache:
+            self.metadata_cache.put(self._versions_cache_key(self.app_identifier), versions_info, response)
+        return versions_info
 
     def get_version(self):
         """
@@ -63,10 +156,16 @@ class HockeyApp(DistributionSystem):
         """
         Log.info('HockeyApp - Get data about specified version')
         if self.app_version == 'latest':
-            application_version = self.get_versions_info()[0]
+            # the latest version must be always actual
+            application_version = self.get_versions_info(use_cache=False)[0]
             return application_version
 
-        for version in self.get_versions_info():
+        versions_info = self.get_versions_info()
+        if self.metadata_cache and not any(version and version['version'] == self.app_version for version in versions_info):
+            # cached list does not contain recently published versions
+            versions_info = self.get_versions_info(use_cache=False)
+
+        for version in versions_info:
             if version['version'] != self.app_version:
                 continue
 
@@ -79,30 +178,26 @@ class HockeyApp(DistributionSystem):
         Download application
         :return:
         """
+        if not self.app_identifier:
+            self.app_identifier = self.get_cached_public_identifier()
+
+        if self.app_identifier and self.app_version != 'latest':
+            cached_app = self.get_cached_app(self.app_version)
+            if cached_app:
+                return cached_app
+
         application_for_download = self.get_version()
         if not application_for_download:
             Log.error('HockeyApp - Error while getting specified application version, exit')
             sys.exit(4)
+        self.downloaded_version = application_for_download['version']
 
         download_url = '{0}?format=apk'.format(application_for_download['download_url'].replace('/apps/', '/api/2/apps/'))
         Log.info('HockeyApp - Start download application {0} with version {1}'.format(
             self.app_identifier,
             application_for_download['version']))
 
-        response = requests.get(download_url, headers=self.auth_header, allow_redirects=True)
-        if response.status_code != 200:
-            Log.error('HockeyApp - Failed to download application. Request return status code: {0}'.format(response.status_code))
-            sys.exit(4)
-
         file_name = '{0}-{1}.apk'.format(self.app_identifier, application_for_download['version'])
-        path_to_save = os.path.join(self.download_path, file_name)
-
-        if not os.path.exists(self.download_path):
-            os.mkdir(self.download_path)
-
-        with open(path_to_save, 'wb') as file:
-            file.write(response.content)
-
-        Log.info('HockeyApp - Download application successfully completed to {0}'.format(path_to_save))
+        path_to_save = self.save_app(download_url, file_name, application_for_download['version'])
 
         return path_to_save
@@ -0,0 +1,38 @@
+import os
+
+try:
+    from .base import DistributionSystem
+except ImportError:
+    from stingray_cli.distribution_systems.base import DistributionSystem
+
+
+class LocalFile(DistributionSystem):
+    """
+    Application file already stored on local disk
+    """
+    name = 'file'
+    remote = False
+
+    def __init__(self, file_path):
+        super().__init__(file_path, None)
+
+    @classmethod
+    def add_arguments(cls, parser):
+        parser.add_argument('--file_path', type=str, help='Path to local apk file for analyze. This argument required if distribution system set to "file"')
+
+    @classmethod
+    def validate_arguments(cls, arguments):
+        if arguments.file_path is None:
+            return '"--distribution_system file" requires "--file_path" argument to be set'
+        return None
+
+    @classmethod
+    def from_arguments(cls, arguments, cache=None, metadata_cache=None):
+        return cls(arguments.file_path)
+
+    @property
+    def application_name(self):
+        return os.path.basename(self.app_identifier)
+
+    def download_app(self):
+        return self.app_identifier
@@ -0,0 +1,130 @@
+import json
+import hmac
+import ipaddress
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+try:
+    from .helpers.logging import Log
+    from .poller import scan_poller
+except ImportError:
+    from stingray_cli.helpers.logging import Log
+    from stingray_cli.poller import scan_poller
+
+_lock = threading.Lock()
+_listeners = {}
+EVENT_LISTEN_HOST = '127.0.0.1'
+
+
+def listen_address(address):
+    """
+    :param address: "<host>:<port>", ":<port>" or "http://<host>:<port>", loopback host is used if host is not set
+    :return: tuple (host, port)
+    """
+    url = urlsplit(address if '://' in address else f'http://{address}')
+    return url.hostname or EVENT_LISTEN_HOST, url.port or 0
+
+
+def is_loopback(address):
+    """
+    :return: True if listener on the address is reachable only from the host
+    """
+    host, _ = listen_address(address)
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def event_scan_ids(payload):
+    """
+    Ids of scans mentioned in event: {"scan_id": 1}, {"id": 1}, {"dast": {"id": 1}} or list of such events
+    :return: list of scan ids
+    """
+    if isinstance(payload, list):
+        return [scan_id for event in payload for scan_id in event_scan_ids(event)]
+    if not isinstance(payload, dict):
+        raise ValueError('Event must be json object or list of objects')
+
+    scan_id = payload.get('scan_id', payload.get('dast_id', payload.get('id')))
+    if scan_id is None and isinstance(payload.get('dast'), dict):
+        scan_id = payload['dast'].get('id')
+    if scan_id is None:
+        raise ValueError('Event has no scan id')
+    return [int(scan_id)]
+
+
+def notify_scans(payload):
+    """
+    Wake up watches of scans mentioned in event
+    :return: count of scans watched by this process
+    """
+    scan_ids = event_scan_ids(payload)
+    watched = sum(bool(scan_poller.notify(scan_id)) for scan_id in scan_ids)
+    Log.info(f"Scan state event received for scans {', '.join(map(str, scan_ids))}")
+    return watched
+
+
+class EventHandler(BaseHTTPRequestHandler):
+    """
+    Receiver of scan state events:
+        POST <any path> with event json, see event_scan_ids - check the scans now
+        GET /health - status of listener
+    If token is set, event must have "Authorization: Bearer <token>" header
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if urlsplit(self.path).path.rstrip('/') == '/health':
+            return self.send_json(200, {'status': 'ok'})
+        self.send_json(404, {'error': 'Not found'})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        token = self.server.token
+        if token and not hmac.compare_digest(self.headers.get('Authorization', ''), f'Bearer {token}'):
+            return self.send_json(401, {'error': 'Invalid token'})
+        try:
+            watched = notify_scans(json.loads(body or b'{}'))
+        except (ValueError, TypeError) as e:
+            return self.send_json(400, {'error': str(e)})
+        self.send_json(202, {'watched': watched})
+
+    def send_json(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_event_listener(address, token=None):
+    """
+    Start listener of scan state events in background thread. Listener is started once for every address,
+    so all scans of the process share it
+    :param address: "<host>:<port>" or "http://<host>:<port>", listener is bound to loopback if host is not set
+    :param token: token required in Authorization header of events, required if listener is reachable from network
+    :return: http server
+    """
+    if not token and not is_loopback(address):
+        raise ValueError(f'Token of events is required to listen on non-loopback address {address}')
+
+    with _lock:
+        if address in _listeners:
+            return _listeners[address]
+
+        server = ThreadingHTTPServer(listen_address(address), EventHandler)
+        server.daemon_threads = True
+        server.token = token
+        threading.Thread(target=server.serve_forever, name='event-listener', daemon=True).start()
+        _listeners[address] = server
+
+    Log.info(f'Listening for scan state events on {server.server_address[0]}:{server.server_address[1]}')
+    return server
@@ -0,0 +1,287 @@
+import re
+import mmap
+import zlib
+import struct
+import hashlib
+import plistlib
+
+EOCD_SIGNATURE = b'PK\x05\x06'
+EOCD = struct.Struct('<4sHHHHIIH')
+ZIP64_LOCATOR_SIGNATURE = b'PK\x06\x07'
+ZIP64_LOCATOR = struct.Struct('<4sIQI')
+ZIP64_EOCD_SIGNATURE = b'PK\x06\x06'
+ZIP64_EOCD = struct.Struct('<4sQHHIIQQQQ')
+CENTRAL_DIRECTORY_SIGNATURE = b'PK\x01\x02'
+CENTRAL_DIRECTORY_ENTRY = struct.Struct('<4sHHHHHHIIIHHHHHII')
+LOCAL_HEADER_SIGNATURE = b'PK\x03\x04'
+LOCAL_HEADER = struct.Struct('<4sHHHHHIIIHH')
+APK_SIGNING_BLOCK_MAGIC = b'APK Sig Block 42'
+# EOCD is followed by comment of at most 65535 bytes
+EOCD_SEARCH_SIZE = EOCD.size + 0xFFFF
+
+ANDROID_MANIFEST = 'AndroidManifest.xml'
+IOS_INFO_PLIST = re.compile(r'^Payload/[^/]+\.app/Info\.plist$')
+MAX_MANIFEST_SIZE = 16 * 1024 * 1024
+
+# Binary XML chunks and values, see ResourceTypes.h of Android framework
+AXML_FILE = 0x0003
+AXML_STRING_POOL = 0x0001
+AXML_RESOURCE_MAP = 0x0180
+AXML_START_ELEMENT = 0x0102
+AXML_UTF8_FLAG = 0x100
+AXML_TYPE_STRING = 0x03
+AXML_TYPE_INT_DEC = 0x10
+AXML_TYPE_INT_HEX = 0x11
+AXML_NO_INDEX = 0xFFFFFFFF
+ANDROID_VERSION_CODE = 0x0101021b
+ANDROID_VERSION_NAME = 0x0101021c
+
+
+class ApkError(Exception):
+    """
+    File is not a valid application: not a zip archive, archive is truncated or has no manifest
+    """
+
+
+def inspect_apk(path):
+    """
+    Read package name, version and fingerprint of application without unpacking it.
+    Only end of central directory, central directory and manifest are read from memory-mapped file.
+    Both Android (apk) and iOS (ipa) applications are supported
+    :param path: path to application file
+    :return: dict with "type", "package", "version_code", "version_name", "fingerprint" and "entries"
+    """
+    try:
+        with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return _inspect(data)
+    except ValueError:
+        # mmap of empty file
+        raise ApkError('file is empty')
+    except OSError as e:
+        raise ApkError(f'unable to read file: {e}')
+
+
+def _inspect(data):
+    cd_offset, cd_size, entries_count = _find_central_directory(data)
+    entries = _read_central_directory(data, cd_offset, cd_size, entries_count)
+
+    if ANDROID_MANIFEST in entries:
+        manifest = parse_manifest(_read_entry(data, ANDROID_MANIFEST, entries[ANDROID_MANIFEST]))
+        info = {'type': 'apk', **manifest}
+    else:
+        plist_name = next((name for name in entries if IOS_INFO_PLIST.match(name)), None)
+        if plist_name is None:
+            raise ApkError(f'neither {ANDROID_MANIFEST} nor iOS Info.plist found in archive')
+        info = {'type': 'ipa', **parse_info_plist(_read_entry(data, plist_name, entries[plist_name]))}
+
+    info['fingerprint'] = _fingerprint(data, cd_offset)
+    info['entries'] = len(entries)
+    return info
+
+
+def _find_central_directory(data):
+    """
+    :return: tuple (offset, size, count of entries) of central directory
+    """
+    eocd_position = data.rfind(EOCD_SIGNATURE, max(0, len(data) - EOCD_SEARCH_SIZE))
+    if eocd_position < 0 or eocd_position + EOCD.size > len(data):
+        raise ApkError('not a zip archive: end of central directory not found')
+    _, _, _, _, entries_count, cd_size, cd_offset, _ = EOCD.unpack_from(data, eocd_position)
+
+    if 0xFFFFFFFF in (cd_size, cd_offset) or entries_count == 0xFFFF:
+        locator_position = eocd_position - ZIP64_LOCATOR.size
+        if locator_position < 0 or data[locator_position:locator_position + 4] != ZIP64_LOCATOR_SIGNATURE:
+            raise ApkError('zip64 end of central directory locator not found')
+        zip64_eocd_position = ZIP64_LOCATOR.unpack_from(data, locator_position)[2]
+        if data[zip64_eocd_position:zip64_eocd_position + 4] != ZIP64_EOCD_SIGNATURE:
+            raise ApkError('zip64 end of central directory not found')
+        entries_count, cd_size, cd_offset = ZIP64_EOCD.unpack_from(data, zip64_eocd_position)[7:10]
+
+    if cd_offset + cd_size > eocd_position:
+        raise ApkError('central directory is out of file bounds, file is truncated')
+    return cd_offset, cd_size, entries_count
+
+
+def _zip64_values(extra, values):
+    """
+    Replace values overflowed in central directory entry (0xFFFFFFFF) with values from zip64 extra field
+    :param values: list of uncompressed size, compressed size and local header offset
+    """
+    position = 0
+    while position + 4 <= len(extra):
+        header_id, size = struct.unpack_from('<HH', extra, position)
+        if header_id == 0x0001:
+            field_position = position + 4
+            for index, value in enumerate(values):
+                if value == 0xFFFFFFFF:
+                    values[index] = struct.unpack_from('<Q', extra, field_position)[0]
+                    field_position += 8
+            break
+        position += 4 + size
+    return values
+
+
+def _read_central_directory(data, cd_offset, cd_size, entries_count):
+    """
+    :return: dict {name: (compression method, crc32, compressed size, uncompressed size, local header offset)}
+    """
+    entries = {}
+    position, end = cd_offset, cd_offset + cd_size
+    for _ in range(entries_count):
+        if position + CENTRAL_DIRECTORY_ENTRY.size > end or \
+                data[position:position + 4] != CENTRAL_DIRECTORY_SIGNATURE:
+            raise ApkError('central directory is corrupted')
+        (_, _, _, flags, method, _, _, crc, compressed_size, size, name_length, extra_length, comment_length,
+         _, _, _, local_offset) = CENTRAL_DIRECTORY_ENTRY.unpack_from(data, position)
+        name_position = position + CENTRAL_DIRECTORY_ENTRY.size
+        name = data[name_position:name_position + name_length].decode('utf-8' if flags & 0x800 else 'cp437')
+        extra = data[name_position + name_length:name_position + name_length + extra_length]
+        size, compressed_size, local_offset = _zip64_values(extra, [size, compressed_size, local_offset])
+        entries[name] = (method, crc, compressed_size, size, local_offset)
+        position = name_position + name_length + extra_length + comment_length
+    return entries
+
+
+def _read_entry(data, name, entry):
+    """
+    Read and decompress single entry of archive
+    :return: bytes
+    """
+    method, crc, compressed_size, size, local_offset = entry
+    if size > MAX_MANIFEST_SIZE:
+        raise ApkError(f'{name} is too large: {size} bytes')
+    if data[local_offset:local_offset + 4] != LOCAL_HEADER_SIGNATURE:
+        raise ApkError(f'local header of {name} not found')
+    name_length, extra_length = LOCAL_HEADER.unpack_from(data, local_offset)[9:11]
+    data_position = local_offset + LOCAL_HEADER.size + name_length + extra_length
+    compressed = data[data_position:data_position + compressed_size]
+    if len(compressed) != compressed_size:
+        raise ApkError(f'{name} is out of file bounds, file is truncated')
+
+    try:
+        if method == 0:
+            content = compressed
+        elif method == 8:
+            content = zlib.decompress(compressed, -zlib.MAX_WBITS)
+        else:
+            raise ApkError(f'{name} is compressed with unsupported method {method}')
+    except zlib.error as e:
+        raise ApkError(f'{name} is corrupted: {e}')
+    if zlib.crc32(content) != crc:
+        raise ApkError(f'{name} is corrupted: checksum mismatch')
+    return content
+
+
+def _fingerprint(data, cd_offset):
+    """
+    Stable identifier of application content: SHA-256 of APK signing block (if any), central directory
+    and end of central directory. Central directory holds CRC-32 and size of every file in archive
+    and signing block holds digests of the whole content, so reading them is enough to distinguish applications
+    """
+    start = cd_offset
+    if cd_offset >= 24 and data[cd_offset - 16:cd_offset] == APK_SIGNING_BLOCK_MAGIC:
+        block_size = struct.unpack_from('<Q', data, cd_offset - 24)[0]
+        if block_size + 8 <= cd_offset:
+            start = cd_offset - block_size - 8
+    hasher = hashlib.sha256(str(len(data)).encode())
+    hasher.update(data[start:])
+    return hasher.hexdigest()
+
+
+def _axml_string_pool(manifest, position):
+    """
+    :return: function returning string of pool by index
+    """
+    header_size, _, count, _, flags, strings_start = struct.unpack_from('<HIIIII', manifest, position + 2)
+    offsets = struct.unpack_from(f'<{count}I', manifest, position + header_size)
+    strings_position = position + strings_start
+
+    def get(index):
+        if index == AXML_NO_INDEX or index >= count:
+            return None
+        offset = strings_position + offsets[index]
+        if flags & AXML_UTF8_FLAG:
+            # length in characters, then length in bytes, each is 1 or 2 bytes
+            offset += 2 if manifest[offset] & 0x80 else 1
+            length = manifest[offset]
+            if length & 0x80:
+                length = ((length & 0x7F) << 8) | manifest[offset + 1]
+                offset += 1
+            return manifest[offset + 1:offset + 1 + length].decode('utf-8', 'replace')
+        length = struct.unpack_from('<H', manifest, offset)[0]
+        if length & 0x8000:
+            length = ((length & 0x7FFF) << 16) | struct.unpack_from('<H', manifest, offset + 2)[0]
+            offset += 2
+        return manifest[offset + 2:offset + 2 + length * 2].decode('utf-16-le', 'replace')
+
+    return get
+
+
+def parse_manifest(manifest):
+    """
+    Read package name and version from attributes of root element of binary AndroidManifest.xml
+    :return: dict with "package", "version_code" and "version_name"
+    """
+    try:
+        file_type, _, file_size = struct.unpack_from('<HHI', manifest, 0)
+        if file_type != AXML_FILE:
+            raise ApkError(f'{ANDROID_MANIFEST} is not a binary xml')
+
+        get_string, resource_ids = None, ()
+        position = 8
+        while position + 8 <= min(file_size, len(manifest)):
+            chunk_type, header_size, chunk_size = struct.unpack_from('<HHI', manifest, position)
+            if chunk_size < 8:
+                break
+            if chunk_type == AXML_STRING_POOL:
+                get_string = _axml_string_pool(manifest, position)
+            elif chunk_type == AXML_RESOURCE_MAP:
+                resource_ids = struct.unpack_from(f'<{(chunk_size - header_size) // 4}I', manifest,
+                                                  position + header_size)
+            elif chunk_type == AXML_START_ELEMENT and get_string:
+                return _manifest_attributes(manifest, position, get_string, resource_ids)
+            position += chunk_size
+    except struct.error as e:
+        raise ApkError(f'{ANDROID_MANIFEST} is corrupted: {e}')
+    raise ApkError(f'{ANDROID_MANIFEST} has no manifest element')
+
+
+def _manifest_attributes(manifest, position, get_string, resource_ids):
+    _, name, attribute_start, attribute_size, attribute_count = struct.unpack_from('<IIHHH', manifest, position + 16)
+    if get_string(name) != 'manifest':
+        raise ApkError(f'root element of {ANDROID_MANIFEST} is "{get_string(name)}", not "manifest"')
+
+    info = {'package': None, 'version_code': None, 'version_name': None}
+    attribute_position = position + 16 + attribute_start
+    for _ in range(attribute_count):
+        _, name, raw_value, _, _, value_type, value = struct.unpack_from('<IIIHBBI', manifest, attribute_position)
+        attribute_position += attribute_size
+        # attribute names may be obfuscated, so android attributes are identified by resource id
+        resource_id = resource_ids[name] if name < len(resource_ids) else None
+        if value_type == AXML_TYPE_STRING:
+            value = get_string(value)
+        elif value_type not in (AXML_TYPE_INT_DEC, AXML_TYPE_INT_HEX):
+            # reference to resource can not be resolved without resources.arsc
+            value = get_string(raw_value)
+
+        if resource_id == ANDROID_VERSION_CODE:
+            info['version_code'] = int(value) if isinstance(value, int) or (value or '').isdigit() else None
+        elif resource_id == ANDROID_VERSION_NAME:
+            info['version_name'] = None if value is None else str(value)
+        elif resource_id is None and get_string(name) == 'package':
+            info['package'] = value
+    return info
+
+
+def parse_info_plist(content):
+    """
+    Read bundle identifier and version from Info.plist of iOS application
+    :return: dict with "package", "version_code" and "version_name"
+    """
+    try:
+        plist = plistlib.loads(content)
+    except Exception as e:
+        raise ApkError(f'Info.plist is corrupted: {e}')
+    return {'package': plist.get('CFBundleIdentifier'),
+            'version_code': plist.get('CFBundleVersion'),
+            'version_name': plist.get('CFBundleShortVersionString')}
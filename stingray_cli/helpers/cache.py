@@ -0,0 +1,211 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+
+try:
+    from .const import APK_CACHE_MAX_SIZE_MB, METADATA_TTL
+    from .helpers import atomic_write_json, file_lock, temp_path
+    from .logging import Log
+except ImportError:
+    from stingray_cli.helpers.const import APK_CACHE_MAX_SIZE_MB, METADATA_TTL
+    from stingray_cli.helpers.helpers import atomic_write_json, file_lock, temp_path
+    from stingray_cli.helpers.logging import Log
+
+
+class ApkCache:
+    """
+    Content-addressed storage of downloaded applications shared between runs and processes on the same host.
+    Every file is stored once under its SHA-256, key (distribution system, application, version) points to the hash.
+    Least recently used files are evicted when total size exceeds the limit
+    """
+
+    def __init__(self, path, max_size_mb=APK_CACHE_MAX_SIZE_MB):
+        self.path = path
+        self.max_size = max_size_mb * 1024 * 1024
+        self.blobs_path = os.path.join(path, 'blobs')
+        self.keys_path = os.path.join(path, 'keys')
+
+        os.makedirs(self.blobs_path, exist_ok=True)
+        os.makedirs(self.keys_path, exist_ok=True)
+
+    @staticmethod
+    def make_key(*parts):
+        return '/'.join(str(part) for part in parts)
+
+    def _key_path(self, key):
+        return os.path.join(self.keys_path, hashlib.sha1(key.encode()).hexdigest() + '.json')
+
+    def _blob_path(self, sha256):
+        return os.path.join(self.blobs_path, sha256 + '.apk')
+
+    def lock(self, key):
+        """
+        Lock the key for all processes, so only one of them downloads the same application
+        """
+        return file_lock(self._key_path(key) + '.lock')
+
+    def get(self, key):
+        """
+        Find cached application by key and mark it as recently used
+        :return: dict with "sha256", "size" and "file_name" or None if application is not cached
+        """
+        try:
+            with open(self._key_path(key)) as fp:
+                entry = json.load(fp)
+            os.utime(self._blob_path(entry['sha256']))
+        except (OSError, ValueError, KeyError):
+            return None
+        return entry
+
+    def fetch(self, key, directory):
+        """
+        Place cached application into directory without copying its content
+        :return: tuple (path, sha256) or None if application is not cached
+        """
+        entry = self.get(key)
+        if not entry:
+            return None
+
+        path = os.path.join(directory, entry['file_name'])
+        os.makedirs(directory, exist_ok=True)
+        try:
+            _link(self._blob_path(entry['sha256']), path)
+        except FileNotFoundError:
+            # evicted by another process right now
+            return None
+
+        Log.info(f'Application {key} found in cache: {path}')
+        return path, entry['sha256']
+
+    def put(self, key, path, sha256):
+        """
+        Store downloaded application in cache and evict old ones if cache is full
+        """
+        blob_path = self._blob_path(sha256)
+        if not os.path.exists(blob_path):
+            _link(path, blob_path)
+
+        atomic_write_json(self._key_path(key), {
+            'key': key,
+            'sha256': sha256,
+            'size': os.path.getsize(blob_path),
+            'file_name': os.path.basename(path)
+        })
+        self.evict()
+
+    def evict(self):
+        """
+        Remove least recently used applications until cache size is below the limit
+        """
+        with file_lock(os.path.join(self.path, 'evict.lock')):
+            blobs = []
+            for entry in os.scandir(self.blobs_path):
+                if not entry.name.endswith('.apk'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                blobs.append((stat.st_mtime, stat.st_size, entry.path))
+
+            total_size = sum(size for _, size, _ in blobs)
+            for _, size, blob_path in sorted(blobs):
+                if total_size <= self.max_size:
+                    break
+                Log.info(f'Remove {blob_path} from application cache')
+                try:
+                    os.remove(blob_path)
+                except FileNotFoundError:
+                    pass
+                total_size -= size
+
+
+def _link(source, destination):
+    """
+    Atomically place hard link (or copy, if hard link is not possible) of source file to destination
+    """
+    tmp = temp_path(destination)
+    try:
+        os.link(source, tmp)
+    except FileNotFoundError:
+        raise
+    except OSError:
+        shutil.copyfile(source, tmp)
+    os.replace(tmp, destination)
+    if os.path.lexists(tmp):
+        # rename does nothing when both names are already links to the same file
+        os.remove(tmp)
+
+
+class MetadataCache:
+    """
+    Persistent cache of distribution systems metadata shared between runs and processes on the same host.
+    Entry keeps value with time of update and validators of http response (ETag, Last-Modified),
+    so unchanged data can be revalidated with conditional request
+    """
+
+    def __init__(self, path, ttl=METADATA_TTL):
+        """
+        :param path: cache directory
+        :param ttl: lifetime in seconds of entries which can not be revalidated
+        """
+        self.path = path
+        self.ttl = ttl
+        os.makedirs(path, exist_ok=True)
+
+    def _key_path(self, key):
+        return os.path.join(self.path, hashlib.sha1(key.encode()).hexdigest() + '.json')
+
+    def get(self, key, ttl=None):
+        """
+        :param key: key of entry
+        :param ttl: maximum age of entry in seconds, any age if not set
+        :return: dict with "value", "updated_at", "etag" and "last_modified" or None if entry not found or expired
+        """
+        try:
+            with open(self._key_path(key)) as fp:
+                entry = json.load(fp)
+        except (OSError, ValueError):
+            return None
+
+        if ttl is not None and time.time() - entry.get('updated_at', 0) > ttl:
+            return None
+        return entry
+
+    def put(self, key, value, response=None):
+        """
+        Store value and validators of response it was received from
+        """
+        headers = response.headers if response is not None else {}
+        atomic_write_json(self._key_path(key), {
+            'key': key,
+            'value': value,
+            'updated_at': time.time(),
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified')
+        })
+
+    def invalidate(self, key=None):
+        """
+        Remove entry by key or all entries if key is not set
+        """
+        paths = [self._key_path(key)] if key else [entry.path for entry in os.scandir(self.path)]
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def conditional_headers(entry):
+        """
+        Headers of conditional request revalidating cached entry
+        """
+        headers = {}
+        if entry and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry and entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
@@ -17,3 +17,63 @@ DastStateDict = {
 
 TRY_COUNT = 60
 SLEEP_TIMEOUT = 30
+SCAN_TIMEOUT = 2 * TRY_COUNT * SLEEP_TIMEOUT
+
+# (first interval, max interval) in seconds between scan state checks, interval grows while state is not changed
+POLL_INTERVALS = {
+    DastState.CREATED: (2, 10),
+    DastState.STARTING: (2, 10),
+    DastState.STARTED: (5, 30),
+    DastState.ANALYZING: (10, 60),
+}
+POLL_BACKOFF = 1.5
+POLL_JITTER = 0.1
+EVENT_POLL_INTERVAL = 300
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_RETRY_COUNT = 5
+PARTIAL_DOWNLOAD_SUFFIX = '.part'
+# ETag or Last-Modified of remote file saved next to partial file to resume download only of the same file
+PARTIAL_VALIDATOR_SUFFIX = '.validator'
+DOWNLOAD_SEGMENTS = 1
+DOWNLOAD_MIN_SEGMENT_SIZE = 4 * 1024 * 1024
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+UPLOAD_PROGRESS_INTERVAL = 10
+
+APK_CACHE_MAX_SIZE_MB = 5120
+METADATA_TTL = 600
+
+BATCH_WORKERS = 8
+
+ARCHITECTURES_TTL = 300
+
+SERVE_HOST = '127.0.0.1'
+SERVE_PORT = 8642
+SERVE_WORKERS = 8
+SERVE_JOB_TTL = 24 * 60 * 60
+SERVE_MAX_WAIT = 60
+SERVE_PENDING_EXIT_CODE = 75
+
+HTTP_POOL_SIZE = 10
+HTTP_RETRIES = 3
+HTTP_BACKOFF = 1
+HTTP_CONNECT_TIMEOUT = 10
+HTTP_READ_TIMEOUT = 300
+HTTP_RETRY_STATUSES = (500, 502, 503, 504)
+
+RATE_LIMIT = 10
+RATE_LIMIT_BURST = 20
+RATE_LIMIT_HEAVY_CONCURRENCY = 2
+RATE_LIMIT_RETRIES = 5
+RATE_LIMIT_STATUSES = (429, 503)
+RATE_LIMIT_MAX_DELAY = 300
+# seconds of pauses requested by server in Retry-After which are honoured for one request before it fails
+RATE_LIMIT_MAX_WAIT = 900
+# rate of host is multiplied by decrease when server answers 429 or 503 and grows back by recovery every second
+RATE_LIMIT_DECREASE = 0.5
+RATE_LIMIT_MIN_FACTOR = 0.05
+RATE_LIMIT_RECOVERY = 0.02
+
+METRICS_PREFIX = 'stingray_cli'
+HTTP_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
@@ -0,0 +1,266 @@
+import hashlib
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+try:
+    from .const import DOWNLOAD_CHUNK_SIZE, DOWNLOAD_RETRY_COUNT, PARTIAL_DOWNLOAD_SUFFIX, PARTIAL_VALIDATOR_SUFFIX, \
+        DOWNLOAD_MIN_SEGMENT_SIZE
+    from .logging import Log
+    from .http import get_session
+    from .helpers import temp_path
+    from .metrics import metrics
+except ImportError:
+    from stingray_cli.helpers.const import DOWNLOAD_CHUNK_SIZE, DOWNLOAD_RETRY_COUNT, PARTIAL_DOWNLOAD_SUFFIX, \
+        PARTIAL_VALIDATOR_SUFFIX, DOWNLOAD_MIN_SEGMENT_SIZE
+    from stingray_cli.helpers.logging import Log
+    from stingray_cli.helpers.http import get_session
+    from stingray_cli.helpers.helpers import temp_path
+    from stingray_cli.helpers.metrics import metrics
+
+
+class DownloadError(Exception):
+    """
+    File can not be downloaded: server answered with unexpected status code or all attempts failed
+    """
+
+
+def hash_file(path, hasher=None, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    """
+    Feed content of the file to hasher chunk by chunk
+    :param path: path to the file
+    :param hasher: hashlib object, sha256 by default
+    :return: hashlib object
+    """
+    hasher = hasher or hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            hasher.update(chunk)
+    return hasher
+
+
+def write_response(response, file, hasher=None, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    """
+    Write body of the streamed response to opened file. Only one chunk is kept in memory at a time
+    :param response: response of request made with stream=True
+    :param file: file opened for binary writing
+    :param hasher: optional hashlib object updated with every written chunk
+    :return: count of written bytes
+    """
+    written = 0
+    for chunk in response.iter_content(chunk_size=chunk_size):
+        if not chunk:
+            continue
+        file.write(chunk)
+        if hasher is not None:
+            hasher.update(chunk)
+        written += len(chunk)
+    return written
+
+
+def download_file(url, path, headers=None, retry_count=DOWNLOAD_RETRY_COUNT, session=None):
+    """
+    Stream file from url to disk and calculate its SHA-256 on the fly.
+    Data is written to "<path>.part" until download is completed, so download interrupted
+    by network error is resumed with HTTP Range request by the next attempt or by the next run.
+    Download is resumed only if remote file has the same ETag or Last-Modified (If-Range),
+    otherwise server sends the whole file and download starts from scratch
+    :param url: url to download
+    :param path: path to save file
+    :param headers: additional request headers
+    :param retry_count: count of attempts before fail
+    :param session: http session, shared session by default
+    :return: tuple (path to downloaded file, sha256 hex digest)
+    """
+    session = session or get_session()
+    partial_path = path + PARTIAL_DOWNLOAD_SUFFIX
+    for attempt in range(1, retry_count + 1):
+        try:
+            return _download(session, url, path, partial_path, headers or {})
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+            Log.error(f'Download interrupted: {e}. Attempt {attempt} of {retry_count}')
+            if attempt < retry_count:
+                time.sleep(min(2 ** attempt, 30))
+
+    raise DownloadError(f'Download failed after {retry_count} attempts')
+
+
+def _download(session, url, path, partial_path, headers):
+    validator_path = partial_path + PARTIAL_VALIDATOR_SUFFIX
+    offset = os.path.getsize(partial_path) if os.path.exists(partial_path) else 0
+    validator = _read_validator(validator_path) if offset else None
+    if offset and validator is None:
+        Log.info(f'Partial file {partial_path} can not be checked against remote file, start download from scratch')
+        offset = 0
+
+    request_headers = dict(headers)
+    if offset:
+        request_headers['Range'] = f'bytes={offset}-'
+        request_headers['If-Range'] = validator
+
+    with session.get(url, headers=request_headers, stream=True, allow_redirects=True) as response:
+        if offset and (response.status_code == 416 or
+                       response.status_code == 206 and _range_start(response) != offset):
+            Log.info(f'Partial file {partial_path} does not match remote file, start download from scratch')
+            os.remove(partial_path)
+            return _download(session, url, path, partial_path, headers)
+
+        if response.status_code not in (200, 206):
+            raise DownloadError(f'Request return status code: {response.status_code}')
+
+        hasher = hashlib.sha256()
+        if response.status_code == 206:
+            Log.info(f'Resume download of {path} from byte {offset}')
+            hash_file(partial_path, hasher)
+            mode = 'ab'
+        else:
+            if offset:
+                Log.info(f'Remote file is changed since partial file {partial_path} was saved, download it from scratch')
+            _write_validator(validator_path, _validator(response))
+            mode = 'wb'
+
+        with open(partial_path, mode) as file:
+            metrics.add_bytes('download', write_response(response, file, hasher))
+
+    os.replace(partial_path, path)
+    _write_validator(validator_path, None)
+    return path, hasher.hexdigest()
+
+
+def _validator(response):
+    """
+    :return: strong ETag or Last-Modified of response usable in If-Range header, None if server sent neither
+    """
+    etag = response.headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return response.headers.get('Last-Modified')
+
+
+def _read_validator(path):
+    try:
+        with open(path) as file:
+            return file.read().strip() or None
+    except OSError:
+        return None
+
+
+def _write_validator(path, validator):
+    """
+    Save validator of partial file, or remove it if partial file can not be resumed safely
+    """
+    if validator is None:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    with open(path, 'w') as file:
+        file.write(validator)
+
+
+def download_file_segmented(url, path, segments, headers=None, retry_count=DOWNLOAD_RETRY_COUNT, session=None):
+    """
+    Download file by several byte ranges in parallel connections into preallocated file.
+    Falls back to single stream download if server does not support ranges or file is too small to split
+    :param url: url to download
+    :param path: path to save file
+    :param segments: maximum count of parallel connections
+    :param headers: additional request headers
+    :param retry_count: count of attempts for every segment before fail
+    :param session: http session, shared session by default
+    :return: tuple (path to downloaded file, sha256 hex digest)
+    """
+    session = session or get_session()
+    headers = headers or {}
+    url, size, validator = _probe_ranges(session, url, headers)
+    if size is None or size < 2 * DOWNLOAD_MIN_SEGMENT_SIZE:
+        Log.info('Server does not support range requests or file is too small, download file in single stream')
+        return download_file(url, path, headers, retry_count, session)
+
+    segments = min(segments, size // DOWNLOAD_MIN_SEGMENT_SIZE)
+    segment_size = -(-size // segments)
+    ranges = [(start, min(start + segment_size, size) - 1) for start in range(0, size, segment_size)]
+    Log.info(f'Download {size} bytes in {len(ranges)} parallel segments')
+
+    tmp = temp_path(path)
+    fd = os.open(tmp, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        if hasattr(os, 'posix_fallocate'):
+            os.posix_fallocate(fd, 0, size)
+        else:
+            os.ftruncate(fd, size)
+
+        with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+            # segments fail instead of mixing parts of different files if remote file is changed meanwhile
+            range_headers = {**headers, 'If-Range': validator} if validator else headers
+            futures = [executor.submit(_download_range, session, url, range_headers, fd, start, end, retry_count)
+                       for start, end in ranges]
+            for future in futures:
+                future.result()
+    except BaseException:
+        os.close(fd)
+        os.remove(tmp)
+        raise
+    os.close(fd)
+
+    if os.path.getsize(tmp) != size:
+        os.remove(tmp)
+        raise DownloadError(f'Size of downloaded file does not match expected size {size}')
+
+    sha256 = hash_file(tmp).hexdigest()
+    os.replace(tmp, path)
+    return path, sha256
+
+
+def _probe_ranges(session, url, headers):
+    """
+    Request the first byte of file to find out if server supports ranges
+    :return: tuple (final url after redirects, file size or None if ranges are not supported,
+             ETag or Last-Modified of file or None)
+    """
+    with session.get(url, headers={**headers, 'Range': 'bytes=0-0'}, stream=True, allow_redirects=True) as response:
+        if response.status_code != 206:
+            return url, None, None
+        match = re.match(r'bytes 0-0/(\d+)', response.headers.get('Content-Range', ''))
+        return response.url, int(match.group(1)) if match else None, _validator(response)
+
+
+def _download_range(session, url, headers, fd, start, end, retry_count):
+    """
+    Download bytes from start to end (inclusive) and write them to the same offset of file.
+    Interrupted segment is continued from the last received byte
+    """
+    position = start
+    for attempt in range(1, retry_count + 1):
+        try:
+            with session.get(url, headers={**headers, 'Range': f'bytes={position}-{end}'}, stream=True) as response:
+                if response.status_code != 206 or _range_start(response) != position:
+                    raise DownloadError(f'Unexpected response for range {position}-{end}, '
+                                        f'status code: {response.status_code}')
+                received_from = position
+                try:
+                    for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                        if not chunk:
+                            continue
+                        os.pwrite(fd, chunk, position)
+                        position += len(chunk)
+                finally:
+                    metrics.add_bytes('download', position - received_from)
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+            Log.error(f'Download of range {position}-{end} interrupted: {e}. Attempt {attempt} of {retry_count}')
+            if attempt < retry_count:
+                time.sleep(min(2 ** attempt, 30))
+            continue
+
+        if position != end + 1:
+            raise DownloadError(f'Range {start}-{end} is incomplete, received up to byte {position}')
+        return
+
+    raise DownloadError(f'Download of range {start}-{end} failed after {retry_count} attempts')
+
+
+def _range_start(response):
+    match = re.match(r'bytes (\d+)-', response.headers.get('Content-Range', ''))
+    return int(match.group(1)) if match else None
@@ -1,6 +1,59 @@
 import os
+import json
+import fcntl
+import threading
+from contextlib import contextmanager
+
 
 def get_app_path(test_app_path):
     my_path = os.path.abspath(os.path.dirname(__file__))
     path = os.path.join(my_path, test_app_path)
     return path
+
+
+def get_cache_dir(*parts):
+    """
+    Path inside the user cache directory shared by all stingray_cli runs on the host
+    :param parts: path components inside cache directory
+    :return: path
+    """
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'stingray_cli', *parts)
+
+
+def temp_path(path):
+    """
+    Unique name of temporary file next to the path, used for atomic replace
+    """
+    return '{0}.{1}-{2}.tmp'.format(path, os.getpid(), threading.get_ident())
+
+
+def atomic_write_json(path, data, indent=None):
+    """
+    Write json to temporary file and rename it, so concurrent readers never see partially written file
+    """
+    atomic_write_text(path, json.dumps(data, indent=indent))
+
+
+def atomic_write_text(path, text):
+    """
+    Write text to temporary file and rename it, so concurrent readers never see partially written file
+    """
+    tmp = temp_path(path)
+    with open(tmp, 'w') as fp:
+        fp.write(text)
+    os.replace(tmp, path)
+
+
+@contextmanager
+def file_lock(path):
+    """
+    Exclusive advisory lock shared between processes of the same host
+    :param path: path to lock file, created if not exists
+    """
+    with open(path, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
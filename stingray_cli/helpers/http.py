@@ -0,0 +1,149 @@
+import threading
+import contextlib
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    from .const import HTTP_POOL_SIZE, HTTP_RETRIES, HTTP_BACKOFF, HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, \
+        HTTP_RETRY_STATUSES, RATE_LIMIT, RATE_LIMIT_BURST, RATE_LIMIT_HEAVY_CONCURRENCY, RATE_LIMIT_RETRIES, \
+        RATE_LIMIT_STATUSES, RATE_LIMIT_MAX_WAIT
+    from .logging import Log
+    from .metrics import metrics
+    from .ratelimit import RateLimiter, retry_after
+except ImportError:
+    from stingray_cli.helpers.const import HTTP_POOL_SIZE, HTTP_RETRIES, HTTP_BACKOFF, HTTP_CONNECT_TIMEOUT, \
+        HTTP_READ_TIMEOUT, HTTP_RETRY_STATUSES, RATE_LIMIT, RATE_LIMIT_BURST, RATE_LIMIT_HEAVY_CONCURRENCY, \
+        RATE_LIMIT_RETRIES, RATE_LIMIT_STATUSES, RATE_LIMIT_MAX_WAIT
+    from stingray_cli.helpers.logging import Log
+    from stingray_cli.helpers.metrics import metrics
+    from stingray_cli.helpers.ratelimit import RateLimiter, retry_after
+
+
+class Session(requests.Session):
+    """
+    Session with default timeout for every request.
+    Requests are scheduled by rate limiter, and requests answered with 429 or 503 are repeated after delay
+    requested by server, so bursts of requests from many scans do not fail them. Retries after Retry-After
+    requested by server are limited by total wait time, other retries by count
+    """
+
+    def __init__(self, timeout, rate_limiter=None, rate_limit_retries=RATE_LIMIT_RETRIES):
+        super().__init__()
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter
+        self.rate_limit_retries = rate_limit_retries
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        if self.rate_limiter is None:
+            return super().request(method, url, **kwargs)
+
+        # 429 means request is not processed, but 503 may be sent by proxy after server accepted the request,
+        # so non-idempotent requests, e.g. creation of scan, are not repeated after 503 to avoid duplicates
+        statuses = RATE_LIMIT_STATUSES if method.upper() in Retry.DEFAULT_ALLOWED_METHODS else (429,)
+        attempt, waited = 0, 0
+        while True:
+            slot = contextlib.ExitStack()
+            slot.enter_context(self.rate_limiter.slot(method, url))
+            try:
+                response = super().request(method, url, **kwargs)
+            except BaseException:
+                slot.close()
+                raise
+
+            requested = 'Retry-After' in response.headers
+            if response.status_code not in statuses or attempt >= self.rate_limit_retries or \
+                    requested and waited >= RATE_LIMIT_MAX_WAIT:
+                if kwargs.get('stream'):
+                    # body of streamed response is read after return, slot of heavy request is held until it is closed
+                    self._release_on_close(response, slot)
+                else:
+                    slot.close()
+                return response
+
+            slot.close()
+            delay = retry_after(response, HTTP_BACKOFF * 2 ** attempt)
+            if requested:
+                waited += delay
+            else:
+                attempt += 1
+            Log.info(f'Server answered {response.status_code} to {method} {url}, retry in {delay:.1f} seconds')
+            response.close()
+            self.rate_limiter.pause(url, delay)
+
+    @staticmethod
+    def _release_on_close(response, slot):
+        close = response.close
+
+        def release():
+            try:
+                close()
+            finally:
+                slot.close()
+
+        response.close = release
+
+
+def create_session(pool_size=HTTP_POOL_SIZE, retries=HTTP_RETRIES, backoff=HTTP_BACKOFF, timeout=HTTP_READ_TIMEOUT,
+                   rate_limit=RATE_LIMIT, rate_limit_burst=RATE_LIMIT_BURST,
+                   heavy_concurrency=RATE_LIMIT_HEAVY_CONCURRENCY, rate_limit_dir=None):
+    """
+    Create session keeping connections alive in pool and retrying idempotent requests
+    after connection errors and 5xx responses with exponential backoff.
+    Requests to Stingray are limited by rate and count of concurrent heavy requests, see RateLimiter.
+    Every response is recorded in metrics
+    :param pool_size: count of connections kept alive for every host
+    :param retries: count of retries of failed request
+    :param backoff: backoff factor between retries in seconds
+    :param timeout: read timeout in seconds
+    :param rate_limit: requests per second to every endpoint of Stingray, 0 to disable limit
+    :param rate_limit_burst: requests sent at once after idle period
+    :param heavy_concurrency: count of concurrent uploads and report requests
+    :param rate_limit_dir: directory to share limits with other processes of the host or None
+    :return: session
+    """
+    retry = Retry(total=retries,
+                  backoff_factor=backoff,
+                  # 429 and 503 are repeated by session after pause shared by all requests to the host
+                  status_forcelist=[status for status in HTTP_RETRY_STATUSES if status not in RATE_LIMIT_STATUSES],
+                  allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+                  respect_retry_after_header=True,
+                  raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+    rate_limiter = RateLimiter(rate_limit, rate_limit_burst, heavy_concurrency, rate_limit_dir)
+    session = Session(timeout=(HTTP_CONNECT_TIMEOUT, timeout), rate_limiter=rate_limiter)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.hooks['response'].append(metrics.observe_response)
+    return session
+
+
+_lock = threading.Lock()
+_session = None
+_settings = {}
+
+
+def configure_session(**settings):
+    """
+    Set parameters of shared session, see create_session for details.
+    Session is recreated only if parameters are changed
+    """
+    global _session, _settings
+    with _lock:
+        if settings != _settings:
+            _settings = settings
+            _session = None
+
+
+def get_session():
+    """
+    Session shared by all clients of the process
+    """
+    global _session
+    with _lock:
+        if _session is None:
+            _session = create_session(**_settings)
+        return _session
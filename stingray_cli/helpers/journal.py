@@ -0,0 +1,68 @@
+import os
+import json
+import time
+import hashlib
+
+try:
+    from .helpers import atomic_write_json
+except ImportError:
+    from stingray_cli.helpers.helpers import atomic_write_json
+
+
+class ScanJournal:
+    """
+    Persistent journal of started scans which results are not saved yet.
+    Every scan is stored in its own json file, so concurrent runs do not block each other.
+    Entry is removed when reports of the scan are saved or scan is failed
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _entry_path(self, stingray_url, scan_id):
+        url_hash = hashlib.sha1(stingray_url.rstrip('/').encode()).hexdigest()[:12]
+        return os.path.join(self.path, '{0}-{1}.json'.format(url_hash, scan_id))
+
+    def add(self, stingray_url, scan_id, **details):
+        """
+        Record started scan
+        :param details: application, profile, output paths and other arguments required to collect results
+        """
+        entry = {'stingray_url': stingray_url.rstrip('/'), 'scan_id': scan_id, 'started_at': time.time(), **details}
+        atomic_write_json(self._entry_path(stingray_url, scan_id), entry)
+        return entry
+
+    def remove(self, stingray_url, scan_id):
+        try:
+            os.remove(self._entry_path(stingray_url, scan_id))
+        except FileNotFoundError:
+            pass
+
+    def entries(self):
+        """
+        :return: list of recorded scans (dict) ordered by start time
+        """
+        entries = []
+        for name in os.listdir(self.path):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.path, name)) as fp:
+                    entries.append(json.load(fp))
+            except (OSError, ValueError):
+                # removed by concurrent run
+                continue
+        return sorted(entries, key=lambda entry: entry['started_at'])
+
+    def find(self, **details):
+        """
+        Find the latest recorded scan with the same details, e.g. the same application and profile
+        :return: entry (dict) or None
+        """
+        if details.get('stingray_url'):
+            details['stingray_url'] = details['stingray_url'].rstrip('/')
+        for entry in reversed(self.entries()):
+            if all(entry.get(key) == value for key, value in details.items()):
+                return entry
+        return None
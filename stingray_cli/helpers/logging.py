@@ -1,7 +1,14 @@
+import sys
+import functools
+import threading
 from datetime import datetime
 
 
 class Log:
+    _context = threading.local()
+    # messages of concurrent pipeline threads are written whole, one at a time
+    _lock = threading.Lock()
+
     @classmethod
     def info(cls, message):
         cls._log('INFO', message)
@@ -14,8 +21,41 @@ class Log:
     def debug(cls, message):
         cls._log('DEBUG', message)
 
-    @staticmethod
-    def _log(level, message):
+    @classmethod
+    def set_context(cls, context):
+        """
+        Set prefix for messages of current thread, e.g. name of the job in batch mode
+        """
+        cls._context.value = context
+
+    @classmethod
+    def get_context(cls):
+        return getattr(cls._context, 'value', None)
+
+    @classmethod
+    def bind_context(cls, function):
+        """
+        Wrap function to log with context of current thread when it is called from another thread
+        """
+        context = cls.get_context()
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            cls.set_context(context)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                cls.set_context(None)
+
+        return wrapper
+
+    @classmethod
+    def _log(cls, level, message):
         current_date = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
+        context = cls.get_context()
+        if context:
+            message = '[{context}] {message}'.format(context=context, message=message)
         message = '{time} - {level} {message}'.format(time=current_date, level=level, message=message)
-        print(message)
\ No newline at end of file
+        with cls._lock:
+            sys.stdout.write(message + '\n')
+            sys.stdout.flush()
@@ -0,0 +1,226 @@
+import time
+import functools
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+try:
+    from .const import METRICS_PREFIX, HTTP_LATENCY_BUCKETS
+    from .helpers import atomic_write_json, atomic_write_text
+    from .logging import Log
+except ImportError:
+    from stingray_cli.helpers.const import METRICS_PREFIX, HTTP_LATENCY_BUCKETS
+    from stingray_cli.helpers.helpers import atomic_write_json, atomic_write_text
+    from stingray_cli.helpers.logging import Log
+
+
+class Metrics:
+    """
+    Collects timing spans of scan phases, transferred bytes and http requests of the process.
+    Every record is labeled with job name taken from log context, so results of concurrent jobs
+    in batch mode can be exported separately. Exported as JSON trace or Prometheus textfile
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._spans = []
+        self._bytes = []
+        self._requests = []
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """
+        Measure duration of the block. Block failed with exception or non-zero exit is marked as error
+        :param name: name of phase
+        :param attributes: additional attributes of the span, can be updated inside the block
+        """
+        started_at, started = time.time(), time.monotonic()
+        status = 'ok'
+        try:
+            yield attributes
+        except SystemExit as e:
+            if e.code not in (0, None):
+                status = 'error'
+                attributes['exit_code'] = e.code
+            raise
+        except BaseException as e:
+            status = 'error'
+            attributes['error'] = repr(e)
+            raise
+        finally:
+            self.add_span(name, started_at, time.monotonic() - started, status, **attributes)
+
+    def timed(self, name):
+        """
+        Decorator measuring every call of function as span
+        """
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def add_span(self, name, started_at, duration, status='ok', **attributes):
+        """
+        Record span measured outside of the "span" block, e.g. time spent by scan in some state
+        :param started_at: unix timestamp of span start
+        :param duration: seconds
+        """
+        span = {'name': name,
+                'job': Log.get_context(),
+                'start': round(started_at, 3),
+                'duration': round(duration, 3),
+                'status': status,
+                'attributes': attributes}
+        with self._lock:
+            self._spans.append(span)
+
+    def add_bytes(self, direction, count):
+        """
+        Count bytes transferred over network
+        :param direction: download, upload or report
+        """
+        with self._lock:
+            self._bytes.append((Log.get_context(), direction, count))
+
+    def observe_response(self, response, *args, **kwargs):
+        """
+        Response hook of requests session recording every http request with its latency (time to response headers)
+        """
+        record = (Log.get_context(), urlsplit(response.url).netloc, response.request.method, response.status_code,
+                  response.elapsed.total_seconds())
+        with self._lock:
+            self._requests.append(record)
+
+    def forget(self, job):
+        """
+        Remove records of the job, used by long running process after metrics of the job are exported
+        """
+        with self._lock:
+            self._spans = [span for span in self._spans if span['job'] != job]
+            self._bytes = [record for record in self._bytes if record[0] != job]
+            self._requests = [record for record in self._requests if record[0] != job]
+
+    def _records(self, job):
+        with self._lock:
+            return ([span for span in self._spans if job is None or span['job'] == job],
+                    [record for record in self._bytes if job is None or record[0] == job],
+                    [record for record in self._requests if job is None or record[0] == job])
+
+    def trace(self, job=None):
+        """
+        All records of the job, or of all jobs of the process if job is not set
+        :return: dict with spans, transferred bytes and http requests
+        """
+        spans, transferred, requests = self._records(job)
+
+        bytes_total = {}
+        for _, direction, count in transferred:
+            bytes_total[direction] = bytes_total.get(direction, 0) + count
+
+        http = {}
+        for _, host, method, status, latency in requests:
+            stats = http.setdefault(f'{method} {host} {status}',
+                                    {'host': host, 'method': method, 'status': status,
+                                     'count': 0, 'seconds': 0, 'max_seconds': 0})
+            stats['count'] += 1
+            stats['seconds'] = round(stats['seconds'] + latency, 3)
+            stats['max_seconds'] = max(stats['max_seconds'], round(latency, 3))
+
+        return {'spans': spans,
+                'bytes': bytes_total,
+                'http': list(http.values())}
+
+    def write_trace(self, path, job=None):
+        atomic_write_json(path, self.trace(job), indent=4)
+        Log.info(f'Trace saved to {path}')
+
+    def write_prometheus(self, path, job=None):
+        """
+        Save metrics in Prometheus text format for node exporter textfile collector
+        """
+        atomic_write_text(path, self.prometheus(job))
+        Log.info(f'Metrics saved to {path}')
+
+    def prometheus(self, job=None):
+        spans, transferred, requests = self._records(job)
+
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            name = f'{METRICS_PREFIX}_{name}'
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for suffix, labels, value in samples:
+                label_text = ','.join(f'{key}="{_escape(label)}"' for key, label in labels.items() if label is not None)
+                value = value if isinstance(value, int) else round(value, 6)
+                lines.append(f'{name}{suffix}{{{label_text}}} {value}' if label_text else f'{name}{suffix} {value}')
+
+        phases = {}
+        states = {}
+        for span in spans:
+            if span['name'] == 'scan_state':
+                key = (span['job'], span['attributes'].get('state'))
+                states[key] = states.get(key, 0) + span['duration']
+            else:
+                key = (span['job'], span['name'], span['status'])
+                count, seconds = phases.get(key, (0, 0))
+                phases[key] = (count + 1, seconds + span['duration'])
+
+        metric('phase_seconds', 'gauge', 'Time spent in phase of scan run',
+               [('', {'job': job_name, 'phase': phase, 'status': status}, seconds)
+                for (job_name, phase, status), (_, seconds) in sorted(phases.items(), key=_sort_key)])
+        metric('phase_count', 'gauge', 'Count of phase runs',
+               [('', {'job': job_name, 'phase': phase, 'status': status}, count)
+                for (job_name, phase, status), (count, _) in sorted(phases.items(), key=_sort_key)])
+        metric('scan_state_seconds', 'gauge', 'Time spent by scan in state on Stingray side',
+               [('', {'job': job_name, 'state': state}, seconds)
+                for (job_name, state), seconds in sorted(states.items(), key=_sort_key)])
+
+        bytes_total = {}
+        for job_name, direction, count in transferred:
+            bytes_total[(job_name, direction)] = bytes_total.get((job_name, direction), 0) + count
+        metric('bytes_total', 'counter', 'Bytes transferred over network',
+               [('', {'job': job_name, 'direction': direction}, count)
+                for (job_name, direction), count in sorted(bytes_total.items(), key=_sort_key)])
+
+        counts = {}
+        histograms = {}
+        for job_name, host, method, status, latency in requests:
+            counts[(job_name, host, method, status)] = counts.get((job_name, host, method, status), 0) + 1
+            histogram = histograms.setdefault((job_name, host), [0] * len(HTTP_LATENCY_BUCKETS) + [0, 0])
+            for index, bucket in enumerate(HTTP_LATENCY_BUCKETS):
+                if latency <= bucket:
+                    histogram[index] += 1
+            histogram[-2] += 1
+            histogram[-1] += latency
+
+        metric('http_requests_total', 'counter', 'Http requests by response status',
+               [('', {'job': job_name, 'host': host, 'method': method, 'status': status}, count)
+                for (job_name, host, method, status), count in sorted(counts.items(), key=_sort_key)])
+
+        samples = []
+        for (job_name, host), histogram in sorted(histograms.items(), key=_sort_key):
+            labels = {'job': job_name, 'host': host}
+            for bucket, count in zip(HTTP_LATENCY_BUCKETS, histogram):
+                samples.append(('_bucket', {**labels, 'le': f'{bucket:g}'}, count))
+            samples.append(('_bucket', {**labels, 'le': '+Inf'}, histogram[-2]))
+            samples.append(('_count', labels, histogram[-2]))
+            samples.append(('_sum', labels, histogram[-1]))
+        metric('http_request_duration_seconds', 'histogram', 'Time to response headers of http request', samples)
+
+        metric('last_run_timestamp_seconds', 'gauge', 'Time of metrics export', [('', {'job': job}, time.time())])
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _sort_key(item):
+    return tuple(str(part) for part in item[0])
+
+
+metrics = Metrics()
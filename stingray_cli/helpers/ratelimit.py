@@ -0,0 +1,264 @@
+import os
+import re
+import json
+import time
+import fcntl
+import hashlib
+import threading
+from contextlib import contextmanager, nullcontext
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+try:
+    from .const import RATE_LIMIT, RATE_LIMIT_BURST, RATE_LIMIT_HEAVY_CONCURRENCY, RATE_LIMIT_MAX_DELAY, \
+        RATE_LIMIT_DECREASE, RATE_LIMIT_MIN_FACTOR, RATE_LIMIT_RECOVERY
+    from .helpers import atomic_write_json, file_lock
+    from .metrics import metrics
+except ImportError:
+    from stingray_cli.helpers.const import RATE_LIMIT, RATE_LIMIT_BURST, RATE_LIMIT_HEAVY_CONCURRENCY, \
+        RATE_LIMIT_MAX_DELAY, RATE_LIMIT_DECREASE, RATE_LIMIT_MIN_FACTOR, RATE_LIMIT_RECOVERY
+    from stingray_cli.helpers.helpers import atomic_write_json, file_lock
+    from stingray_cli.helpers.metrics import metrics
+
+# Endpoints of Stingray REST API limited separately: (method, path regex, endpoint name, heavy).
+# Heavy operations load server most of all and are also limited by count of concurrent requests
+ENDPOINTS = (
+    ('GET', re.compile(r'/rest/dasts/\d+/$'), 'scan_info', False),
+    ('GET', re.compile(r'/rest/dasts/\d+/report/$'), 'report', True),
+    ('POST', re.compile(r'/rest/dasts/\d+/start/$'), 'start', False),
+    ('POST', re.compile(r'/rest/organizations/\d+/applications/$'), 'upload', True),
+    ('POST', re.compile(r'/rest/organizations/\d+/dasts/$'), 'create', False),
+    ('GET', re.compile(r'/rest/applications/\d+/$'), 'application', False),
+    ('GET', re.compile(r'/rest/architectures/$'), 'architectures', False),
+)
+
+
+def retry_after(response, default):
+    """
+    Delay requested by server in Retry-After header, in seconds or as http date
+    :return: seconds to wait, default if header is absent or invalid
+    """
+    value = response.headers.get('Retry-After')
+    if not value:
+        return default
+    try:
+        delay = float(value)
+    except ValueError:
+        try:
+            delay = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return default
+    return min(max(delay, 0), RATE_LIMIT_MAX_DELAY)
+
+
+class _State:
+    """
+    Small json state guarded by lock: in memory of the process or in file shared by processes of the host
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.value = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def update(self):
+        with self.lock, (file_lock(self.path + '.lock') if self.path else nullcontext()):
+            if self.path:
+                try:
+                    with open(self.path) as fp:
+                        self.value = json.load(fp)
+                except (OSError, ValueError):
+                    self.value = {}
+            previous = dict(self.value)
+            yield self.value
+            if self.path and self.value != previous:
+                atomic_write_json(self.path, self.value)
+
+
+class TokenBucket:
+    """
+    Allows rate requests per second on average and up to burst requests at once.
+    Token is reserved even if bucket is empty, so waiting requests are sent one by one at the rate
+    instead of all at once when tokens are refilled
+    """
+
+    def __init__(self, rate, burst, path=None):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.state = _State(path)
+
+    def _take(self, rate, burst):
+        """
+        :return: seconds to wait until reserved token is available
+        """
+        now = time.time()
+        with self.state.update() as state:
+            tokens = min(burst, state.get('tokens', burst) + (now - state.get('updated', now)) * rate) - 1
+            state['tokens'], state['updated'] = tokens, now
+            return max(-tokens / rate, 0)
+
+    def acquire(self, factor=1.0):
+        """
+        Wait for token
+        :param factor: part of rate allowed by server, bursts are disabled while it is less than 1
+        :return: seconds waited
+        """
+        delay = self._take(self.rate * factor, self.burst if factor >= 1 else 1)
+        if delay:
+            time.sleep(delay)
+        return delay
+
+
+class FileSemaphore:
+    """
+    Semaphore shared by processes of the host: every holder locks one of count slot files
+    """
+    poll_interval = 0.1
+
+    def __init__(self, path, count):
+        self.paths = ['{0}.{1}.lock'.format(path, slot) for slot in range(count)]
+
+    @contextmanager
+    def hold(self):
+        while True:
+            for path in self.paths:
+                lock_file = open(path, 'a')
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    lock_file.close()
+                    continue
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                    lock_file.close()
+                return
+            time.sleep(self.poll_interval)
+
+
+class ThreadSemaphore:
+    """
+    Semaphore shared by threads of the process with the same interface as FileSemaphore
+    """
+
+    def __init__(self, path, count):
+        self.semaphore = threading.BoundedSemaphore(count)
+
+    @contextmanager
+    def hold(self):
+        with self.semaphore:
+            yield
+
+
+class RateLimiter:
+    """
+    Client-side scheduler of requests to Stingray shared by all scans of the process.
+    Every endpoint of every host has its own token bucket, so polling of scan states does not delay uploads,
+    heavy operations (upload and report) are additionally limited by count of concurrent requests.
+    When server answers with 429 or 503, all requests to the host are paused for Retry-After seconds
+    and rate of the host is decreased, then it slowly grows back while server accepts requests.
+    If path is set, buckets, pauses and concurrency limits are shared by all processes of the host
+    """
+
+    def __init__(self, rate=RATE_LIMIT, burst=RATE_LIMIT_BURST, heavy_concurrency=RATE_LIMIT_HEAVY_CONCURRENCY,
+                 path=None):
+        """
+        :param rate: requests per second to every endpoint, 0 to disable limit
+        :param burst: requests sent at once after idle period
+        :param heavy_concurrency: count of concurrent heavy requests to the host
+        :param path: directory of state shared by processes or None to limit only this process
+        """
+        self.rate = rate
+        self.burst = burst
+        self.heavy_concurrency = heavy_concurrency
+        self.path = path
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._pauses = {}
+        self._semaphores = {}
+        if path:
+            os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def classify(method, url):
+        """
+        :return: tuple (host, endpoint name or None if request is not limited, heavy)
+        """
+        parts = urlsplit(url)
+        for endpoint_method, pattern, name, heavy in ENDPOINTS:
+            if method.upper() == endpoint_method and pattern.search(parts.path):
+                return parts.netloc, name, heavy
+        return parts.netloc, None, False
+
+    def _state_path(self, *parts):
+        if not self.path:
+            return None
+        return os.path.join(self.path, hashlib.sha1('|'.join(parts).encode()).hexdigest()[:16])
+
+    def _get(self, registry, key, factory):
+        with self._lock:
+            if key not in registry:
+                registry[key] = factory()
+            return registry[key]
+
+    def _pause(self, host):
+        return self._get(self._pauses, host, lambda: _State(self._state_path(host, 'pause')))
+
+    def _bucket(self, host, endpoint):
+        return self._get(self._buckets, (host, endpoint),
+                         lambda: TokenBucket(self.rate, self.burst, self._state_path(host, endpoint)))
+
+    def _semaphore(self, host):
+        semaphore_class = FileSemaphore if self.path else ThreadSemaphore
+        return self._get(self._semaphores, host,
+                         lambda: semaphore_class(self._state_path(host, 'heavy'), self.heavy_concurrency))
+
+    @staticmethod
+    def _factor(state, now):
+        # rate grows back linearly since the end of the last pause
+        return min(1.0, state.get('factor', 1.0) + RATE_LIMIT_RECOVERY * max(now - state.get('until', now), 0))
+
+    def _host_state(self, host):
+        """
+        :return: tuple (seconds until pause of the host ends, part of rate allowed for the host)
+        """
+        with self._pause(host).update() as state:
+            now = time.time()
+            return state.get('until', 0) - now, self._factor(state, now)
+
+    @contextmanager
+    def slot(self, method, url):
+        """
+        Wait until request can be sent and hold concurrency slot of heavy request while it is sent
+        """
+        host, endpoint, heavy = self.classify(method, url)
+        started_at = time.time()
+        while True:
+            delay, factor = self._host_state(host)
+            if delay > 0:
+                time.sleep(delay)
+                continue
+            if endpoint and self.rate and self._bucket(host, endpoint).acquire(factor) and \
+                    self._host_state(host)[0] > 0:
+                # host is paused while request waited for token, it gets a new token after pause
+                continue
+            break
+
+        with self._semaphore(host).hold() if heavy and self.heavy_concurrency else nullcontext():
+            waited = time.time() - started_at
+            if waited >= 0.01:
+                metrics.add_span('throttle', started_at, waited, endpoint=endpoint or host)
+            yield
+
+    def pause(self, url, seconds):
+        """
+        Do not send requests to the host of url for seconds and decrease rate of the host.
+        Rate is decreased once for requests throttled while host is already paused
+        """
+        with self._pause(urlsplit(url).netloc).update() as state:
+            now = time.time()
+            if state.get('until', 0) <= now:
+                state['factor'] = max(self._factor(state, now) * RATE_LIMIT_DECREASE, RATE_LIMIT_MIN_FACTOR)
+            state['until'] = max(state.get('until', 0), now + seconds)
@@ -0,0 +1,110 @@
+import os
+import json
+import time
+import zlib
+import sqlite3
+from contextlib import closing
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS scans (
+    id INTEGER PRIMARY KEY,
+    recorded_at REAL NOT NULL,
+    stingray_url TEXT NOT NULL,
+    scan_id INTEGER NOT NULL,
+    application_id INTEGER,
+    application TEXT,
+    version TEXT,
+    sha256 TEXT,
+    distribution_system TEXT,
+    profile_id INTEGER,
+    testcase_id INTEGER,
+    architecture_id INTEGER,
+    state TEXT,
+    summary BLOB
+);
+CREATE INDEX IF NOT EXISTS scans_application ON scans (application, version);
+CREATE INDEX IF NOT EXISTS scans_profile ON scans (profile_id, testcase_id);
+CREATE INDEX IF NOT EXISTS scans_state ON scans (state, recorded_at);
+CREATE INDEX IF NOT EXISTS scans_recorded_at ON scans (recorded_at);
+'''
+
+COLUMNS = ('id', 'recorded_at', 'stingray_url', 'scan_id', 'application_id', 'application', 'version', 'sha256',
+           'distribution_system', 'profile_id', 'testcase_id', 'architecture_id', 'state')
+
+
+class ResultsStore:
+    """
+    Append-only SQLite store of scan summaries indexed by application, version, profile, testcase, state and time.
+    Summary of scan is kept as compressed json. Store can be written by many processes at the same time
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with closing(self._connect()) as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.executescript(SCHEMA)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def add(self, stingray_url, scan, **details):
+        """
+        Append summary of the scan
+        :param stingray_url: url of Stingray
+        :param scan: scan info (dict) received from Stingray
+        :param details: application_id, application, version, sha256, distribution_system, profile_id,
+                        testcase_id, architecture_id
+        :return: id of the record
+        """
+        record = {'recorded_at': time.time(),
+                  'stingray_url': stingray_url.rstrip('/'),
+                  'scan_id': scan['id'],
+                  'summary': zlib.compress(json.dumps(scan, separators=(',', ':')).encode(), 9),
+                  **{key: value for key, value in details.items() if key in COLUMNS}}
+        with closing(self._connect()) as connection, connection:
+            cursor = connection.execute('INSERT INTO scans ({0}) VALUES ({1})'.format(
+                ', '.join(record), ', '.join('?' * len(record))), list(record.values()))
+            return cursor.lastrowid
+
+    def query(self, application=None, version=None, profile_id=None, testcase_id=None, state=None,
+              since=None, until=None, limit=None, with_summary=False):
+        """
+        Find records matching all given filters, the newest first
+        :param application: application name, "*" matches any characters
+        :param since: unix timestamp of the oldest record
+        :param until: unix timestamp of the newest record
+        :param with_summary: include decompressed scan summary
+        :return: list of records (dict)
+        """
+        conditions, parameters = [], []
+        if application is not None:
+            conditions.append('application GLOB ?' if '*' in application else 'application = ?')
+            parameters.append(application)
+        for column, value in (('version', version), ('profile_id', profile_id), ('testcase_id', testcase_id),
+                              ('state', state)):
+            if value is not None:
+                conditions.append(f'{column} = ?')
+                parameters.append(value)
+        if since is not None:
+            conditions.append('recorded_at >= ?')
+            parameters.append(since)
+        if until is not None:
+            conditions.append('recorded_at < ?')
+            parameters.append(until)
+
+        columns = COLUMNS + ('summary',) if with_summary else COLUMNS
+        sql = 'SELECT {0} FROM scans'.format(', '.join(columns))
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY recorded_at DESC'
+        if limit:
+            sql += ' LIMIT ?'
+            parameters.append(limit)
+
+        with closing(self._connect()) as connection:
+            records = [dict(zip(columns, row)) for row in connection.execute(sql, parameters)]
+        for record in records:
+            if with_summary:
+                record['summary'] = json.loads(zlib.decompress(record['summary']))
+        return records
@@ -0,0 +1,99 @@
+import os
+import time
+import uuid
+
+try:
+    from .const import UPLOAD_CHUNK_SIZE, UPLOAD_PROGRESS_INTERVAL
+    from .logging import Log
+except ImportError:
+    from stingray_cli.helpers.const import UPLOAD_CHUNK_SIZE, UPLOAD_PROGRESS_INTERVAL
+    from stingray_cli.helpers.logging import Log
+
+
+def format_size(size):
+    return f'{size / 2 ** 20:.1f} MB'
+
+
+class UploadProgress:
+    """
+    Log count of sent bytes, throughput and estimated time left not more often than once in interval seconds
+    """
+
+    def __init__(self, name, total, interval=UPLOAD_PROGRESS_INTERVAL):
+        self.name = name
+        self.total = total
+        self.interval = interval
+        self.sent = 0
+        self.started_at = None
+        self.logged_at = None
+
+    def update(self, count):
+        now = time.monotonic()
+        if self.started_at is None:
+            self.started_at = self.logged_at = now
+        self.sent += count
+        if now - self.logged_at >= self.interval:
+            self.logged_at = now
+            self.log(now)
+
+    def log(self, now=None):
+        elapsed = (now or time.monotonic()) - (self.started_at or time.monotonic())
+        speed = self.sent / elapsed if elapsed > 0 else 0
+        message = f'Upload {self.name}: {format_size(self.sent)} of {format_size(self.total)} ' \
+                  f'({self.sent * 100 // max(self.total, 1)}%), {format_size(speed)}/s'
+        if self.sent < self.total and speed:
+            message += f', ETA {int((self.total - self.sent) / speed)}s'
+        Log.info(message)
+
+
+class MultipartFile:
+    """
+    Body of multipart/form-data request with form fields and one file, which is streamed from disk
+    chunk by chunk. Only one chunk is kept in memory whatever size of the file is.
+    Length of the body is known in advance, so request is sent with Content-Length instead of chunked encoding.
+    Body can be iterated again, e.g. when request is retried
+    """
+
+    def __init__(self, field_name, path, fields=None, chunk_size=UPLOAD_CHUNK_SIZE, progress=True):
+        """
+        :param field_name: name of form field with file
+        :param path: path to the file
+        :param fields: dict with other form fields
+        :param progress: log upload throughput and ETA
+        """
+        self.path = path
+        self.chunk_size = chunk_size
+        self.boundary = uuid.uuid4().hex
+        self.file_size = os.path.getsize(path)
+        self.progress = progress
+
+        preamble = b''
+        for name, value in (fields or {}).items():
+            preamble += self._part_header(f'form-data; name="{name}"') + str(value).encode() + b'\r\n'
+        file_name = os.path.basename(path)
+        preamble += self._part_header(f'form-data; name="{field_name}"; filename="{file_name}"')
+        self.preamble = preamble
+        self.epilogue = f'\r\n--{self.boundary}--\r\n'.encode()
+
+    def _part_header(self, disposition):
+        return f'--{self.boundary}\r\nContent-Disposition: {disposition}\r\n\r\n'.encode()
+
+    @property
+    def content_type(self):
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    def __len__(self):
+        return len(self.preamble) + self.file_size + len(self.epilogue)
+
+    def __iter__(self):
+        progress = UploadProgress(os.path.basename(self.path), len(self)) if self.progress else None
+        yield self.preamble
+        with open(self.path, 'rb') as file:
+            for chunk in iter(lambda: file.read(self.chunk_size), b''):
+                yield chunk
+                if progress:
+                    progress.update(len(chunk))
+        yield self.epilogue
+        if progress:
+            progress.sent = len(self)
+            progress.log()
@@ -0,0 +1,50 @@
+import os
+import json
+
+try:
+    from .helpers import atomic_write_json, file_lock
+except ImportError:
+    from stingray_cli.helpers.helpers import atomic_write_json, file_lock
+
+
+class UploadIndex:
+    """
+    Persistent index of applications already uploaded to Stingray.
+    Maps fingerprint of application file (with Stingray url, company and architecture type) to application id
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    @staticmethod
+    def make_key(stingray_url, company_id, architecture_type, fingerprint):
+        return '{0}|{1}|{2}|{3}'.format(stingray_url.rstrip('/'), company_id, architecture_type, fingerprint)
+
+    def _load(self):
+        try:
+            with open(self.path) as fp:
+                return json.load(fp)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, key):
+        """
+        :return: id of uploaded application or None
+        """
+        return self._load().get(key)
+
+    def put(self, key, app_id):
+        self._update(key, app_id)
+
+    def remove(self, key):
+        self._update(key, None)
+
+    def _update(self, key, app_id):
+        with file_lock(self.path + '.lock'):
+            index = self._load()
+            if app_id is None:
+                index.pop(key, None)
+            else:
+                index[key] = app_id
+            atomic_write_json(self.path, index)
@@ -0,0 +1,200 @@
+import time
+import heapq
+import random
+import itertools
+import threading
+from concurrent.futures import Future
+
+try:
+    from .helpers.const import DastState, DastStateDict, SCAN_TIMEOUT, POLL_INTERVALS, POLL_BACKOFF, POLL_JITTER, \
+        EVENT_POLL_INTERVAL
+    from .helpers.logging import Log
+    from .helpers.metrics import metrics
+except ImportError:
+    from stingray_cli.helpers.const import DastState, DastStateDict, SCAN_TIMEOUT, POLL_INTERVALS, POLL_BACKOFF, \
+        POLL_JITTER, EVENT_POLL_INTERVAL
+    from stingray_cli.helpers.logging import Log
+    from stingray_cli.helpers.metrics import metrics
+
+
+class ScanPollError(Exception):
+    """
+    Scan state can not be received from Stingray
+    """
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        # status code of Stingray response, None if request failed
+        self.status_code = status_code
+
+
+class _Watch:
+    def __init__(self, stingray, scan_id, deadline):
+        self.stingray = stingray
+        self.scan_id = scan_id
+        self.deadline = deadline
+        self.future = Future()
+        self.log_context = Log.get_context()
+        self.dast = {'id': scan_id, 'state': None}
+        self.interval = None
+        self.state_started_at = None
+        self.state_started = None
+        # the latest entry of the watch in poll queue, older entries are skipped
+        self.entry = None
+        self.events = 0
+
+    def record_state(self, now):
+        """
+        Record time spent by scan in the current state as span, measured with precision of polling interval
+        """
+        if self.dast['state'] is not None:
+            metrics.add_span('scan_state', self.state_started_at, now - self.state_started,
+                             state=DastStateDict.get(self.dast['state']), scan_id=self.scan_id)
+
+
+class ScanPoller:
+    """
+    Watches state of many scans in a single scheduling loop running in background thread.
+    Interval between checks depends on scan state: short while scan is starting and growing
+    while it is analyzing. Every interval is randomized to spread requests of many scans in time.
+    When scan state events are enabled, scan is checked as soon as event about it is received
+    and polling is only a slow safety net for lost events
+    """
+    terminal_states = (DastState.SUCCESS, DastState.FAILED)
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._queue = []
+        self._counter = itertools.count()
+        self._thread = None
+        self._watches = {}
+        self.event_interval = None
+
+    def enable_events(self, interval=EVENT_POLL_INTERVAL):
+        """
+        Rely on notify calls made by listener of scan state events
+        :param interval: seconds between safety net checks of every scan
+        """
+        self.event_interval = interval
+
+    def notify(self, scan_id):
+        """
+        Check the scan now, e.g. when event about change of its state is received
+        :return: count of watches of the scan
+        """
+        with self._condition:
+            watches = list(self._watches.get(scan_id, ()))
+        for watch in watches:
+            watch.events += 1
+            self._schedule(watch, time.monotonic())
+        return len(watches)
+
+    def watch(self, stingray, scan_id, timeout=SCAN_TIMEOUT):
+        """
+        Start watching the scan
+        :param stingray: Stingray client
+        :param scan_id: id of started scan
+        :param timeout: seconds to wait for scan end
+        :return: future resolved with scan info (dict) when scan is finished or timeout is reached
+        """
+        watch = _Watch(stingray, scan_id, time.monotonic() + timeout)
+        with self._condition:
+            self._watches.setdefault(scan_id, set()).add(watch)
+        watch.future.add_done_callback(lambda _: self._forget(watch))
+        self._schedule(watch, time.monotonic())
+        return watch.future
+
+    def wait(self, stingray, scan_id, timeout=SCAN_TIMEOUT):
+        """
+        Block until scan is finished or timeout is reached
+        :return: last received scan info (dict)
+        """
+        return self.watch(stingray, scan_id, timeout).result()
+
+    def _forget(self, watch):
+        with self._condition:
+            watches = self._watches.get(watch.scan_id, set())
+            watches.discard(watch)
+            if not watches:
+                self._watches.pop(watch.scan_id, None)
+
+    def _schedule(self, watch, poll_at):
+        with self._condition:
+            watch.entry = next(self._counter)
+            heapq.heappush(self._queue, (poll_at, watch.entry, watch))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='scan-poller', daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._queue or self._queue[0][0] > time.monotonic():
+                    self._condition.wait(self._queue[0][0] - time.monotonic() if self._queue else None)
+                _, entry, watch = heapq.heappop(self._queue)
+                if entry != watch.entry or watch.future.done():
+                    # rescheduled by event
+                    continue
+
+            try:
+                self._poll(watch)
+            except Exception as e:
+                # e.g. unexpected scan info, the loop must keep watching other scans
+                if not watch.future.done():
+                    watch.future.set_exception(
+                        ScanPollError(f'Error while checking scan with id {watch.scan_id}: {e!r}'))
+
+    def _poll(self, watch):
+        Log.set_context(watch.log_context)
+        try:
+            self._check(watch)
+        finally:
+            Log.set_context(None)
+
+    def _check(self, watch):
+        events = watch.events
+        try:
+            response = watch.stingray.get_scan_info(watch.scan_id)
+            if not response.status_code == 200:
+                raise ScanPollError(f'Error while getting scan info with id {watch.scan_id}: {response.text}',
+                                    response.status_code)
+            dast = response.json()
+        except ScanPollError as e:
+            watch.future.set_exception(e)
+            return
+        except Exception as e:
+            # any error must not stop the loop watching other scans
+            watch.future.set_exception(ScanPollError(f'Error while getting scan info with id {watch.scan_id}: {e!r}'))
+            return
+
+        now = time.monotonic()
+        state_changed = dast['state'] != watch.dast['state']
+        if state_changed:
+            watch.record_state(now)
+            watch.state_started_at, watch.state_started = time.time(), now
+            Log.info(f"Scan with id {watch.scan_id}. Current scan status: {DastStateDict.get(dast['state'])}")
+        watch.dast = dast
+
+        if dast['state'] in self.terminal_states or now >= watch.deadline:
+            if dast['state'] not in self.terminal_states:
+                watch.record_state(now)
+            watch.future.set_result(dast)
+            return
+
+        first_interval, max_interval = POLL_INTERVALS.get(dast['state'], POLL_INTERVALS[DastState.ANALYZING])
+        if self.event_interval:
+            watch.interval = self.event_interval
+        elif state_changed or watch.interval is None:
+            watch.interval = first_interval
+        else:
+            watch.interval = min(watch.interval * POLL_BACKOFF, max_interval)
+
+        delay = watch.interval * random.uniform(1 - POLL_JITTER, 1 + POLL_JITTER)
+        if watch.events != events:
+            # event received while scan was checked may be about newer state
+            delay = 0
+        self._schedule(watch, min(now + delay, watch.deadline))
+
+
+scan_poller = ScanPoller()
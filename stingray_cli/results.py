@@ -0,0 +1,99 @@
+import os
+import sys
+import csv
+import json
+import argparse
+from datetime import datetime
+
+try:
+    from .helpers.const import DastStateDict
+    from .helpers.logging import Log
+    from .helpers.results import ResultsStore, COLUMNS
+except ImportError:
+    from stingray_cli.helpers.const import DastStateDict
+    from stingray_cli.helpers.logging import Log
+    from stingray_cli.helpers.results import ResultsStore, COLUMNS
+
+
+def timestamp(value):
+    """
+    Parse date or date and time in ISO format, e.g. 2024-05-01 or 2024-05-01T12:00
+    :return: unix timestamp
+    """
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'invalid date "{value}", use ISO format, e.g. 2024-05-01 or 2024-05-01T12:00')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='stingray_cli results',
+                                     description='Query and export summaries of scans stored with --results_db')
+    parser.add_argument('--results_db', type=str, help='Path to SQLite database with results', default=os.environ.get('STINGRAY_CLI_RESULTS_DB'))
+    parser.add_argument('--application', type=str, help='Application name, "*" matches any characters')
+    parser.add_argument('--version', type=str, help='Application version')
+    parser.add_argument('--profile_id', type=int, help='Project id of scans')
+    parser.add_argument('--testcase_id', type=int, help='Testcase id of scans')
+    parser.add_argument('--state', type=str, choices=list(DastStateDict.values()), help='State of scans')
+    parser.add_argument('--since', type=timestamp, help='Only scans finished at this date or later')
+    parser.add_argument('--until', type=timestamp, help='Only scans finished before this date')
+    parser.add_argument('--limit', type=int, help='Maximum count of scans, the latest are shown')
+    parser.add_argument('--format', type=str, choices=['table', 'json', 'csv'], help='Output format', default='table')
+    parser.add_argument('--with_summary', action='store_true', help='Include full summary of every scan, json format only')
+    parser.add_argument('--output', type=str, help='Name for the file to export results to instead of standard output')
+
+    arguments = parser.parse_args(argv)
+    if not arguments.results_db:
+        parser.error('"--results_db" argument or STINGRAY_CLI_RESULTS_DB environment variable is required')
+    if not os.path.exists(arguments.results_db):
+        parser.error(f'Results database {arguments.results_db} does not exist')
+    if arguments.with_summary and arguments.format != 'json':
+        parser.error('"--with_summary" requires "--format json"')
+    return arguments
+
+
+def write_table(records, fp):
+    columns = ('recorded_at', 'scan_id', 'state', 'application', 'version', 'profile_id', 'testcase_id')
+    rows = [[datetime.fromtimestamp(record['recorded_at']).strftime('%Y-%m-%d %H:%M:%S')] +
+            ['' if record[column] is None else str(record[column]) for column in columns[1:]]
+            for record in records]
+    widths = [max([len(column)] + [len(row[index]) for row in rows]) for index, column in enumerate(columns)]
+    for row in [list(columns)] + rows:
+        fp.write('  '.join(value.ljust(width) for value, width in zip(row, widths)).rstrip() + '\n')
+
+
+def write_records(records, output_format, fp):
+    if output_format == 'json':
+        json.dump(records, fp, indent=4)
+        fp.write('\n')
+    elif output_format == 'csv':
+        writer = csv.DictWriter(fp, fieldnames=COLUMNS)
+        writer.writeheader()
+        writer.writerows(records)
+    else:
+        write_table(records, fp)
+
+
+def main(argv=None):
+    arguments = parse_args(argv)
+    records = ResultsStore(arguments.results_db).query(application=arguments.application,
+                                                       version=arguments.version,
+                                                       profile_id=arguments.profile_id,
+                                                       testcase_id=arguments.testcase_id,
+                                                       state=arguments.state,
+                                                       since=arguments.since,
+                                                       until=arguments.until,
+                                                       limit=arguments.limit,
+                                                       with_summary=arguments.with_summary)
+
+    if arguments.output:
+        with open(arguments.output, 'w', newline='') as fp:
+            write_records(records, arguments.format, fp)
+        Log.info(f'{len(records)} scans exported to {arguments.output}')
+    else:
+        write_records(records, arguments.format, sys.stdout)
+    sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
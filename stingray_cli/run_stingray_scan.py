@@ -1,249 +1,658 @@
+import os
 import sys
-import time
 import json
-import urllib3
+import time
 import argparse
+import importlib
+from concurrent.futures import ThreadPoolExecutor
 
-from stingray_cli_core import StingrayToken as Stingray
+# requests, urllib3 and stingray_cli_core are imported only when scan is started,
+# so --help and invalid arguments are handled without loading http stack
 try:
+    from .poller import scan_poller, ScanPoller, ScanPollError
     from .helpers.const import *
     from .helpers.logging import Log
-    from .distribution_systems.hockey_app import HockeyApp
-    from .distribution_systems.app_center import AppCenter
+    from .helpers.helpers import get_cache_dir
+    from .helpers.cache import ApkCache, MetadataCache
+    from .helpers.upload_index import UploadIndex
+    from .helpers.journal import ScanJournal
+    from .helpers.metrics import metrics
+    from .distribution_systems import DISTRIBUTION_SYSTEMS, available_distribution_systems, get_distribution_system
 except ImportError:
+    from stingray_cli.poller import scan_poller, ScanPoller, ScanPollError
     from stingray_cli.helpers.const import *
     from stingray_cli.helpers.logging import Log
-    from stingray_cli.distribution_systems.hockey_app import HockeyApp
-    from stingray_cli.distribution_systems.app_center import AppCenter
-
-
-
-def parse_args():
-    parser = argparse.ArgumentParser(description='Start scan and get scan results from Stingray')
-    parser.add_argument('--distribution_system', type=str, help='Select how to get apk file', choices=['file', 'hockeyapp', 'appcenter'], required=True)
-
-    # Arguments used for distribution_system = file
-    parser.add_argument('--file_path', type=str, help='Path to local apk file for analyze. This argument required if distribution system set to "file"')
-
-    # Arguments used for distribution_system = hockeyapp
-    parser.add_argument('--hockey_token', type=str, help='Auth token for HockeyApp. This argument required if distribution system set to "hockeyapp"')
-    parser.add_argument('--hockey_bundle_id', type=str, help='Application bundle in HockeyApp. This argument or "--hockey_public_id" required if distribution system set to "hockeyapp"')
-    parser.add_argument('--hockey_public_id', type=str, help='Application identifier in HockeyApp. This argument or "--hockey_bundle_id" required if distribution system set to "hockeyapp"')
-    parser.add_argument('--hockey_version', type=str, help='Application version in HockeyApp. If not set - the latest version will be downloaded. This argument required if distribution system set to "hockeyapp"', default='latest')
-
-    # Arguments used for distribution_system = appcenter
-    parser.add_argument('--appcenter_token', type=str, help='Auth token for AppCenter. This argument required if distribution system set to "appcenter"')
-    parser.add_argument('--appcenter_owner_name', type=str, help='Application owner name in AppCenter. This argument required if distribution system set to "appcenter"')
-    parser.add_argument('--appcenter_app_name', type=str, help='Application name in AppCenter. This argument required if distribution system set to "appcenter"')
-    parser.add_argument('--appcenter_release_id', type=str, help='Release id in AppCenter. If not set - the latest release will be downloaded. This argument or "--ac_app_version" required if distribution system set to "appcenter"')
-    parser.add_argument('--appcenter_app_version', type=str,help='Application version in AppCenter. This argument  or "--appcenter_release_id" required if distribution system set to "appcenter"')
+    from stingray_cli.helpers.helpers import get_cache_dir
+    from stingray_cli.helpers.cache import ApkCache, MetadataCache
+    from stingray_cli.helpers.upload_index import UploadIndex
+    from stingray_cli.helpers.journal import ScanJournal
+    from stingray_cli.helpers.metrics import metrics
+    from stingray_cli.distribution_systems import DISTRIBUTION_SYSTEMS, available_distribution_systems, \
+        get_distribution_system
+
+
+COMMANDS = {
+    'batch': 'stingray_cli.batch:main',
+    'collect': 'stingray_cli.collect:main',
+    'serve': 'stingray_cli.serve:main',
+    'submit': 'stingray_cli.serve:submit',
+    'result': 'stingray_cli.serve:result',
+    'results': 'stingray_cli.results:main',
+}
+
+
+def parse_args(argv=None):
+    pre_parser = argparse.ArgumentParser(add_help=False)
+    pre_parser.add_argument('--distribution_system', type=str)
+    selected = pre_parser.parse_known_args(argv)[0].distribution_system
+
+    parser = argparse.ArgumentParser(description='Start scan and get scan results from Stingray',
+                                     epilog='Run "%(prog)s --distribution_system <name> -h" to see arguments of distribution system. '
+                                            'Run "%(prog)s batch -h" to see how to start many scans from manifest file. '
+                                            'Run "%(prog)s collect -h" to see how to get results of scans started with --nowait. '
+                                            'Run "%(prog)s serve -h" to see how to start daemon accepting scan jobs. '
+                                            'Run "%(prog)s results -h" to see how to query results stored with --results_db')
+    parser.add_argument('--distribution_system', type=str, required=True,
+                        help=f'Select how to get apk file: {", ".join(DISTRIBUTION_SYSTEMS)} or name of installed plugin')
+
+    # Arguments of selected distribution system, or of all built-in ones if it is not selected yet
+    try:
+        distribution_system = get_distribution_system(selected) if selected else None
+    except (TypeError, ImportError) as e:
+        parser.error(f'Distribution system "{selected}" can not be loaded: {e}')
+    for system in [distribution_system] if distribution_system else map(get_distribution_system, DISTRIBUTION_SYSTEMS):
+        system.add_arguments(parser.add_argument_group(f'distribution system "{system.name}"'))
+
+    # Arguments for local cache of downloaded applications
+    parser.add_argument('--cache_dir', type=str, help='Directory of applications cache shared between runs', default=get_cache_dir('apps'))
+    parser.add_argument('--cache_max_size', type=int, help='Maximum size of applications cache in megabytes', default=APK_CACHE_MAX_SIZE_MB)
+    parser.add_argument('--metadata_cache_dir', type=str, help='Directory of distribution systems metadata cache shared between runs', default=get_cache_dir('metadata'))
+    parser.add_argument('--metadata_ttl', type=int, help='Seconds to keep HockeyApp applications and versions lists in cache', default=METADATA_TTL)
+    parser.add_argument('--refresh_metadata', action='store_true', help='Remove cached metadata of application before run')
+    parser.add_argument('--no_cache', action='store_true', help='Always download application and metadata and do not store them in cache')
+    parser.add_argument('--download_segments', type=int, help='Count of parallel connections used to download large application', default=DOWNLOAD_SEGMENTS)
+
+    # Arguments for http connections
+    parser.add_argument('--http_pool_size', type=int, help='Count of connections kept alive for every host', default=HTTP_POOL_SIZE)
+    parser.add_argument('--http_retries', type=int, help='Count of retries of idempotent requests failed with connection error or 5xx status code', default=HTTP_RETRIES)
+    parser.add_argument('--http_timeout', type=int, help='Seconds to wait for server response', default=HTTP_READ_TIMEOUT)
+    parser.add_argument('--rate_limit', type=float, help='Requests per second to every endpoint of Stingray, 0 to disable limit', default=RATE_LIMIT)
+    parser.add_argument('--rate_limit_burst', type=int, help='Requests to every endpoint of Stingray sent at once after idle period', default=RATE_LIMIT_BURST)
+    parser.add_argument('--heavy_concurrency', type=int, help='Count of uploads and report requests sent to Stingray at the same time', default=RATE_LIMIT_HEAVY_CONCURRENCY)
+    parser.add_argument('--rate_limit_dir', type=str, help='Directory to share rate limits with other processes on the host, e.g. ~/.cache/stingray_cli/ratelimit')
 
     # Arguments for Stingray
     parser.add_argument('--stingray_url', type=str, help='Stingray url', required=True)
     parser.add_argument('--company_id', type=int, help='Company id for starting scan', required=True)
-    parser.add_argument('--architecture_id', type=int, help='Architecture id to perform scan', required=True)
+    parser.add_argument('--architecture_id', type=int, nargs='+', help='Architecture id to perform scan, several ids start scan for each of them', required=True)
     parser.add_argument('--token', type=str, help='CI/CD Token for start scan and get results', required=True)
-    parser.add_argument('--profile_id', type=int, help='Project id for scan', required=True)
-    parser.add_argument('--testcase_id', type=int, help='Testcase Id')
+    parser.add_argument('--profile_id', type=int, nargs='+', help='Project id for scan, several ids start scan for each of them', required=True)
+    parser.add_argument('--testcase_id', type=int, nargs='+', help='Testcase Id, several ids start scan for each of them')
     parser.add_argument('--summary_report_json_file_name', type=str,  help='Name for the json file with summary results in structured format')
+    parser.add_argument('--report_dir', type=str, help='Directory to save PDF report', default='.')
     parser.add_argument('--nowait', '-nw', action='store_true', help='Wait before scan ends and get results if set to True. If set to False - just start scan and exit')
-
-    args = parser.parse_args()
-
-    if args.distribution_system == 'file' and args.file_path is None:
-        parser.error('"--distribution_system file" requires "--file_path" argument to be set')
-    elif args.distribution_system == 'hockeyapp' and (
-            args.hockey_token is None or
-            (args.hockey_bundle_id is None or args.hockey_public_id is None)):
-        parser.error('"--distribution_system hockeyapp" requires "--hockey_token" and "--hockey_app" arguments to be set')
-    elif args.distribution_system == 'appcenter' and (
-        args.appcenter_token is None or args.appcenter_owner_name is None or args.appcenter_app_name is None or (
-        args.appcenter_release_id is None and args.appcenter_app_version is None)):
-        parser.error(
-            '"--distribution_system appcenter" requires "--appcenter_token", "--appcenter_owner_name",  "--appcenter_app_name" and '
-            '"--appcenter_release_id" or "--appcenter_app_version" arguments to be set')
+    parser.add_argument('--scan_timeout', type=int, help='Seconds to wait for scan end', default=SCAN_TIMEOUT)
+    parser.add_argument('--event_listen', type=str, help='Address "<host>:<port>" of local listener of scan state events, 127.0.0.1 if host is not set. Scan is checked as soon as event is received and polled only as a safety net')
+    parser.add_argument('--event_token', type=str, help='Token required in "Authorization: Bearer" header of scan state events', default=os.environ.get('STINGRAY_CLI_EVENT_TOKEN'))
+    parser.add_argument('--event_poll_interval', type=int, help='Seconds between safety net checks of scan state when events are listened', default=EVENT_POLL_INTERVAL)
+    parser.add_argument('--upload_index', type=str, help='Path to index of applications already uploaded to Stingray', default=get_cache_dir('uploads.json'))
+    parser.add_argument('--force_upload', action='store_true', help='Upload application even if the same file was already uploaded to Stingray')
+    parser.add_argument('--journal_dir', type=str, help='Directory of journal of started scans which results are not collected yet', default=get_cache_dir('journal'))
+    parser.add_argument('--resume', action='store_true', help='Wait for not collected scan of the same application and parameters started earlier instead of starting new one')
+    parser.add_argument('--results_db', type=str, help='Path to SQLite database to append summary of finished scan to', default=os.environ.get('STINGRAY_CLI_RESULTS_DB'))
+
+    # Arguments for instrumentation
+    parser.add_argument('--trace_file', type=str, help='Name for the json file with duration of every phase of the run, transferred bytes and http requests')
+    parser.add_argument('--metrics_file', type=str, help='Name for the Prometheus textfile with metrics of the run')
+
+    args = parser.parse_args(argv)
+
+    if distribution_system is None:
+        parser.error(f'Unknown distribution system "{args.distribution_system}", '
+                     f'choose from: {", ".join(available_distribution_systems())}')
+    error = distribution_system.validate_arguments(args)
+    if error:
+        parser.error(error)
+    if args.event_listen and not args.event_token:
+        from stingray_cli.events import is_loopback
+        if not is_loopback(args.event_listen):
+            parser.error('--event_token is required when --event_listen is not a loopback address')
+
+    # Every combination of architecture, profile and testcase is a scan of the same uploaded application
+    args.matrix = list(dict.fromkeys((architecture_id, profile_id, testcase_id)
+                                     for architecture_id in args.architecture_id
+                                     for profile_id in args.profile_id
+                                     for testcase_id in args.testcase_id or [None]))
+    if len(args.matrix) == 1:
+        (args.architecture_id, args.profile_id, args.testcase_id), = args.matrix
+        args.matrix = None
     return args
 
 
-def main():
-    urllib3.disable_warnings()
+@metrics.timed('upload_lookup')
+def find_uploaded_application(stingray, upload_index, upload_key):
+    """
+    Find application with the same file uploaded earlier and still known by Stingray
+    :return: application (dict) or None if application should be uploaded
+    """
+    app_id = upload_index.get(upload_key)
+    if app_id is None:
+        return None
+
+    get_application_resp = stingray.get_application(app_id)
+    if get_application_resp.status_code == 404:
+        Log.info(f'Application with id {app_id} not found on server, upload it again')
+        upload_index.remove(upload_key)
+        return None
+    if not get_application_resp.status_code == 200:
+        Log.info(f'Unable to check application with id {app_id} on server, upload it again')
+        return None
+
+    Log.info(f'The same application file was already uploaded to server. Application id: {app_id}')
+    return {'id': app_id}
+
+
+def get_application_file(arguments, before_download=None):
+    """
+    Get application file from selected distribution system and check that it is valid application
+    :param before_download: function called before application is downloaded, e.g. to check Stingray first
+    :return: tuple (path to application file, sha256 of file or None if it is not known,
+             dict with name, version and fingerprint of application)
+    """
+    distribution_system = get_distribution_system(arguments.distribution_system)
+    cache, metadata_cache = None, None
+    if distribution_system.remote and not arguments.no_cache:
+        cache = ApkCache(arguments.cache_dir, arguments.cache_max_size)
+        metadata_cache = MetadataCache(arguments.metadata_cache_dir, arguments.metadata_ttl)
+    application = distribution_system.from_arguments(arguments, cache, metadata_cache)
+    application.before_download = before_download
+
+    if arguments.refresh_metadata:
+        application.invalidate_metadata()
+
+    apk_file = application.download_app()
+    apk_info = application.apk_info or application.inspect_app(apk_file)
+    Log.info(f"Application {apk_info['package']} version {apk_info['version_name']} ({apk_info['version_code']}), "
+             f"fingerprint: {apk_info['fingerprint']}")
+    return apk_file, application.sha256, {'application_name': apk_info['package'] or application.application_name,
+                                          'application_version': apk_info['version_name'] or application.application_version,
+                                          'fingerprint': apk_info['fingerprint']}
+
+
+def find_started_scan(stingray, journal, scan_details):
+    """
+    Find scan started earlier for the same application and parameters which results are not collected yet
+    :return: scan info (dict) or None if new scan should be started
+    """
+    entry = journal.find(stingray_url=stingray.url, **scan_details)
+    if entry is None:
+        return None
+
+    get_scan_info_resp = stingray.get_scan_info(entry['scan_id'])
+    if not get_scan_info_resp.status_code == 200:
+        Log.info(f"Scan with id {entry['scan_id']} from journal is not available on server, start new scan")
+        journal.remove(stingray.url, entry['scan_id'])
+        return None
+
+    Log.info(f"Resume scan with id {entry['scan_id']} started at {time.ctime(entry['started_at'])}")
+    return {**get_scan_info_resp.json(), 'application_id': entry.get('application_id')}
+
+
+@metrics.timed('preflight')
+def get_architecture(stingray, architecture_id):
+    """
+    Get architecture for scan. Also verifies that Stingray is available and CI/CD token is valid
+    :return: architecture (dict)
+    """
+    get_architecture_resp = stingray.get_architectures()
+    if get_architecture_resp.status_code in (401, 403):
+        Log.error(f'CI/CD token is not valid: {get_architecture_resp.text}')
+        sys.exit(1)
+    if not get_architecture_resp.status_code == 200:
+        Log.error('Error while getting architectures')
+        sys.exit(1)
 
-    arguments = parse_args()
+    architecture = next((arch for arch in get_architecture_resp.json() if arch.get('id', '') == architecture_id), None)
+    if architecture is None:
+        Log.error(f'Architecture with id {architecture_id} not found')
+        sys.exit(1)
+    return architecture
 
-    stingray_url = arguments.stingray_url
-    stingray_company = arguments.company_id
-    stingray_architecture = arguments.architecture_id
-    stingray_token = arguments.token
-    stingray_profile = arguments.profile_id
-    stingray_testcase_id = arguments.testcase_id
-    stingray_summary_file_name = arguments.summary_report_json_file_name
-    distribution_system = arguments.distribution_system
-    not_wait_scan_end = arguments.nowait
-
-    stingray_url = stingray_url if stingray_url.endswith('/') else f'{stingray_url}/'
-    stingray_url = stingray_url if stingray_url.endswith('rest/') else f'{stingray_url}rest'
-
-    apk_file = ''
-    if distribution_system == 'file':
-        apk_file = arguments.file_path
-    elif distribution_system == 'hockeyapp':
-        hockey_app = HockeyApp(arguments.hockey_token,
-                               arguments.hockey_bundle_id,
-                               arguments.hockey_public_id,
-                               arguments.hockey_version)
-        apk_file = hockey_app.download_app()
-    elif distribution_system == 'appcenter':
-        appcenter = AppCenter(arguments.appcenter_token,
-                              arguments.appcenter_app_name,
-                              arguments.appcenter_owner_name,
-                              arguments.appcenter_app_version,
-                              arguments.appcenter_release_id)
-        apk_file = appcenter.download_app()
-
-
-    stingray = Stingray(stingray_url, stingray_token, stingray_company)
-    get_architecture = stingray.get_architectures()
-    if not get_architecture.status_code == 200:
-        Log.error(f'Error while getting architectures')
+
+@metrics.timed('report')
+def save_report(stingray, scan_id, report_dir='.'):
+    """
+    Stream PDF report of the scan to file
+    :return: path to report
+    """
+    from stingray_cli.helpers.download import write_response
+
+    Log.info(f"Create and download report for scan with id {scan_id}.")
+    report_path = os.path.join(report_dir, f"scan-report-{scan_id}.pdf")
+
+    with stingray.download_report(scan_id, stream=True) as report:
+        if report.status_code != 200:
+            Log.error(f"Report creating failed with error {report.text}. Exit...")
+            sys.exit(1)
+
+        with open(report_path, 'wb') as f:
+            metrics.add_bytes('report', write_response(report, f))
+
+    Log.info(f"Report for scan {scan_id} successfully created and available at path: {report_path}.")
+    return report_path
+
+
+@metrics.timed('summary_report')
+def save_summary_report(stingray, scan_id, file_name):
+    """
+    Save JSON summary of the scan to file
+    :return: path to summary report
+    """
+    Log.info(f"Create and download JSON summary report for scan with id {scan_id} to file {file_name}.")
+    json_summary_report = stingray.get_scan_info(scan_id)
+    if json_summary_report.status_code != 200:
+        Log.error(f"JSON summary report creating failed with error {json_summary_report.text}. Exit...")
         sys.exit(1)
 
-    architectures = get_architecture.json()
-    stingray_architecture_type = next(arch for arch in architectures if arch.get('id', '') == stingray_architecture)
+    Log.info(f"Saving summary json results to file {file_name}.")
+    stingray_json_file = file_name if file_name.endswith('.json') else f'{file_name}.json'
+    with open(stingray_json_file, 'w') as fp:
+        json.dump(json_summary_report.json(), fp, indent=4)
+
+    Log.info(f"JSON report for scan {scan_id} successfully created and available at path: {stingray_json_file}.")
+    return stingray_json_file
+
+
+@metrics.timed('results')
+def save_results(arguments, stingray, dast, result):
+    """
+    Append summary of the finished scan to results database
+    """
+    from stingray_cli.helpers.results import ResultsStore
+
+    ResultsStore(arguments.results_db).add(stingray.url, dast,
+                                           state=result.get('state'),
+                                           application_id=result.get('application_id'),
+                                           application=result.get('application_name'),
+                                           version=result.get('application_version'),
+                                           sha256=result.get('sha256'),
+                                           distribution_system=arguments.distribution_system,
+                                           profile_id=arguments.profile_id,
+                                           testcase_id=arguments.testcase_id,
+                                           architecture_id=arguments.architecture_id)
+    Log.info(f"Summary of scan {dast['id']} saved to results database {arguments.results_db}")
+
+
+def save_metrics(arguments):
+    """
+    Export spans and metrics recorded by the run to files requested in arguments
+    """
+    job = Log.get_context()
+    if arguments.trace_file:
+        metrics.write_trace(arguments.trace_file, job)
+    if arguments.metrics_file:
+        metrics.write_prometheus(arguments.metrics_file, job)
+
+
+def run_scan(arguments, result=None):
+    """
+    Get application, upload it to Stingray, start scan and wait for results.
+    Independent stages run concurrently: application is downloaded while Stingray architectures are requested,
+    PDF and JSON reports are fetched at the same time. Exits with non-zero code if any stage failed.
+    Duration of every stage is recorded and exported to trace and metrics files even if the run failed
+    :param arguments: parsed command line arguments
+    :param result: optional dict filled with application id, scan id and paths to reports while scan goes on
+    :return: dict with results of the scan
+    """
+    result = {} if result is None else result
+    try:
+        with metrics.span('scan', distribution_system=arguments.distribution_system):
+            return _run_scan(arguments, result)
+    finally:
+        save_metrics(arguments)
+
+
+def _run_scan(arguments, result):
+    if arguments.event_listen and not arguments.nowait:
+        from stingray_cli.events import start_event_listener
+        start_event_listener(arguments.event_listen, arguments.event_token)
+        scan_poller.enable_events(arguments.event_poll_interval)
+
+    if arguments.matrix:
+        return run_matrix(arguments, result)
+
+    stingray, dast = start_scan(arguments, result)
 
-    Log.info(f'Start automated scan with test case Id: '
-             f'{stingray_testcase_id}, profile Id: {stingray_profile} and file: {apk_file}')
+    Log.info(f"Waiting until scan with id {dast['id']} finished.")
+    with metrics.span('wait', scan_id=dast['id']):
+        try:
+            dast = scan_poller.wait(stingray, dast['id'], arguments.scan_timeout)
+        except ScanPollError as e:
+            Log.error(str(e))
+            sys.exit(1)
+
+    return finish_scan(arguments, stingray, dast, result)
+
+
+def create_stingray(arguments):
+    """
+    Configure shared http session and create Stingray client
+    :return: Stingray client
+    """
+    from stingray_cli.stingray_client import Stingray
+    from stingray_cli.helpers.http import configure_session
+
+    configure_session(pool_size=arguments.http_pool_size,
+                      retries=arguments.http_retries,
+                      timeout=arguments.http_timeout,
+                      rate_limit=arguments.rate_limit,
+                      rate_limit_burst=arguments.rate_limit_burst,
+                      heavy_concurrency=arguments.heavy_concurrency,
+                      rate_limit_dir=arguments.rate_limit_dir)
+
+    # the same url is used in journal, upload index and results whatever way it is spelled in arguments
+    stingray_url = arguments.stingray_url.rstrip('/')
+    stingray_url = stingray_url if stingray_url.endswith('/rest') else f'{stingray_url}/rest'
+    return Stingray(stingray_url, arguments.token, arguments.company_id)
+
+
+def prepare_application(arguments, stingray, architecture_ids):
+    """
+    Get application file while architectures are requested from Stingray. Application metadata is resolved
+    concurrently with the request, but download is started only after Stingray and token are checked
+    :return: tuple (path to application file, sha256 of file or None, dict with name, version and fingerprint
+             of application, dict of architectures by id)
+    """
+    def preflight():
+        return {architecture_id: get_architecture(stingray, architecture_id) for architecture_id in architecture_ids}
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        architectures = executor.submit(Log.bind_context(preflight))
+        with metrics.span('acquire', distribution_system=arguments.distribution_system):
+            apk_file, apk_sha256, application_info = get_application_file(arguments, architectures.result)
+        return apk_file, apk_sha256, application_info, architectures.result()
+
+
+def upload_application(arguments, stingray, apk_file, apk_fingerprint, architecture_type):
+    """
+    Upload application for architecture type unless the same file is already uploaded
+    :return: application (dict)
+    """
+    upload_index = UploadIndex(arguments.upload_index)
+    upload_key = upload_index.make_key(stingray.url, arguments.company_id, architecture_type, apk_fingerprint)
+
+    application = None
+    if not arguments.force_upload:
+        application = find_uploaded_application(stingray, upload_index, upload_key)
+    if application is not None:
+        return application
 
     Log.info('Uploading application to server')
-    upload_application_resp = stingray.upload_application(apk_file, str(stingray_architecture_type['type']))
-    if not upload_application_resp.status_code == 201:
-        Log.error(f'Error while uploading application to server: {upload_application_resp.text}')
-        sys.exit(1)
+    with metrics.span('upload'):
+        upload_application_resp = stingray.upload_application(apk_file, str(architecture_type))
+        if not upload_application_resp.status_code == 201:
+            Log.error(f'Error while uploading application to server: {upload_application_resp.text}')
+            sys.exit(1)
+    metrics.add_bytes('upload', os.path.getsize(apk_file))
 
     application = upload_application_resp.json()
+    upload_index.put(upload_key, application['id'])
     Log.info(f"Application uploaded successfully. Application id: {application['id']}")
-
+    return application
+
+
+def get_scan_details(arguments, application_info):
+    """
+    :return: dict with parameters of the scan, the same parameters are used to find scan in journal
+    """
+    return {'company_id': arguments.company_id,
+            'architecture_id': arguments.architecture_id,
+            'profile_id': arguments.profile_id,
+            'testcase_id': arguments.testcase_id,
+            # fingerprint is read from zip central directory, so the whole file is not hashed to find started scan
+            'fingerprint': application_info['fingerprint']}
+
+
+def create_scan(arguments, stingray, application, apk_file, apk_sha256, application_info):
+    """
+    Create and start autoscan of uploaded application with profile, testcase and architecture of arguments
+    and add it to journal
+    :return: started scan (dict)
+    """
     Log.info(f"Create autoscan for application {application['id']}")
-    create_dast_resp = stingray.create_auto_scan(profile_id=stingray_profile,
-                                                 app_id=application['id'],
-                                                 arch_id=stingray_architecture,
-                                                 test_case_id=stingray_testcase_id)
-
-    if not create_dast_resp.status_code == 201:
-        Log.error(f'Error while creating autoscan: {create_dast_resp.text}')
-        sys.exit(1)
+    with metrics.span('create'):
+        create_dast_resp = stingray.create_auto_scan(profile_id=arguments.profile_id,
+                                                     app_id=application['id'],
+                                                     arch_id=arguments.architecture_id,
+                                                     test_case_id=arguments.testcase_id)
+
+        if not create_dast_resp.status_code == 201:
+            Log.error(f'Error while creating autoscan: {create_dast_resp.text}')
+            sys.exit(1)
 
     dast = create_dast_resp.json()
-    Log.info(f"Autoscan created successfully. Scan id: {dast['id']}")
-
     if not 'id' in dast and dast.get('id', '') != '':
         Log.error(f'Something went wrong while creating autoscan: {dast}')
         sys.exit(1)
+    Log.info(f"Autoscan created successfully. Scan id: {dast['id']}")
 
     Log.info(f"Start autoscan with id {dast['id']}")
-    start_dast_resp = stingray.start_scan(dast['id'])
-    if not start_dast_resp.status_code == 200:
-        Log.error(f"Error while starting autoscan with id {dast['id']}: {start_dast_resp.text}")
-        sys.exit(1)
+    with metrics.span('start', scan_id=dast['id']):
+        start_dast_resp = stingray.start_scan(dast['id'])
+        if not start_dast_resp.status_code == 200:
+            Log.error(f"Error while starting autoscan with id {dast['id']}: {start_dast_resp.text}")
+            sys.exit(1)
+
+    summary_file_name = arguments.summary_report_json_file_name
+    ScanJournal(arguments.journal_dir).add(stingray.url, dast['id'],
+                                           application_id=application['id'],
+                                           application=os.path.abspath(apk_file),
+                                           distribution_system=arguments.distribution_system,
+                                           summary_report_json_file_name=summary_file_name and os.path.abspath(summary_file_name),
+                                           report_dir=os.path.abspath(arguments.report_dir),
+                                           application_info=application_info,
+                                           sha256=apk_sha256,
+                                           **get_scan_details(arguments, application_info))
+    return dast
+
+
+def start_scan(arguments, result):
+    """
+    Get application, upload it to Stingray and start scan. Exits with zero code if scan should not be waited
+    :param arguments: parsed command line arguments
+    :param result: dict filled with application id and scan id
+    :return: tuple (Stingray client, started scan (dict))
+    """
+    stingray = create_stingray(arguments)
+    apk_file, apk_sha256, application_info, architectures = prepare_application(arguments, stingray,
+                                                                                [arguments.architecture_id])
+    result.update(application_info)
+    result['sha256'] = apk_sha256
 
-    if not_wait_scan_end:
+    Log.info(f'Start automated scan with test case Id: '
+             f'{arguments.testcase_id}, profile Id: {arguments.profile_id} and file: {apk_file}')
+
+    dast = None
+    if arguments.resume:
+        dast = find_started_scan(stingray, ScanJournal(arguments.journal_dir),
+                                 get_scan_details(arguments, application_info))
+        if dast:
+            result['application_id'] = dast.get('application_id')
+            result['scan_id'] = dast['id']
+
+    if dast is None:
+        application = upload_application(arguments, stingray, apk_file, application_info['fingerprint'],
+                                         architectures[arguments.architecture_id]['type'])
+        result['application_id'] = application['id']
+
+        dast = create_scan(arguments, stingray, application, apk_file, apk_sha256, application_info)
+        result['scan_id'] = dast['id']
+        Log.info("Autoscan started successfully.")
+
+    if arguments.nowait:
         Log.info('Scan successfully started. Don`t wait for end, exit with zero code')
         sys.exit(0)
-    Log.info(f"Autoscan started successfully.")
-    Log.info(f"Check scan state with id {dast['id']}")
-    get_dast_info_resp = stingray.get_scan_info(dast['id'])
-    if not get_dast_info_resp.status_code == 200:
-        Log.error(f"Error while getting scan info with id {dast['id']}: {get_dast_info_resp.text}")
-        sys.exit(1)
-
-    dast = get_dast_info_resp.json()
-    dast_status = dast['state']
-    Log.info(f"Current scan status: {DastStateDict.get(dast_status)}")
-    count = 0
-
-    Log.info(f"Waiting until scan with id {dast['id']} started.")
-    while dast_status in (DastState.CREATED, DastState.STARTING) and count < TRY_COUNT:
-        Log.info(f"Try to get scan status for scan id {dast['id']}. Count number {count}")
-        get_dast_info_resp = stingray.get_scan_info(dast['id'])
-        if not get_dast_info_resp.status_code == 200:
-            Log.error(f"Error while getting scan info with id {dast['id']}: {get_dast_info_resp.text}")
-            sys.exit(1)
-
-        dast = get_dast_info_resp.json()
-        dast_status = dast['state']
-        Log.info(f"Current scan status: {DastStateDict.get(dast_status)}")
-        count += 1
-        Log.info(f"Wait {SLEEP_TIMEOUT} seconds and try again")
-        time.sleep(SLEEP_TIMEOUT)
+    return stingray, dast
+
+
+def finish_scan(arguments, stingray, dast, result):
+    """
+    Check state of finished scan and save its reports. Exits with non-zero code if scan is not successful
+    :param arguments: parsed command line arguments
+    :param stingray: Stingray client
+    :param dast: the last received scan info (dict)
+    :param result: dict filled with scan state and paths to reports
+    :return: dict with results of the scan
+    """
+    stingray_summary_file_name = arguments.summary_report_json_file_name
+    result['state'] = DastStateDict.get(dast['state'])
 
-    if not dast['state'] in (DastState.STARTED, DastState.ANALYZING, DastState.SUCCESS):
-        Log.error(f"Error with scan id {dast['id']}. Current scan status: {dast['state']},"
-                  f" but expected to be {DastState.STARTED}, {DastState.ANALYZING} or {DastState.SUCCESS}")
+    if dast['state'] not in ScanPoller.terminal_states:
+        Log.error(f"Scan with id {dast['id']} is not finished in {arguments.scan_timeout} seconds. "
+                  f"Current scan status: {DastStateDict.get(dast['state'])}. Exit with error status code.")
         sys.exit(1)
-    Log.info(f"Scan with {dast['id']} finished and now analyzing. Wait until analyzing stage is finished.")
 
-    Log.info(f"Waiting until scan with id {dast['id']} finished.")
-    get_dast_info_resp = stingray.get_scan_info(dast['id'])
-    if not get_dast_info_resp.status_code == 200:
-        Log.error(f"Error while getting scan info with id {dast['id']}: {get_dast_info_resp.text}")
-        sys.exit(1)
-    dast = get_dast_info_resp.json()
-    dast_status = dast['state']
-    Log.info(f"Current scan status: {DastStateDict.get(dast_status)}")
-    count = 0
-
-    while dast_status in (DastState.STARTED, DastState.ANALYZING) and count < TRY_COUNT:
-        Log.info(f"Try to get scan status for scan id {dast['id']}. Count number {count}")
-        get_dast_info_resp = stingray.get_scan_info(dast['id'])
-        if not get_dast_info_resp.status_code == 200:
-            Log.error(f"Error while getting scan info with id {dast['id']}: {get_dast_info_resp.text}")
-            sys.exit(1)
-        dast = get_dast_info_resp.json()
-        dast_status = dast['state']
-        Log.info(f"Current scan status: {DastStateDict.get(dast_status)}")
-        count += 1
-        Log.info(f"Wait {SLEEP_TIMEOUT} seconds and try again")
-        time.sleep(SLEEP_TIMEOUT)
-
-    Log.info(f"Check is scan with id {dast['id']} finished correctly.")
-    get_dast_info_resp = stingray.get_scan_info(dast['id'])
-    if not get_dast_info_resp.status_code == 200:
-        Log.error(f"Error while getting scan info with id {dast['id']}: {get_dast_info_resp.text}")
-        sys.exit(1)
-    dast = get_dast_info_resp.json()
+    if arguments.results_db:
+        save_results(arguments, stingray, dast, result)
 
+    journal = ScanJournal(arguments.journal_dir)
     if not dast['state'] == DastState.SUCCESS:
+        journal.remove(stingray.url, dast['id'])
         Log.error(f"Expected state {DastStateDict.get(DastState.SUCCESS)}, but in real it was {dast['state']}. Exit with error status code.")
         sys.exit(1)
 
-    Log.info(f"Create and download report for scan with id {dast['id']}.")
-    report_path = f"./scan-report-{dast['id']}.pdf"
-
-    report = stingray.download_report(dast['id'])
-    if report.status_code != 200:
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        report = executor.submit(Log.bind_context(save_report), stingray, dast['id'], arguments.report_dir)
+        if stingray_summary_file_name:
+            summary_report = executor.submit(Log.bind_context(save_summary_report),
+                                             stingray, dast['id'], stingray_summary_file_name)
+            result['summary_report_path'] = summary_report.result()
+        result['report_path'] = report.result()
 
-        Log.error(f"Report creating failed with error {report.text}. Exit...")
-        sys.exit(1)
+    journal.remove(stingray.url, dast['id'])
+    Log.info('Job completed successfully')
+    return result
+
+
+def get_cell_arguments(arguments, architecture_id, profile_id, testcase_id):
+    """
+    Arguments of single scan of the matrix. Every scan saves JSON summary to its own file
+    :return: parsed command line arguments with one architecture, profile and testcase
+    """
+    summary_file_name = arguments.summary_report_json_file_name
+    if summary_file_name:
+        base_name = summary_file_name[:-len('.json')] if summary_file_name.endswith('.json') else summary_file_name
+        testcase_suffix = '' if testcase_id is None else f'-testcase{testcase_id}'
+        summary_file_name = f'{base_name}-arch{architecture_id}-profile{profile_id}{testcase_suffix}.json'
+    return argparse.Namespace(**{**vars(arguments),
+                                 'architecture_id': architecture_id,
+                                 'profile_id': profile_id,
+                                 'testcase_id': testcase_id,
+                                 'matrix': None,
+                                 'summary_report_json_file_name': summary_file_name})
+
+
+def run_matrix(arguments, result):
+    """
+    Scan application with every combination of architectures, profiles and testcases.
+    Application is downloaded once and uploaded once for every architecture type, then scans are started
+    at the same time and waited together. Exits with the highest exit code of scans if any of them failed
+    :param arguments: parsed command line arguments with matrix of scans
+    :param result: dict filled with application info and results of every scan in "cells"
+    :return: dict with results of the scans
+    """
+    from stingray_cli.batch import call_job
+
+    job = Log.get_context()
+    stingray = create_stingray(arguments)
+    architecture_ids = list(dict.fromkeys(architecture_id for architecture_id, _, _ in arguments.matrix))
+    apk_file, apk_sha256, application_info, architectures = prepare_application(arguments, stingray, architecture_ids)
+    result.update(application_info)
+    result['sha256'] = apk_sha256
+
+    cells = [{'arguments': get_cell_arguments(arguments, *cell),
+              'result': {'architecture_id': cell[0], 'profile_id': cell[1], 'testcase_id': cell[2],
+                         **application_info, 'sha256': apk_sha256}}
+             for cell in arguments.matrix]
+    result['cells'] = [cell['result'] for cell in cells]
+    Log.info(f'Start {len(cells)} automated scans of file {apk_file} with architectures, profiles and testcases: '
+             f"{', '.join(str(cell) for cell in arguments.matrix)}")
+
+    journal = ScanJournal(arguments.journal_dir)
+    for cell in cells:
+        if arguments.resume:
+            cell['dast'] = find_started_scan(stingray, journal, get_scan_details(cell['arguments'], application_info))
+        if cell.get('dast'):
+            cell['result'].update(application_id=cell['dast'].get('application_id'), scan_id=cell['dast']['id'])
+
+    architecture_types = list(dict.fromkeys(architectures[cell['arguments'].architecture_id]['type']
+                                            for cell in cells if not cell.get('dast')))
+    with ThreadPoolExecutor(max_workers=max(len(architecture_types), 1)) as executor:
+        uploads = {architecture_type: executor.submit(Log.bind_context(upload_application), arguments, stingray,
+                                                      apk_file, application_info['fingerprint'], architecture_type)
+                   for architecture_type in architecture_types}
+        applications = {architecture_type: upload.result() for architecture_type, upload in uploads.items()}
+
+    def start_cell(cell):
+        if cell.get('dast'):
+            return cell['dast']
+        application = applications[architectures[cell['arguments'].architecture_id]['type']]
+        cell['result']['application_id'] = application['id']
+        dast = create_scan(cell['arguments'], stingray, application, apk_file, apk_sha256, application_info)
+        cell['result']['scan_id'] = dast['id']
+        return dast
+
+    def finish_cell(cell, future):
+        try:
+            dast = future.result()
+        except ScanPollError as e:
+            Log.error(f"Waiting for scan with id {cell['dast']['id']} failed: {e}")
+            sys.exit(1)
+        Log.info(f"Scan with id {dast['id']} finished")
+        return finish_scan(cell['arguments'], stingray, dast, cell['result'])
+
+    with ThreadPoolExecutor(max_workers=len(cells)) as executor:
+        for cell, (dast, exit_code) in zip(cells, executor.map(lambda cell: call_job(job, start_cell, cell), cells)):
+            cell['dast'], cell['result']['exit_code'] = dast, exit_code
+
+        started = [cell for cell in cells if cell['result']['exit_code'] == 0]
+        if arguments.nowait:
+            Log.info(f"{len(started)} of {len(cells)} scans successfully started. Don`t wait for end")
+        else:
+            Log.info(f"Waiting until scans with ids {', '.join(str(cell['dast']['id']) for cell in started)} finished.")
+            with metrics.span('wait', scans=len(started)):
+                finished = [executor.submit(call_job, job, finish_cell, cell,
+                                            scan_poller.watch(stingray, cell['dast']['id'], arguments.scan_timeout))
+                            for cell in started]
+                for cell, future in zip(started, finished):
+                    cell['result']['exit_code'] = future.result()[1]
+
+    Log.info('Matrix summary:')
+    for cell in result['cells']:
+        status = 'OK' if cell['exit_code'] == 0 else f"FAILED ({cell['exit_code']})"
+        testcase = '' if cell['testcase_id'] is None else f", testcase {cell['testcase_id']}"
+        Log.info(f"architecture {cell['architecture_id']}, profile {cell['profile_id']}{testcase}: {status}, "
+                 f"scan id: {cell.get('scan_id')}, state: {cell.get('state')}")
+
+    exit_code = max(cell['exit_code'] for cell in result['cells'])
+    Log.info(f"Scans completed: {sum(cell['exit_code'] == 0 for cell in result['cells'])}, "
+             f"failed: {sum(cell['exit_code'] != 0 for cell in result['cells'])}")
+    if exit_code:
+        sys.exit(exit_code)
+    return result
 
-    with open(report_path, 'wb') as f:
-        f.write(report.content)
-    Log.info(f"Report for scan {dast['id']} successfully created and available at path: {report_path}.")
 
-    if stingray_summary_file_name:
-        Log.info(f"Create and download JSON summary report for scan with id {dast['id']} to file {stingray_summary_file_name}.")
-        json_summary_report = stingray.get_scan_info(dast['id'])
-        if json_summary_report.status_code != 200:
-            Log.error(f"JSON summary report creating failed with error {json_summary_report.text}. Exit...")
-            sys.exit(1)
 
-        Log.info(f"Saving summary json results to file {stingray_summary_file_name}.")
-        stingray_json_file = stingray_summary_file_name if stingray_summary_file_name.endswith(
-            '.json') else f'{stingray_summary_file_name}.json'
-        with open(stingray_json_file, 'w') as fp:
-            json.dump(json_summary_report.json(), fp, indent=4)
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        module_name, function_name = COMMANDS[sys.argv[1]].split(':')
+        return getattr(importlib.import_module(module_name), function_name)(sys.argv[2:])
 
-        Log.info(f"JSON report for scan {dast['id']} successfully created and available at path: {stingray_json_file}.")
+    arguments = parse_args()
+    import urllib3
+    urllib3.disable_warnings()
+    run_scan(arguments)
 
-    Log.info('Job completed successfully')
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
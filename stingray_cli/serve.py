@@ -0,0 +1,431 @@
+import os
+import io
+import sys
+import hmac
+import json
+import time
+import uuid
+import secrets
+import socket
+import argparse
+import threading
+import http.client
+import contextlib
+from socketserver import ThreadingMixIn, UnixStreamServer
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+
+try:
+    from .helpers.const import SERVE_HOST, SERVE_PORT, SERVE_WORKERS, SERVE_JOB_TTL, SERVE_MAX_WAIT, \
+        SERVE_PENDING_EXIT_CODE, EVENT_POLL_INTERVAL
+    from .helpers.logging import Log
+    from .helpers.helpers import get_cache_dir
+    from .helpers.metrics import metrics
+    from .poller import scan_poller, ScanPollError
+    from .events import notify_scans
+    from .batch import call_job, job_argv
+    from .run_stingray_scan import parse_args as parse_scan_args, start_scan, finish_scan, run_matrix, \
+        save_metrics
+except ImportError:
+    from stingray_cli.helpers.const import SERVE_HOST, SERVE_PORT, SERVE_WORKERS, SERVE_JOB_TTL, SERVE_MAX_WAIT, \
+        SERVE_PENDING_EXIT_CODE, EVENT_POLL_INTERVAL
+    from stingray_cli.helpers.logging import Log
+    from stingray_cli.helpers.helpers import get_cache_dir
+    from stingray_cli.helpers.metrics import metrics
+    from stingray_cli.poller import scan_poller, ScanPollError
+    from stingray_cli.events import notify_scans
+    from stingray_cli.batch import call_job, job_argv
+    from stingray_cli.run_stingray_scan import parse_args as parse_scan_args, start_scan, finish_scan, run_matrix, \
+        save_metrics
+
+DEFAULT_SERVER = os.environ.get('STINGRAY_CLI_SERVER', f'http://{SERVE_HOST}:{SERVE_PORT}')
+# token of job API shared by daemon and clients of the same user, created by daemon if it is not set
+API_TOKEN_FILE = get_cache_dir('serve.token')
+# arguments of single scan with local paths, resolved by submit command because daemon has its own working directory
+PATH_ARGUMENTS = ('--file_path', '--summary_report_json_file_name', '--report_dir', '--trace_file', '--metrics_file',
+                  '--cache_dir', '--metadata_cache_dir', '--upload_index', '--journal_dir', '--results_db',
+                  '--rate_limit_dir')
+
+
+def get_api_token(token=None, create=False):
+    """
+    Token of job API: set explicitly, by STINGRAY_CLI_SERVE_TOKEN or read from API_TOKEN_FILE readable only by owner
+    :param create: create token file with random token if it does not exist
+    :return: token or None if it is not set
+    """
+    token = token or os.environ.get('STINGRAY_CLI_SERVE_TOKEN')
+    if token:
+        return token
+    try:
+        with open(API_TOKEN_FILE) as fp:
+            return fp.read().strip()
+    except FileNotFoundError:
+        if not create:
+            return None
+
+    os.makedirs(os.path.dirname(API_TOKEN_FILE), exist_ok=True)
+    token = secrets.token_urlsafe(32)
+    with os.fdopen(os.open(API_TOKEN_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), 'w') as fp:
+        fp.write(token)
+    Log.info(f'Token of job API is saved to {API_TOKEN_FILE}')
+    return token
+
+
+class Job:
+    """
+    Scan job submitted to daemon
+    """
+
+    def __init__(self, argv):
+        self.id = uuid.uuid4().hex
+        self.argv = argv
+        self.status = 'queued'
+        self.exit_code = None
+        self.result = {}
+        self.submitted_at = time.time()
+        self.finished_at = None
+        self.done = threading.Event()
+
+    @property
+    def name(self):
+        return self.id[:8]
+
+    def to_dict(self):
+        return {'id': self.id,
+                'status': self.status,
+                'exit_code': self.exit_code,
+                'submitted_at': self.submitted_at,
+                'finished_at': self.finished_at,
+                **self.result}
+
+
+class JobRunner:
+    """
+    Runs submitted jobs. Workers only get application, upload it and start scan, waiting of all started scans
+    is driven by the shared scan poller and reports are saved by workers when scan is finished,
+    so count of workers does not limit count of scans waited at the same time.
+    Job with matrix of scans holds worker until all its scans are finished
+    """
+
+    def __init__(self, workers=SERVE_WORKERS, token=None):
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.token = token
+        self.jobs = {}
+        self._lock = threading.Lock()
+        self._parse_lock = threading.Lock()
+
+    def submit(self, argv):
+        """
+        Validate arguments of scan and queue the job
+        :param argv: command line arguments of single scan
+        :return: job
+        :raise ValueError: if arguments are not valid
+        """
+        if self.token and '--token' not in argv:
+            argv = [*argv, '--token', self.token]
+        arguments = self._parse(argv)
+
+        job = Job(argv)
+        with self._lock:
+            self._forget_finished()
+            self.jobs[job.id] = job
+        self.executor.submit(self._start, job, arguments)
+        Log.info(f'Job {job.id} submitted')
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def list(self):
+        with self._lock:
+            return list(self.jobs.values())
+
+    def _parse(self, argv):
+        # argparse reports errors to stderr and exits, capture the message to return it to the client
+        stderr = io.StringIO()
+        with self._parse_lock, contextlib.redirect_stderr(stderr):
+            try:
+                return parse_scan_args(argv)
+            except SystemExit:
+                raise ValueError(stderr.getvalue().strip().splitlines()[-1] if stderr.getvalue() else 'Invalid arguments')
+
+    def _forget_finished(self):
+        expired = time.time() - SERVE_JOB_TTL
+        for job_id in [job.id for job in self.jobs.values() if job.finished_at and job.finished_at < expired]:
+            del self.jobs[job_id]
+
+    def _start(self, job, arguments):
+        job.status = 'running'
+        if arguments.matrix:
+            # scans of the matrix are started and waited together by worker of the job
+            _, exit_code = call_job(job.name, run_matrix, arguments, job.result)
+            return self._complete(job, arguments, exit_code)
+
+        started, exit_code = call_job(job.name, start_scan, arguments, job.result)
+        if started is None:
+            # failed or started without waiting for scan end
+            return self._complete(job, arguments, exit_code)
+
+        stingray, dast = started
+        job.status = 'waiting'
+        Log.set_context(job.name)
+        future = scan_poller.watch(stingray, dast['id'], arguments.scan_timeout)
+        Log.set_context(None)
+        waiting_since = time.time(), time.monotonic()
+        future.add_done_callback(
+            lambda done: self.executor.submit(self._finish, job, arguments, stingray, done, waiting_since))
+
+    def _finish(self, job, arguments, stingray, future, waiting_since):
+        job.status = 'running'
+        Log.set_context(job.name)
+        metrics.add_span('wait', waiting_since[0], time.monotonic() - waiting_since[1], scan_id=job.result.get('scan_id'))
+        try:
+            dast = future.result()
+        except ScanPollError as e:
+            Log.error(str(e))
+            return self._complete(job, arguments, 1)
+        finally:
+            Log.set_context(None)
+
+        _, exit_code = call_job(job.name, finish_scan, arguments, stingray, dast, job.result)
+        self._complete(job, arguments, exit_code)
+
+    def _complete(self, job, arguments, exit_code):
+        call_job(job.name, save_metrics, arguments)
+        metrics.forget(job.name)
+        job.exit_code = exit_code
+        job.status = 'finished'
+        job.finished_at = time.time()
+        job.done.set()
+        Log.info(f'Job {job.id} finished with exit code {exit_code}')
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """
+    Local job API, every request except health check must have "Authorization: Bearer <api token>" header,
+    events are also accepted with event token:
+        POST /jobs with {"argv": [...]} or job in manifest format - submit job, returns {"id": ..., "status": ...}
+        GET /jobs/<id>?wait=<seconds> - job status and results, waits up to SERVE_MAX_WAIT seconds for job end
+        GET /jobs - all jobs
+        GET /health - status of daemon
+        POST /events with scan state event - check state of the scan now, see events.event_scan_ids
+    """
+    protocol_version = 'HTTP/1.1'
+
+    @property
+    def runner(self):
+        return self.server.runner
+
+    def authorized(self, *tokens):
+        authorization = self.headers.get('Authorization', '')
+        return any(token and hmac.compare_digest(authorization, f'Bearer {token}') for token in tokens)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parts = url.path.strip('/').split('/')
+        if parts != ['health'] and not self.authorized(self.server.api_token):
+            return self.send_json(401, {'error': 'Invalid token'})
+        if parts == ['health']:
+            jobs = self.runner.list()
+            return self.send_json(200, {'status': 'ok',
+                                        'jobs': {status: sum(job.status == status for job in jobs)
+                                                 for status in ('queued', 'running', 'waiting', 'finished')}})
+        if parts == ['jobs']:
+            return self.send_json(200, [job.to_dict() for job in self.runner.list()])
+        if len(parts) == 2 and parts[0] == 'jobs':
+            job = self.runner.get(parts[1])
+            if job is None:
+                return self.send_json(404, {'error': f'Job {parts[1]} not found'})
+            try:
+                wait = float(parse_qs(url.query).get('wait', [0])[0])
+            except ValueError:
+                return self.send_json(400, {'error': 'Parameter wait must be number of seconds'})
+            job.done.wait(min(wait, SERVE_MAX_WAIT))
+            return self.send_json(200, job.to_dict())
+        self.send_json(404, {'error': 'Not found'})
+
+    def do_POST(self):
+        if self.path.rstrip('/') not in ('/jobs', '/events'):
+            return self.send_json(404, {'error': 'Not found'})
+        tokens = (self.server.api_token, self.server.event_token) if self.path.rstrip('/') == '/events' else \
+            (self.server.api_token,)
+        if not self.authorized(*tokens):
+            return self.send_json(401, {'error': 'Invalid token'})
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'{}')
+            if self.path.rstrip('/') == '/events':
+                return self.send_json(202, {'watched': notify_scans(body)})
+            argv = [str(item) for item in body['argv']] if 'argv' in body else job_argv(body)
+            job = self.runner.submit(argv)
+        except (ValueError, TypeError, AttributeError) as e:
+            return self.send_json(400, {'error': str(e)})
+        self.send_json(202, {'id': job.id, 'status': job.status})
+
+    def send_json(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class UnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        # BaseHTTPRequestHandler expects (host, port) address
+        return request, ('local', 0)
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout):
+        super().__init__('localhost', timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+def create_server(address, runner, api_token, event_token=None):
+    """
+    :param address: "unix:<path>" for Unix socket or "http://<host>:<port>"
+    :param api_token: token required by job API
+    :param event_token: token also accepted by /events, e.g. token of Stingray webhook
+    """
+    if address.startswith('unix:'):
+        path = address[len('unix:'):]
+        if os.path.exists(path):
+            os.remove(path)
+        server = UnixHTTPServer(path, RequestHandler)
+        os.chmod(path, 0o600)
+    else:
+        url = urlsplit(address if '://' in address else f'http://{address}')
+        server = ThreadingHTTPServer((url.hostname or SERVE_HOST, url.port or SERVE_PORT), RequestHandler)
+        server.daemon_threads = True
+    server.runner = runner
+    server.api_token = api_token
+    server.event_token = event_token
+    return server
+
+
+def request(address, method, path, data=None, api_token=None, timeout=SERVE_MAX_WAIT + 30):
+    """
+    Send request to daemon
+    :return: tuple (status code, response json)
+    """
+    headers = {'Content-Type': 'application/json'}
+    api_token = get_api_token(api_token)
+    if api_token:
+        headers['Authorization'] = f'Bearer {api_token}'
+
+    if address.startswith('unix:'):
+        connection = UnixHTTPConnection(address[len('unix:'):], timeout)
+    else:
+        url = urlsplit(address if '://' in address else f'http://{address}')
+        connection = http.client.HTTPConnection(url.hostname or SERVE_HOST, url.port or SERVE_PORT, timeout=timeout)
+
+    body = json.dumps(data) if data is not None else None
+    try:
+        connection.request(method, path, body=body, headers=headers)
+        response = connection.getresponse()
+        return response.status, json.loads(response.read() or b'{}')
+    except OSError as e:
+        Log.error(f'Unable to connect to stingray_cli daemon at {address}: {e}')
+        sys.exit(1)
+    finally:
+        connection.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='stingray_cli serve',
+                                     description='Run daemon accepting scan jobs over local http or Unix socket. '
+                                                 'Sessions, architectures and caches are kept warm between jobs')
+    parser.add_argument('--listen', type=str, help='"http://<host>:<port>" or "unix:<path to socket>"', default=DEFAULT_SERVER)
+    parser.add_argument('--workers', type=int, help='Count of jobs getting application, uploading it and saving reports at the same time', default=SERVE_WORKERS)
+    parser.add_argument('--token', type=str, help='CI/CD Token used for jobs submitted without token', default=os.environ.get('STINGRAY_TOKEN'))
+    parser.add_argument('--api_token', type=str, help=f'Token required in "Authorization: Bearer" header of job API requests, by default it is taken from STINGRAY_CLI_SERVE_TOKEN or {API_TOKEN_FILE} created on the first start')
+    parser.add_argument('--event_token', type=str, help='Token also accepted in "Authorization: Bearer" header of scan state events', default=os.environ.get('STINGRAY_CLI_EVENT_TOKEN'))
+    parser.add_argument('--events', action='store_true', help='Scan state events are posted to /events of daemon, scans are polled only as a safety net')
+    parser.add_argument('--event_poll_interval', type=int, help='Seconds between safety net checks of scan state when events are enabled', default=EVENT_POLL_INTERVAL)
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    import urllib3
+    urllib3.disable_warnings()
+    arguments = parse_args(argv)
+
+    if arguments.events:
+        scan_poller.enable_events(arguments.event_poll_interval)
+    server = create_server(arguments.listen, JobRunner(arguments.workers, arguments.token),
+                           get_api_token(arguments.api_token, create=True), arguments.event_token)
+    Log.info(f'Daemon is listening on {arguments.listen}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        Log.info('Daemon stopped')
+    finally:
+        server.server_close()
+
+
+def submit(argv=None):
+    """
+    Submit scan to daemon and print job id. All arguments except --server are arguments of single scan
+    """
+    parser = argparse.ArgumentParser(prog='stingray_cli submit', allow_abbrev=False,
+                                     description='Submit scan to daemon and print job id. '
+                                                 'Other arguments are the same as arguments of single scan')
+    parser.add_argument('--server', type=str, help='Address of daemon, "http://<host>:<port>" or "unix:<path>"', default=DEFAULT_SERVER)
+    parser.add_argument('--api_token', type=str, help=f'Token of job API, by default it is taken from STINGRAY_CLI_SERVE_TOKEN or {API_TOKEN_FILE}')
+    arguments, scan_argv = parser.parse_known_args(argv)
+
+    scan_argv = [os.path.abspath(value) if index and scan_argv[index - 1] in PATH_ARGUMENTS else value
+                 for index, value in enumerate(scan_argv)]
+    if '--report_dir' not in scan_argv:
+        scan_argv += ['--report_dir', os.getcwd()]
+
+    status, response = request(arguments.server, 'POST', '/jobs', {'argv': scan_argv}, arguments.api_token)
+    if status != 202:
+        Log.error(f"Job is not accepted: {response.get('error')}")
+        sys.exit(2 if status == 400 else 1)
+    print(response['id'])
+
+
+def result(argv=None):
+    """
+    Print result of job. Exit code is the exit code of the job or SERVE_PENDING_EXIT_CODE if job is not finished
+    """
+    parser = argparse.ArgumentParser(prog='stingray_cli result',
+                                     description='Print status and results of submitted job in json format')
+    parser.add_argument('job_id', type=str, help='Id of job printed by submit command')
+    parser.add_argument('--server', type=str, help='Address of daemon, "http://<host>:<port>" or "unix:<path>"', default=DEFAULT_SERVER)
+    parser.add_argument('--wait', type=int, help='Seconds to wait for job end', default=0)
+    parser.add_argument('--api_token', type=str, help=f'Token of job API, by default it is taken from STINGRAY_CLI_SERVE_TOKEN or {API_TOKEN_FILE}')
+    arguments = parser.parse_args(argv)
+
+    deadline = time.monotonic() + arguments.wait
+    while True:
+        wait = max(min(deadline - time.monotonic(), SERVE_MAX_WAIT), 0)
+        status, job = request(arguments.server, 'GET', f'/jobs/{arguments.job_id}?wait={wait:.0f}', api_token=arguments.api_token)
+        if status != 200:
+            Log.error(job.get('error'))
+            sys.exit(1)
+        if job['status'] == 'finished' or time.monotonic() >= deadline:
+            break
+
+    print(json.dumps(job, indent=4))
+    sys.exit(job['exit_code'] if job['status'] == 'finished' else SERVE_PENDING_EXIT_CODE)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+import json
+import time
+import threading
+
+from stingray_cli_core import StingrayToken
+
+try:
+    from .helpers.const import ARCHITECTURES_TTL
+    from .helpers.http import get_session
+    from .helpers.upload import MultipartFile
+except ImportError:
+    from stingray_cli.helpers.const import ARCHITECTURES_TTL
+    from stingray_cli.helpers.http import get_session
+    from stingray_cli.helpers.upload import MultipartFile
+
+
+class Stingray(StingrayToken):
+    """
+    Class for interact with Stingray system through ci/cd token.
+    Extends stingray_cli_core client with requests required by cli. Requests used by cli
+    are sent through shared http session with connection pool and retries.
+    Successful response with architectures is shared by clients with the same url and token for ARCHITECTURES_TTL
+    seconds, so many scans started by one process do not request the same list again
+    """
+    _architectures = {}
+    _architectures_lock = threading.Lock()
+
+    @property
+    def session(self):
+        return get_session()
+
+    def get_application(self, app_id):
+        return self.session.get(f'{self.url}/applications/{app_id}/', headers=self.headers)
+
+    def get_architectures(self):
+        key = (self.url, self.headers['Authorization'])
+        with self._architectures_lock:
+            cached = self._architectures.get(key)
+        if cached and time.monotonic() - cached[0] < ARCHITECTURES_TTL:
+            return cached[1]
+
+        response = self.session.get(f'{self.url}/architectures/', headers=self.headers)
+        if response.status_code == 200:
+            with self._architectures_lock:
+                self._architectures[key] = (time.monotonic(), response)
+        return response
+
+    def get_scan_info(self, scan_id):
+        return self.session.get(f'{self.url}/dasts/{scan_id}/', headers=self.headers)
+
+    def upload_application(self, path, architecture_type):
+        # multipart body is streamed from disk, so memory used by upload does not depend on application size
+        body = MultipartFile('file', path, fields={'architecture_type': architecture_type})
+        headers_multipart = {'Authorization': self.headers['Authorization'], 'Content-Type': body.content_type}
+        return self.session.post(f'{self.url}/organizations/{self.current_context["company"]}/applications/',
+                                 headers=headers_multipart,
+                                 data=body)
+
+    def create_auto_scan(self, profile_id, app_id, arch_id, test_case_id):
+        data = {
+            'profile_id': profile_id,
+            'application_id': app_id,
+            'architecture_id': arch_id,
+            'test_case_id': test_case_id,
+            'type': 1
+        }
+        return self.session.post(f'{self.url}/organizations/{self.current_context["company"]}/dasts/',
+                                 headers=self.headers,
+                                 data=json.dumps(data))
+
+    def start_scan(self, dast_id):
+        return self.session.post(f'{self.url}/dasts/{dast_id}/start/', headers=self.headers)
+
+    def download_report(self, dast_id, stream=False):
+        return self.session.get(f'{self.url}/dasts/{dast_id}/report/', allow_redirects=True, headers=self.headers,
+                                stream=stream)
@@ -0,0 +1,55 @@
+import io
+import sys
+import types
+import contextlib
+import unittest
+from unittest import mock
+
+from stingray_cli.distribution_systems import DISTRIBUTION_SYSTEMS
+from stingray_cli.distribution_systems.base import DistributionSystem
+from stingray_cli.run_stingray_scan import parse_args
+
+SCAN_ARGV = ['--stingray_url', 'http://localhost', '--company_id', '1', '--token', 'token',
+             '--architecture_id', '1', '--profile_id', '1']
+
+
+class Incomplete(DistributionSystem):
+    name = 'incomplete'
+
+    @classmethod
+    def from_arguments(cls, arguments, cache=None, metadata_cache=None):
+        return cls(None, None)
+
+
+class ParseArgsTest(unittest.TestCase):
+    def parse(self, name, path):
+        stderr = io.StringIO()
+        module = types.ModuleType('stingray_cli_test_plugin')
+        module.Incomplete = Incomplete
+        with mock.patch.dict(DISTRIBUTION_SYSTEMS, {name: path}), \
+                mock.patch.dict(sys.modules, {'stingray_cli_test_plugin': module}), \
+                contextlib.redirect_stderr(stderr), \
+                self.assertRaises(SystemExit) as exit_context:
+            parse_args(['--distribution_system', name, *SCAN_ARGV])
+        return exit_context.exception.code, stderr.getvalue()
+
+    def test_incomplete_plugin_is_argument_error(self):
+        code, message = self.parse('incomplete', 'stingray_cli_test_plugin:Incomplete')
+        self.assertEqual(code, 2)
+        self.assertIn('Distribution system "incomplete" can not be loaded', message)
+        self.assertIn('does not implement: download_app', message)
+
+    def test_not_importable_plugin_is_argument_error(self):
+        code, message = self.parse('missing', 'stingray_cli_missing_plugin:Missing')
+        self.assertEqual(code, 2)
+        self.assertIn('Distribution system "missing" can not be loaded', message)
+        self.assertIn('stingray_cli_missing_plugin', message)
+
+    def test_missing_class_is_argument_error(self):
+        code, message = self.parse('absent', 'stingray_cli_test_plugin:Absent')
+        self.assertEqual(code, 2)
+        self.assertIn('is not found in module stingray_cli_test_plugin', message)
+
+
+if __name__ == '__main__':
+    unittest.main()
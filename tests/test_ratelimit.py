@@ -0,0 +1,73 @@
+import time
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from stingray_cli.helpers.const import RATE_LIMIT
+from stingray_cli.helpers.http import create_session
+
+SERVER_RATE_LIMIT = 4
+JOBS = 8
+
+
+class ThrottlingHandler(BaseHTTPRequestHandler):
+    """
+    Accepts SERVER_RATE_LIMIT requests every second and answers 429 with Retry-After to others
+    """
+
+    def handle_request(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        server = self.server
+        with server.lock:
+            second = int(time.time())
+            if second != server.second:
+                server.second, server.count = second, 0
+            server.count += 1
+            throttled = server.count > SERVER_RATE_LIMIT
+            server.statuses.append(429 if throttled else 200)
+        self.send_response(429 if throttled else 200)
+        if throttled:
+            self.send_header('Retry-After', '1')
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+    do_GET = do_POST = handle_request
+
+    def log_message(self, *args):
+        pass
+
+
+class RateLimitTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), ThrottlingHandler)
+        self.server.lock = threading.Lock()
+        self.server.second, self.server.count, self.server.statuses = 0, 0, []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def job(self, session, job_id):
+        responses = [session.post(f'{self.url}/rest/organizations/1/applications/', data=b'apk'),
+                     session.post(f'{self.url}/rest/organizations/1/dasts/', json={'id': job_id})]
+        responses += [session.get(f'{self.url}/rest/dasts/{job_id}/') for _ in range(2)]
+        return [response.status_code for response in responses]
+
+    def test_concurrent_jobs_under_server_limit(self):
+        self.assertLess(SERVER_RATE_LIMIT, RATE_LIMIT)
+        session = create_session()
+        with ThreadPoolExecutor(JOBS) as executor:
+            results = list(executor.map(lambda job_id: self.job(session, job_id), range(JOBS)))
+
+        self.assertEqual(results, [[200] * 4] * JOBS)
+        # rate is decreased after the first 429 responses, so most of requests are not throttled
+        self.assertLess(self.server.statuses.count(429), self.server.statuses.count(200))
+
+
+if __name__ == '__main__':
+    unittest.main()